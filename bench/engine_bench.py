@@ -0,0 +1,272 @@
+"""
+Микробенчмарк ядра игры: команды DecryptoGame и сборка состояния игрока
+при разных размерах комнаты и длине истории, без сети и сервера.
+
+    python bench/engine_bench.py                      # сравнить с bench/engine_baseline.json
+    python bench/engine_bench.py --save-baseline bench/engine_baseline.json
+    python bench/engine_bench.py --filter get_state --profile cpu
+
+Время - лучшая из --repeat серий по --number вызовов на каждом (нс на вызов),
+память - средний пик выделений tracemalloc на вызов (отдельный проход).
+Вызовы, подорожавшие против базы больше чем на --threshold, помечаются,
+и скрипт выходит с кодом 1. База привязана к машине: снимайте ее там же,
+где потом сравниваете (тот же CI-раннер), на спокойной системе.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from game.game_state import DecryptoGame  # noqa: E402
+from game.models import Team  # noqa: E402
+from game.profiling import profiler  # noqa: E402
+from game.word_packs import DEFAULT_PACK, word_packs  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(ROOT, "bench", "engine_baseline.json")
+CLUE = ["мост", "вода", "ночь"]
+# Меньше этого разница в памяти - шум
+MEMORY_SLACK = 256
+
+
+def make_room(players: int, history: int = 0, started: bool = True) -> DecryptoGame:
+    """Комната с players игроками поровну в двух командах и history сыгранными раундами"""
+    game = DecryptoGame("BENCH", word_packs.get(DEFAULT_PACK), seed=players * 1000 + history)
+    for i in range(players):
+        game.add_player(f"p{i}", f"Игрок {i}")
+        game.join_team(f"p{i}", Team.RED if i % 2 == 0 else Team.BLUE)
+    if started:
+        game.start_game()
+        # Раунды без перехватов и ошибок: партия не кончается, история растет
+        for _ in range(history):
+            game.submit_clue(game.current_encoder_id, CLUE)
+            game.handle_round_result(game.current_encoder_id, "own_team_guessed")
+    return game
+
+
+def clone(game: DecryptoGame) -> DecryptoGame:
+    return DecryptoGame.from_snapshot(game.to_snapshot(), game.word_pack)
+
+
+class Case(NamedTuple):
+    """Замер: prepare(n) готовит n аргументов, run(arg) - измеряемый вызов"""
+    name: str
+    command: str
+    params: Dict[str, int]
+    prepare: Callable[[int], list]
+    run: Callable[[object], object]
+
+    @property
+    def key(self) -> str:
+        return self.name + "".join(f"[{k}={v}]" for k, v in self.params.items())
+
+
+def fresh(template: DecryptoGame) -> Callable[[int], list]:
+    # Меняющие команды получают по своей копии комнаты на вызов
+    return lambda n: [clone(template) for _ in range(n)]
+
+
+def build_cases(sizes: List[int], histories: List[int]) -> List[Case]:
+    cases = []
+    for players in sizes:
+        lobby = make_room(players, started=False)
+        cases.append(Case("add_player", "add_player", {"players": players}, fresh(lobby),
+                          lambda g: g.add_player("new", "Новичок")))
+
+        teams = make_room(players, started=False)
+        ids = [f"p{i}" for i in range(players)]
+        cases.append(Case("join_team", "join_team", {"players": players},
+                          lambda n, ids=ids: [(ids[i % len(ids)], Team.RED if i % 2 else Team.BLUE)
+                                              for i in range(n)],
+                          lambda arg, g=teams: g.join_team(*arg)))
+        cases.append(Case("remove_player", "remove_player", {"players": players}, fresh(lobby),
+                          lambda g: g.remove_player("p1")))
+        cases.append(Case("start_game", "start_game", {"players": players}, fresh(lobby),
+                          lambda g: g.start_game()))
+
+        for history in histories:
+            params = {"players": players, "history": history}
+            encoding = make_room(players, history)
+            cases.append(Case("submit_clue", "submit_clue", params, fresh(encoding),
+                              lambda g: g.submit_clue(g.current_encoder_id, CLUE)))
+
+            guessing = clone(encoding)
+            guessing.submit_clue(guessing.current_encoder_id, CLUE)
+            cases.append(Case("handle_round_result", "handle_round_result", params, fresh(guessing),
+                              lambda g: g.handle_round_result(g.current_encoder_id, "own_team_guessed")))
+
+            # Сборка состояния не меняет комнату: одна комната, игроки по кругу
+            cases.append(Case("get_state_for_player", "get_state_for_player", params,
+                              lambda n, ids=ids: [ids[i % len(ids)] for i in range(n)],
+                              lambda pid, g=guessing: g.get_state_for_player(pid)))
+    return cases
+
+
+def time_case(case: Case, number: int, repeat: int, profile: bool) -> List[float]:
+    """Нс на вызов в каждой серии"""
+    runs = []
+    for _ in range(repeat):
+        args = case.prepare(number)
+        run = case.run
+        gc.collect()
+        gc.disable()
+        try:
+            if profile:
+                started = time.perf_counter_ns()
+                for arg in args:
+                    profiler.call(case.command, run, arg)
+            else:
+                started = time.perf_counter_ns()
+                for arg in args:
+                    run(arg)
+            elapsed = time.perf_counter_ns() - started
+        finally:
+            gc.enable()
+        runs.append(elapsed / number)
+    return runs
+
+
+def measure_memory(case: Case, number: int) -> Dict[str, int]:
+    """Средние пик и чистый прирост памяти на вызов, байт"""
+    args = case.prepare(number)
+    run = case.run
+    peak = retained = 0
+    tracemalloc.start()
+    try:
+        for arg in args:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            result = run(arg)
+            current, top = tracemalloc.get_traced_memory()
+            peak += top - before
+            retained += current - before
+            del result
+    finally:
+        tracemalloc.stop()
+    return {"peak_bytes": peak // number, "retained_bytes": retained // number}
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+    }
+
+
+def compare(results: Dict[str, dict], baseline: dict, threshold: float, memory_threshold: float) -> List[str]:
+    """Регрессии против базы в виде строк отчета"""
+    regressions = []
+    for key, current in results.items():
+        base = baseline.get("results", {}).get(key)
+        if base is None:
+            continue
+        ratio = current["ns"] / base["ns"] if base["ns"] else 1.0
+        current["vs_baseline"] = round(ratio, 3)
+        if ratio > 1 + threshold:
+            regressions.append(f"{key}: {base['ns']:.0f} -> {current['ns']:.0f} нс (x{ratio:.2f})")
+        if "peak_bytes" in current and "peak_bytes" in base:
+            grown = current["peak_bytes"] - base["peak_bytes"]
+            if grown > MEMORY_SLACK and current["peak_bytes"] > base["peak_bytes"] * (1 + memory_threshold):
+                regressions.append(f"{key}: пик памяти {base['peak_bytes']} -> {current['peak_bytes']} байт")
+    return regressions
+
+
+def int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарк команд DecryptoGame")
+    parser.add_argument("--players", type=int_list, default=[4, 8, 16], help="размеры комнат через запятую")
+    parser.add_argument("--history", type=int_list, default=[0, 8, 64], help="длины истории через запятую")
+    parser.add_argument("--number", type=int, default=2000, help="вызовов в серии")
+    parser.add_argument("--repeat", type=int, default=5, help="серий на замер")
+    parser.add_argument("--filter", help="только замеры, в имени которых есть эта строка")
+    parser.add_argument("--no-memory", action="store_true", help="без прохода tracemalloc")
+    parser.add_argument("--profile", choices=["cpu", "memory"],
+                        help="прогнать вызовы через профайлер команд и напечатать его отчет")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="база для сравнения")
+    parser.add_argument("--save-baseline", metavar="PATH", help="записать результаты как новую базу")
+    parser.add_argument("--threshold", type=float, default=0.25, help="допустимый рост времени (доля)")
+    parser.add_argument("--memory-threshold", type=float, default=0.10, help="допустимый рост пика памяти (доля)")
+    parser.add_argument("--confirm", type=int, default=2,
+                        help="сколько раз перемерить подорожавший замер, прежде чем считать его регрессией")
+    parser.add_argument("--output", help="файл для JSON-результата")
+    args = parser.parse_args()
+
+    cases = [case for case in build_cases(args.players, args.history)
+             if not args.filter or args.filter in case.key]
+    if args.profile:
+        profiler.start(args.profile)
+
+    results: Dict[str, dict] = {}
+    width = max((len(case.key) for case in cases), default=0)
+    for case in cases:
+        runs = time_case(case, args.number, args.repeat, bool(args.profile))
+        entry = {"ns": round(min(runs), 1), "median_ns": round(statistics.median(runs), 1)}
+        if not args.no_memory and not args.profile:
+            entry.update(measure_memory(case, min(args.number, 500)))
+        results[case.key] = entry
+        memory = f"  пик {entry['peak_bytes']:>7} Б" if "peak_bytes" in entry else ""
+        print(f"{case.key:<{width}}  {entry['ns']:>10.0f} нс{memory}", file=sys.stderr)
+
+    report = {"environment": environment(), "number": args.number, "repeat": args.repeat, "results": results}
+    regressions: List[str] = []
+    baseline: Optional[dict] = None
+    if not args.save_baseline and not args.profile and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("environment") != report["environment"]:
+            print("База снята в другом окружении - сравнение ориентировочное", file=sys.stderr)
+        regressions = compare(results, baseline, args.threshold, args.memory_threshold)
+        # Разовый выброс (соседний процесс, частота CPU) не считаем: подозрительные
+        # замеры перемеряем, в зачет идет лучшее время из всех серий
+        by_key = {case.key: case for case in cases}
+        for _ in range(args.confirm):
+            suspects = {line.split(":")[0] for line in regressions}
+            if not suspects:
+                break
+            for key in suspects:
+                runs = time_case(by_key[key], args.number, args.repeat, False)
+                results[key]["ns"] = round(min(results[key]["ns"], min(runs)), 1)
+            regressions = compare(results, baseline, args.threshold, args.memory_threshold)
+        report["regressions"] = regressions
+
+    if args.profile:
+        profiler.stop()
+        for command, entry in profiler.report()["commands"].items():
+            print(f"\n== {command}: {entry['calls']} вызовов, {entry['mean_us']} мкс", file=sys.stderr)
+            print(entry.get("profile") or json.dumps(entry, ensure_ascii=False), file=sys.stderr)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    elif not args.save_baseline:
+        print(text)
+
+    if regressions:
+        print("\nРегрессии против базы:", file=sys.stderr)
+        for line in regressions:
+            print("  " + line, file=sys.stderr)
+        sys.exit(1)
+    if baseline is not None:
+        print("\nРегрессий против базы нет", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Нагрузочный тест /ws: N комнат по M игроков играют полные партии.
+
+    python bench/ws_load.py --rooms 50 --players 4 --output result.json
+
+Без --url поднимает сервер (uvicorn main:app) отдельным процессом на свободном порту;
+журнал у него выключен, архив партий пишется во временный каталог и удаляется после.
+Латентность - время от отправки команды до получения новой версии состояния
+каждым клиентом комнаты (action-to-broadcast). Нужен пакет websockets
+(он же нужен uvicorn для /ws и есть в requirements.txt).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+try:
+    import websockets
+except ImportError:
+    sys.exit("Для нагрузочного теста нужен пакет websockets: pip install websockets")
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class BotClient:
+    """Клиент-бот: держит версию и нужные для игры поля состояния"""
+
+    def __init__(self, url: str, encoding: str, nickname: str):
+        self.url = url
+        self.encoding = encoding
+        self.nickname = nickname
+        self.ws = None
+        self.player_id: Optional[str] = None
+        self.room_code: Optional[str] = None
+        self.state: dict = {}
+        self.version = -1
+        self.frames = 0
+        self.bytes = 0
+        self._changed = asyncio.Condition()
+        self._reader: Optional[asyncio.Task] = None
+
+    async def connect(self):
+        self.ws = await websockets.connect(self.url, subprotocols=[f"decrypto.{self.encoding}"], max_size=None)
+        self._reader = asyncio.create_task(self._read())
+
+    async def close(self):
+        if self._reader:
+            self._reader.cancel()
+        if self.ws:
+            await self.ws.close()
+
+    async def send(self, message: dict):
+        await self.ws.send(json.dumps(message))
+
+    async def _read(self):
+        async for raw in self.ws:
+            self.frames += 1
+            self.bytes += len(raw)
+            message = msgpack.unpackb(raw) if isinstance(raw, bytes) else json.loads(raw)
+            self._apply(message)
+            async with self._changed:
+                self._changed.notify_all()
+
+    def _apply(self, message: dict):
+        kind = message.get("type")
+        if kind == "ping":
+            asyncio.ensure_future(self.send({"type": "pong"}))
+        elif kind == "room_created":
+            self.room_code = message["room_code"]
+        elif kind == "joined":
+            self.player_id = message["player_id"]
+            self.room_code = message["room_code"]
+        elif kind == "state_update":
+            self.state = message["state"]
+            self.state.update(message.get("me") or {})
+            self.version = message["version"]
+        elif kind == "state_patch":
+            if message["base_version"] != self.version:
+                asyncio.ensure_future(self.send({"type": "resync"}))
+                return
+            self.state.update(message["patch"].get("set", {}))
+            self.state.update(message.get("me") or {})
+            self.version = message["version"]
+
+    async def wait_for(self, predicate, timeout: float = 10.0):
+        async with self._changed:
+            await asyncio.wait_for(self._changed.wait_for(predicate), timeout)
+
+
+async def play_room(url: str, encoding: str, players: int, max_rounds: int,
+                    latencies: List[float], counters: dict):
+    clients = [BotClient(url, encoding, f"bot{i}") for i in range(players)]
+    for client in clients:
+        await client.connect()
+
+    try:
+        host = clients[0]
+        await host.send({"type": "create_room"})
+        await host.wait_for(lambda: host.room_code)
+        room_code = host.room_code
+
+        for client in clients:
+            await client.send({"type": "join_room", "room_code": room_code, "nickname": client.nickname})
+            await client.wait_for(lambda c=client: c.player_id and c.version >= 0)
+
+        async def act(actor: BotClient, message: dict):
+            """Команда и ожидание, пока новая версия дойдет до всей комнаты"""
+            before = max(c.version for c in clients)
+            started = time.perf_counter()
+            await actor.send(message)
+            counters["actions"] += 1
+
+            async def arrival(c: BotClient):
+                await c.wait_for(lambda: c.version > before)
+                latencies.append(time.perf_counter() - started)
+
+            await asyncio.gather(*(arrival(c) for c in clients))
+
+        for i, client in enumerate(clients):
+            team = "red" if i % 2 == 0 else "blue"
+            await act(client, {"type": "join_team", "room_code": room_code,
+                               "player_id": client.player_id, "team": team})
+
+        await act(host, {"type": "start_game", "room_code": room_code})
+
+        rounds = 0
+        while host.state.get("phase") != "game_over" and rounds < max_rounds:
+            encoder = next(c for c in clients if c.state.get("is_encoder"))
+            await act(encoder, {"type": "submit_clue", "room_code": room_code,
+                                "player_id": encoder.player_id, "clue_words": ["a", "b", "c"]})
+            if random.random() < 0.3:
+                await act(encoder, {"type": "round_result", "room_code": room_code,
+                                    "player_id": encoder.player_id, "result": "enemy_team_guessed"})
+                if host.state.get("phase") == "game_over":
+                    break
+            result = "own_team_not_guessed" if random.random() < 0.2 else "own_team_guessed"
+            await act(encoder, {"type": "round_result", "room_code": room_code,
+                                "player_id": encoder.player_id, "result": result})
+            rounds += 1
+
+        counters["games"] += 1
+    except Exception as e:
+        counters["errors"] += 1
+        print(f"Ошибка в комнате: {e!r}", file=sys.stderr)
+    finally:
+        counters["frames"] += sum(c.frames for c in clients)
+        counters["bytes"] += sum(c.bytes for c in clients)
+        for client in clients:
+            await client.close()
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+async def run(args) -> dict:
+    latencies: List[float] = []
+    counters = {"actions": 0, "games": 0, "errors": 0, "frames": 0, "bytes": 0}
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited():
+        async with semaphore:
+            await play_room(args.url, args.encoding, args.players, args.max_rounds, latencies, counters)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(limited() for _ in range(args.rooms)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "rooms": args.rooms,
+        "players_per_room": args.players,
+        "encoding": args.encoding,
+        "elapsed_s": round(elapsed, 3),
+        "games_completed": counters["games"],
+        "errors": counters["errors"],
+        "actions": counters["actions"],
+        "actions_per_s": round(counters["actions"] / elapsed, 1),
+        "frames_received": counters["frames"],
+        "bytes_received": counters["bytes"],
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 3),
+            "p95": round(percentile(latencies, 95) * 1000, 3),
+            "p99": round(percentile(latencies, 99) * 1000, 3),
+            "mean": round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+        },
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int, archive_dir: str) -> subprocess.Popen:
+    # Рабочее дерево репозитория сервер не трогает
+    env = dict(os.environ, DECRYPTO_JOURNAL_DIR=os.environ.get("DECRYPTO_JOURNAL_DIR", ""),
+               DECRYPTO_ARCHIVE_DIR=os.environ.get("DECRYPTO_ARCHIVE_DIR", archive_dir))
+    # Боты играют быстрее людей - ограничение частоты команд мерить не нужно
+    for name in ("DECRYPTO_CONN_COMMAND_RATE", "DECRYPTO_ROOM_COMMAND_RATE"):
+        env.setdefault(name, "1000000")
+    for name in ("DECRYPTO_CONN_COMMAND_BURST", "DECRYPTO_ROOM_COMMAND_BURST"):
+        env.setdefault(name, "1000000")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    sys.exit("Сервер не запустился")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест websocket-сервера Decrypto")
+    parser.add_argument("--url", help="ws://host:port/ws уже запущенного сервера")
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--players", type=int, default=4, help="игроков в комнате (минимум 4)")
+    parser.add_argument("--concurrency", type=int, default=20, help="комнат, играющих одновременно")
+    parser.add_argument("--max-rounds", type=int, default=20)
+    parser.add_argument("--encoding", choices=["json", "msgpack"], default="json")
+    parser.add_argument("--output", help="файл для JSON-результата (по умолчанию stdout)")
+    args = parser.parse_args()
+    args.players = max(args.players, 4)
+
+    server = workdir = None
+    if not args.url:
+        port = free_port()
+        workdir = tempfile.TemporaryDirectory(prefix="decrypto-load-")
+        server = start_server(port, workdir.name)
+        args.url = f"ws://127.0.0.1:{port}/ws"
+
+    try:
+        result = asyncio.run(run(args))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+        if workdir:
+            workdir.cleanup()
+
+    data = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(data + "\n")
+    print(data)
+
+
+if __name__ == "__main__":
+    main()
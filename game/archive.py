@@ -0,0 +1,218 @@
+import asyncio
+import base64
+import binascii
+import json
+import logging
+import os
+import re
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .game_state import DecryptoGame
+
+logger = logging.getLogger(__name__)
+
+# games-w<воркер>-<начало, мс>.ndjson - сегмент пишется;
+# games-w<воркер>-<начало>-<конец>.ndjson - закрыт и больше не меняется
+SEGMENT_RE = re.compile(r"^games-w(\d+)-(\d{13})(?:-(\d{13}))?\.ndjson$")
+# Запас на медленную запись пачки сверх flush_interval, секунд
+WRITE_SLACK = 5.0
+
+
+class Segment(NamedTuple):
+    worker: int
+    start: int
+    end: Optional[int]
+    path: str
+
+
+class GameArchive:
+    """
+    Архив законченных партий: по строке JSON на партию, только дописывание.
+    Каждый воркер пишет свою цепочку сегментов и начинает новый, когда текущий
+    дорастает до segment_bytes. Запись пачками в фоне, как у журнала комнат.
+    Чтение идет страницами с курсором - позицией в цепочке каждого воркера,
+    поэтому выгрузка не держит в памяти больше страницы и продолжается
+    с места остановки, даже пока архив дописывается.
+    """
+
+    def __init__(self, directory: str, worker: int = 0, segment_bytes: int = 64 << 20,
+                 flush_interval: float = 1.0):
+        self.directory = directory
+        self.worker = worker
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        os.makedirs(directory, exist_ok=True)
+        self._pending: List[str] = []
+        self._task: Optional[asyncio.Task] = None
+        # Открытый сегмент этого воркера и его размер
+        self._current: Optional[Segment] = None
+        self._size = 0
+        self._last_start = 0
+
+    def record(self, game: DecryptoGame):
+        self._pending.append(json.dumps(game.to_archive_record(), ensure_ascii=False, separators=(",", ":")))
+
+    async def start(self):
+        # Сегменты, оставшиеся открытыми после падения этого воркера, закрываем
+        await asyncio.to_thread(self._close_stale)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        await asyncio.to_thread(self._close_segment)
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        await asyncio.to_thread(self._write_batch, batch)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Ошибка записи архива партий")
+
+    # --- сегменты ---
+
+    def segments(self) -> Dict[int, List[Segment]]:
+        """Сегменты по воркерам, каждый список - по времени начала"""
+        chains: Dict[int, List[Segment]] = {}
+        for name in os.listdir(self.directory):
+            match = SEGMENT_RE.match(name)
+            if match:
+                worker, start, end = match.groups()
+                chains.setdefault(int(worker), []).append(
+                    Segment(int(worker), int(start), int(end) if end else None, os.path.join(self.directory, name)))
+        for chain in chains.values():
+            chain.sort(key=lambda segment: segment.start)
+        return chains
+
+    def _segment_path(self, start: int, end: Optional[int] = None) -> str:
+        suffix = f"-{end:013d}" if end is not None else ""
+        return os.path.join(self.directory, f"games-w{self.worker}-{start:013d}{suffix}.ndjson")
+
+    def _write_batch(self, batch: List[str]):
+        data = ("\n".join(batch) + "\n").encode("utf-8")
+        if self._current is None:
+            # Новый сегмент; начало строго растет, даже если прошлый открыт в ту же мс
+            start = max(int(time.time() * 1000), self._last_start + 1)
+            self._last_start = start
+            self._current = Segment(self.worker, start, None, self._segment_path(start))
+            self._size = 0
+        # Пачка пишется одним вызовом: читатель видит только целые строки или обрывок
+        # в самом конце, который он пропускает до следующей страницы
+        with open(self._current.path, "ab") as f:
+            f.write(data)
+        self._size += len(data)
+        if self._size >= self.segment_bytes:
+            self._close_segment()
+
+    def _close_segment(self):
+        if self._current is None:
+            return
+        end = max(int(time.time() * 1000), self._current.start)
+        os.replace(self._current.path, self._segment_path(self._current.start, end))
+        self._current = None
+
+    def _close_stale(self):
+        for segment in self.segments().get(self.worker, []):
+            if segment.end is None:
+                end = max(int(os.path.getmtime(segment.path) * 1000), segment.start)
+                os.replace(segment.path, self._segment_path(segment.start, end))
+            self._last_start = max(self._last_start, segment.start)
+
+    # --- чтение ---
+
+    def read(self, cursor: Dict[int, Tuple[int, int]], since: Optional[float] = None,
+             until: Optional[float] = None, pack: Optional[str] = None, limit: int = 1000,
+             scan_bytes: int = 1 << 20) -> Tuple[List[bytes], Dict[int, Tuple[int, int]], bool]:
+        """
+        Следующая страница: до limit подходящих строк, не больше scan_bytes
+        просмотренных байт за вызов. cursor - {воркер: (начало сегмента, смещение)}.
+        Возвращает строки, новый курсор и признак, что архив прочитан до конца.
+        since/until - границы finished_at в секундах, pack - набор слов.
+        """
+        cursor = dict(cursor)
+        lines: List[bytes] = []
+        scanned = 0
+        since_ms = since * 1000 if since is not None else None
+        # Партия попадает в сегмент до flush_interval (и записи) позже конца: сегмент,
+        # открытый чуть позже until, еще может хранить подходящие строки
+        cutoff_ms = (until + self.flush_interval + WRITE_SLACK) * 1000 if until is not None else None
+        for worker, chain in sorted(self.segments().items()):
+            position_start, offset = cursor.get(worker, (0, 0))
+            for segment in chain:
+                if segment.start < position_start:
+                    continue
+                if segment.start > position_start:
+                    offset = 0
+                # Сегменты цепочки идут по времени: дальше партии только позже until
+                # (сами строки сверяются с until по finished_at в _matches)
+                if cutoff_ms is not None and segment.start > cutoff_ms:
+                    break
+                if since_ms is not None and segment.end is not None and segment.end < since_ms:
+                    cursor[worker] = (segment.start, os.path.getsize(segment.path))
+                    continue
+                try:
+                    f = open(segment.path, "rb")
+                except FileNotFoundError:
+                    # Сегмент закрыли и переименовали между listdir и open - дочитаем в следующий раз
+                    return lines, cursor, False
+                with f:
+                    f.seek(offset)
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            break
+                        offset += len(line)
+                        scanned += len(line)
+                        if self._matches(line, since, until, pack):
+                            lines.append(line)
+                        if len(lines) >= limit or scanned >= scan_bytes:
+                            cursor[worker] = (segment.start, offset)
+                            return lines, cursor, False
+                cursor[worker] = (segment.start, offset)
+        return lines, cursor, True
+
+    @staticmethod
+    def _matches(line: bytes, since: Optional[float], until: Optional[float], pack: Optional[str]) -> bool:
+        if since is None and until is None and pack is None:
+            return True
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return False
+        finished_at = record.get("finished_at") or 0
+        if since is not None and finished_at < since:
+            return False
+        if until is not None and finished_at > until:
+            return False
+        return pack is None or record.get("word_pack") == pack
+
+
+def encode_cursor(cursor: Dict[int, Tuple[int, int]]) -> str:
+    raw = ",".join(f"{worker}.{start}.{offset}" for worker, (start, offset) in sorted(cursor.items()))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Dict[int, Tuple[int, int]]:
+    """ValueError, если курсор поврежден"""
+    if not token:
+        return {}
+    try:
+        raw = base64.b64decode(token + "=" * (-len(token) % 4), altchars=b"-_", validate=True).decode()
+        cursor = {}
+        for part in filter(None, raw.split(",")):
+            worker, start, offset = (int(value) for value in part.split("."))
+            if min(worker, start, offset) < 0:
+                raise ValueError(token)
+            cursor[worker] = (start, offset)
+        return cursor
+    except (ValueError, binascii.Error) as e:
+        raise ValueError(f"Некорректный курсор: {token}") from e
@@ -1,150 +1,417 @@
+import hmac
+import logging
 import random
-from typing import List, Dict, Optional
+import time
+from collections import deque
+from typing import List, Dict, Optional, Tuple
 from .models import (
     GameState, Player, Team, Clue,
     GamePhase, SecretWords
 )
+from .word_packs import WordPack
+from .profiling import profiler
 from itertools import permutations
 
+logger = logging.getLogger(__name__)
+
+# Все коды из трех разных цифр; в состоянии хранится только индекс кода
+ALL_CODES: Tuple[Tuple[int, ...], ...] = tuple(permutations([1, 2, 3, 4], 3))
+MESSAGE_LOG_LIMIT = 50
+# Сколько последних раундов истории идет в состоянии; более ранние клиент догружает страницами
+HISTORY_RECENT = 8
+TEAM_NAMES = {Team.RED: "Красные", Team.BLUE: "Синие"}
+
+
+class PlayerSlot:
+    """Игрок внутри комнаты; Player (pydantic) строится только при сериализации"""
+
+    __slots__ = ('id', 'nickname', 'team', 'is_connected', 'is_encoder')
+
+    def __init__(self, player_id: str, nickname: str, team: Team = Team.SPECTATOR,
+                 is_connected: bool = True, is_encoder: bool = False):
+        self.id = player_id
+        self.nickname = nickname
+        self.team = team
+        self.is_connected = is_connected
+        self.is_encoder = is_encoder
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'nickname': self.nickname,
+            'team': self.team.value,
+            'is_connected': self.is_connected,
+            'is_encoder': self.is_encoder,
+        }
+
 
 class DecryptoGame:
-    def __init__(self, room_code: str, word_bank: List[str]):
+    # Команды, которые меняют состояние и пишутся в журнал комнаты
+    COMMANDS = ('add_player', 'remove_player', 'join_team', 'start_game',
+                'submit_clue', 'handle_round_result',
+                'disconnect_player', 'reconnect_player', 'expire_player')
+
+    all_possible_codes = ALL_CODES
+
+    # Правила победы; симуляция проверяет варианты, меняя их у отдельных игр
+    INTERCEPTS_TO_WIN = 2
+    MISTAKES_TO_LOSE = 2
+
+    def __init__(self, room_code: str, word_pack: WordPack, seed: Optional[int] = None,
+                 log_messages: bool = True):
         self.room_code = room_code
-        self.word_bank = word_bank
-        self.state = GameState(room_code=room_code)
-        self.all_possible_codes = [list(p) for p in permutations([1, 2, 3, 4], 3)]
+        # Без лога сообщения не форматируются вовсе (симуляция, без клиентов)
+        self.log_messages = log_messages
+        # Общий набор слов - у комнаты только ссылка на него
+        self.word_pack = word_pack
+        # Свой генератор: по зерну и журналу команд игра воспроизводится один в один
+        self.rng = random.Random(seed)
         self.intercept_given_in_current_round = False
 
-        # НОВОЕ: хранилище истории раундов для отображения подсказок
-        self.rounds_history = []  # список завершенных раундов
+        # Рабочее состояние комнаты. Составы команд - словари как упорядоченные
+        # множества: проверка и удаление за O(1), порядок входа сохраняется
+        self.phase = GamePhase.WAITING
+        self.players: Dict[str, PlayerSlot] = {}
+        self.teams: Dict[Team, Dict[str, None]] = {team: {} for team in Team}
+        self.secret_words: Optional[Tuple[Tuple[str, ...], Tuple[str, ...]]] = None
+
+        # Счет
+        self.red_intercepts = 0
+        self.blue_intercepts = 0
+        self.red_mistakes = 0
+        self.blue_mistakes = 0
+        # Итог партии: команда-победитель и причина ('intercepts' или 'mistakes')
+        self.winner: Optional[Team] = None
+        self.win_reason: Optional[str] = None
+
+        # Текущий раунд
+        self.current_round = 0
+        self.red_round = 0
+        self.blue_round = 0
+        self.current_encoder_id: Optional[str] = None
+        self.current_encoder_team: Optional[Team] = None
+        self.current_code_index: Optional[int] = None
+        self.current_clue_words: Optional[Tuple[str, ...]] = None
+
+        self.message_log = deque(maxlen=MESSAGE_LOG_LIMIT)
+
+        # Версия состояния: растет при каждом изменении, по ней клиенты применяют патчи
+        self.version = 0
+        # Сколько всего сообщений было в логе (сам лог хранит только последние 50)
+        self.message_seq = 0
+        # Время последнего изменения - по нему сборщик находит брошенные комнаты
+        self.updated_at = time.time()
+
+        # Секреты токенов переподключения по id игрока
+        self.session_secrets: Dict[str, str] = {}
+
+        # История подсказок по командам: на каждый завершенный раунд команды -
+        # кортеж из 4 слов, по слову на цифру кода (None - цифры не было в коде)
+        self.history: Dict[Team, List[Tuple[Optional[str], ...]]] = {Team.RED: [], Team.BLUE: []}
+        # Шифровальщик каждого раунда партии по порядку (None - в команде никого не было)
+        self.encoders: List[Optional[str]] = []
+        self.started_at: Optional[float] = None
+
+        # Комната открыта: видна в общем каталоге комнат
+        self.public = False
+
+    @property
+    def current_code(self) -> Optional[List[int]]:
+        if self.current_code_index is None:
+            return None
+        return list(ALL_CODES[self.current_code_index])
+
+    def _round_for(self, team: Optional[Team]) -> int:
+        return self.red_round if team == Team.RED else self.blue_round
+
+    @property
+    def history_seq(self) -> int:
+        """Сколько раундов записано в историю этой партии"""
+        return len(self.history[Team.RED]) + len(self.history[Team.BLUE])
+
+    def history_rows(self, start: int = 0, stop: Optional[int] = None) -> list:
+        """
+        Раунды истории start..stop-1 в порядке игры: [команда, номер раунда команды, 4 слова].
+        Раунды идут строго по очереди красные-синие, и каждый, кроме победного
+        перехвата, попадает в историю - поэтому n-й раунд находится без индекса.
+        """
+        seq = self.history_seq
+        stop = seq if stop is None else min(stop, seq)
+        rows = []
+        for index in range(max(start, 0), stop):
+            team = Team.RED if index % 2 == 0 else Team.BLUE
+            rows.append([team.value, index // 2 + 1, *self.history[team][index // 2]])
+        return rows
+
+    def _record_round(self):
+        if self.current_clue_words is None:
+            return
+        words: List[Optional[str]] = [None] * 4
+        for digit, word in zip(ALL_CODES[self.current_code_index], self.current_clue_words):
+            words[digit - 1] = word
+        self.history[self.current_encoder_team].append(tuple(words))
+
+    def to_model(self) -> GameState:
+        """Полное состояние в виде pydantic-модели (для хранилища и экспорта)"""
+        clue = None
+        if self.current_clue_words is not None:
+            encoder = self.players.get(self.current_encoder_id)
+            clue = Clue(
+                encoder_id=self.current_encoder_id,
+                encoder_nickname=encoder.nickname if encoder else "",
+                words=list(self.current_clue_words),
+                target_code=self.current_code,
+                round_number=self.current_round
+            )
+        return GameState(
+            room_code=self.room_code,
+            phase=self.phase,
+            players={pid: Player(**p.to_dict()) for pid, p in self.players.items()},
+            red_team_ids=list(self.teams[Team.RED]),
+            blue_team_ids=list(self.teams[Team.BLUE]),
+            spectators_ids=list(self.teams[Team.SPECTATOR]),
+            secret_words=SecretWords(team_red=list(self.secret_words[0]),
+                                     team_blue=list(self.secret_words[1])) if self.secret_words else None,
+            red_intercepts=self.red_intercepts,
+            blue_intercepts=self.blue_intercepts,
+            red_mistakes=self.red_mistakes,
+            blue_mistakes=self.blue_mistakes,
+            current_round=self.current_round,
+            current_encoder_id=self.current_encoder_id,
+            current_encoder_team=self.current_encoder_team,
+            current_code=self.current_code,
+            current_clue=clue,
+            message_log=list(self.message_log),
+            red_round=self.red_round,
+            blue_round=self.blue_round,
+        )
 
-    def add_player(self, player_id: str, nickname: str) -> Player:
-        player = Player(id=player_id, nickname=nickname)
-        self.state.players[player_id] = player
-        self.state.spectators_ids.append(player_id)
-        self._add_message(f"✨ {nickname} присоединился к игре")
+    def _load_model(self, state: GameState):
+        self.phase = GamePhase(state.phase)
+        self.players = {pid: PlayerSlot(p.id, p.nickname, Team(p.team), p.is_connected, p.is_encoder)
+                        for pid, p in state.players.items()}
+        self.teams = {
+            Team.RED: dict.fromkeys(state.red_team_ids),
+            Team.BLUE: dict.fromkeys(state.blue_team_ids),
+            Team.SPECTATOR: dict.fromkeys(state.spectators_ids),
+        }
+        if state.secret_words:
+            self.secret_words = (tuple(state.secret_words.team_red), tuple(state.secret_words.team_blue))
+        self.red_intercepts = state.red_intercepts
+        self.blue_intercepts = state.blue_intercepts
+        self.red_mistakes = state.red_mistakes
+        self.blue_mistakes = state.blue_mistakes
+        self.current_round = state.current_round
+        self.red_round = state.red_round
+        self.blue_round = state.blue_round
+        self.current_encoder_id = state.current_encoder_id
+        self.current_encoder_team = Team(state.current_encoder_team) if state.current_encoder_team else None
+        self.current_code_index = ALL_CODES.index(tuple(state.current_code)) if state.current_code else None
+        self.current_clue_words = tuple(state.current_clue.words) if state.current_clue else None
+        self.message_log.extend(state.message_log)
+
+    def to_snapshot(self) -> dict:
+        """
+        Полное состояние комнаты для хранилища (набор слов - только по имени).
+        Журнал сериализует снимок позже, в фоне, поэтому изменяемые поля копируются.
+        """
+        return {
+            'room_code': self.room_code,
+            'word_pack': self.word_pack.name,
+            'state': self.to_model().model_dump(mode='json'),
+            'history': {team.value: [list(words) for words in rounds] for team, rounds in self.history.items()},
+            'intercept_given_in_current_round': self.intercept_given_in_current_round,
+            'version': self.version,
+            'message_seq': self.message_seq,
+            'rng_state': self.rng.getstate(),
+            'updated_at': self.updated_at,
+            'session_secrets': dict(self.session_secrets),
+            'winner': self.winner.value if self.winner else None,
+            'win_reason': self.win_reason,
+            'encoders': list(self.encoders),
+            'started_at': self.started_at,
+            'public': self.public,
+        }
+
+    @classmethod
+    def from_snapshot(cls, data: dict, word_pack: WordPack) -> "DecryptoGame":
+        game = cls(data['room_code'], word_pack)
+        game._load_model(GameState.model_validate(data['state']))
+        if 'history' in data:
+            game.history = {Team(team): [tuple(words) for words in rounds]
+                            for team, rounds in data['history'].items()}
+        else:
+            # Снимки старого формата: список раундов-словарей
+            for round_data in data.get('rounds_history', []):
+                words = [None] * 4
+                for digit, word in zip(round_data['code'], round_data['clues']):
+                    words[digit - 1] = word
+                game.history[Team(round_data['team'])].append(tuple(words))
+        game.intercept_given_in_current_round = data['intercept_given_in_current_round']
+        game.version = data['version']
+        game.message_seq = data['message_seq']
+        game.updated_at = data.get('updated_at', game.updated_at)
+        game.session_secrets = data.get('session_secrets', {})
+        game.winner = Team(data['winner']) if data.get('winner') else None
+        game.win_reason = data.get('win_reason')
+        game.encoders = data.get('encoders', [])
+        game.started_at = data.get('started_at')
+        game.public = data.get('public', False)
+        version, internal, gauss = data['rng_state']
+        game.rng.setstate((version, tuple(internal), gauss))
+        return game
+
+    def apply_command(self, command: str, args: list):
+        """Применяет команду из журнала (или от обработчика) по имени"""
+        if command not in self.COMMANDS:
+            raise ValueError(f"Неизвестная команда: {command}")
+        if profiler.active and profiler.wants(command):
+            return profiler.call(command, getattr(self, command), *args)
+        return getattr(self, command)(*args)
+
+    def add_player(self, player_id: str, nickname: str, secret: Optional[str] = None,
+                   capacity: Optional[int] = None) -> Optional[PlayerSlot]:
+        """None - в комнате уже capacity игроков"""
+        if capacity is not None and len(self.players) >= capacity:
+            return None
+        player = PlayerSlot(player_id, nickname)
+        self.players[player_id] = player
+        if secret:
+            self.session_secrets[player_id] = secret
+        self.teams[Team.SPECTATOR][player_id] = None
+        self._add_message("✨ {nickname} присоединился к игре", nickname=nickname)
+        self._touch()
         return player
 
-    def remove_player(self, player_id: str):
-        if player_id in self.state.players:
-            player = self.state.players[player_id]
-            self._add_message(f"👋 {player.nickname} покинул игру")
-
-            if player_id in self.state.red_team_ids:
-                self.state.red_team_ids.remove(player_id)
-            if player_id in self.state.blue_team_ids:
-                self.state.blue_team_ids.remove(player_id)
-            if player_id in self.state.spectators_ids:
-                self.state.spectators_ids.remove(player_id)
+    def remove_player(self, player_id: str) -> bool:
+        player = self.players.pop(player_id, None)
+        if player is None:
+            return False
 
-            del self.state.players[player_id]
+        self._add_message("👋 {nickname} покинул игру", nickname=player.nickname)
+        self.teams[player.team].pop(player_id, None)
+        self.session_secrets.pop(player_id, None)
+        self._touch()
+        return True
 
-    def join_team(self, player_id: str, team: Team) -> bool:
-        if player_id not in self.state.players:
+    def disconnect_player(self, player_id: str) -> bool:
+        """Соединение оборвалось: игрок остается в комнате до конца льготного периода"""
+        player = self.players.get(player_id)
+        if player is None or not player.is_connected:
             return False
+        player.is_connected = False
+        self._touch()
+        return True
+
+    def reconnect_player(self, player_id: str, secret: str) -> Optional[PlayerSlot]:
+        """Возвращает игрока на его место по секрету из токена"""
+        player = self.players.get(player_id)
+        expected = self.session_secrets.get(player_id)
+        if player is None or expected is None or not hmac.compare_digest(expected, secret):
+            return None
+        if not player.is_connected:
+            player.is_connected = True
+            self._touch()
+        return player
 
-        player = self.state.players[player_id]
+    def expire_player(self, player_id: str) -> bool:
+        """Льготный период истек: убираем игрока, если он так и не вернулся"""
+        player = self.players.get(player_id)
+        if player is None or player.is_connected:
+            return False
+        return self.remove_player(player_id)
 
-        if player_id in self.state.red_team_ids:
-            self.state.red_team_ids.remove(player_id)
-        if player_id in self.state.blue_team_ids:
-            self.state.blue_team_ids.remove(player_id)
-        if player_id in self.state.spectators_ids:
-            self.state.spectators_ids.remove(player_id)
+    def join_team(self, player_id: str, team: Team) -> bool:
+        player = self.players.get(player_id)
+        if player is None:
+            return False
 
-        if team == Team.RED:
-            self.state.red_team_ids.append(player_id)
-        elif team == Team.BLUE:
-            self.state.blue_team_ids.append(player_id)
-        else:
-            self.state.spectators_ids.append(player_id)
+        team = Team(team)
 
+        self.teams[player.team].pop(player_id, None)
+        self.teams[team][player_id] = None
         player.team = team
-        self._add_message(f"🔄 {player.nickname} перешел в команду {team.value}")
+
+        self._add_message("🔄 {nickname} перешел в команду {team}", nickname=player.nickname, team=team.value)
+        self._touch()
         return True
 
     def start_game(self, unique_codes: bool = True) -> bool:
-        if len(self.state.red_team_ids) < 2 or len(self.state.blue_team_ids) < 2:
+        if len(self.teams[Team.RED]) < 2 or len(self.teams[Team.BLUE]) < 2:
             self._add_message("❌ Нужно минимум по 2 игрока в каждой команде")
+            self._touch()
             return False
 
-        random.shuffle(self.word_bank)
-        red_words = self.word_bank[:4]
-        blue_words = self.word_bank[4:8]
-
-        self.state.secret_words = SecretWords(
-            team_red=red_words,
-            team_blue=blue_words
-        )
-
-        self.state.red_round = 0
-        self.state.blue_round = 0
-        self.state.current_round = 0
-        self.state.red_intercepts = 0
-        self.state.blue_intercepts = 0
-        self.state.red_mistakes = 0
-        self.state.blue_mistakes = 0
-
-        self.rounds_history = []  # очищаем историю при старте новой игры
-
-        self.state.phase = GamePhase.ENCODING
+        # Слова прошлой партии в этой комнате не повторяем
+        previous = set(self.secret_words[0] + self.secret_words[1]) if self.secret_words else ()
+        words = self.word_pack.deal(self.rng, 8, previous)
+        self.secret_words = (tuple(words[:4]), tuple(words[4:8]))
+
+        self.red_round = 0
+        self.blue_round = 0
+        self.current_round = 0
+        self.red_intercepts = 0
+        self.blue_intercepts = 0
+        self.red_mistakes = 0
+        self.blue_mistakes = 0
+        self.winner = None
+        self.win_reason = None
+
+        self.history = {Team.RED: [], Team.BLUE: []}
+        self.encoders = []
+        self.started_at = time.time()
+
+        self.phase = GamePhase.ENCODING
         self._next_round()
         self._add_message("🎮 Игра началась! Слова розданы")
+        self._touch()
         return True
 
     def _next_round(self):
-        self.state.current_round += 1
+        self.current_round += 1
         self.intercept_given_in_current_round = False
 
-        if self.state.current_round % 2 == 1:
-            self.state.current_encoder_team = Team.RED
-            self.state.red_round += 1
-            team_ids = self.state.red_team_ids
-            team_round = self.state.red_round
-            team_name = "Красные"
+        if self.current_round % 2 == 1:
+            self.current_encoder_team = Team.RED
+            self.red_round += 1
+            team_round = self.red_round
         else:
-            self.state.current_encoder_team = Team.BLUE
-            self.state.blue_round += 1
-            team_ids = self.state.blue_team_ids
-            team_round = self.state.blue_round
-            team_name = "Синие"
+            self.current_encoder_team = Team.BLUE
+            self.blue_round += 1
+            team_round = self.blue_round
 
+        team_ids = self.teams[self.current_encoder_team]
         if not team_ids:
+            self.encoders.append(None)
             return
 
         idx = (team_round - 1) % len(team_ids)
-        self.state.current_encoder_id = team_ids[idx]
+        self.current_encoder_id = list(team_ids)[idx]
+        self.encoders.append(self.current_encoder_id)
 
-        for pid in self.state.players:
-            self.state.players[pid].is_encoder = False
-        self.state.players[self.state.current_encoder_id].is_encoder = True
+        for player in self.players.values():
+            player.is_encoder = False
+        encoder = self.players[self.current_encoder_id]
+        encoder.is_encoder = True
 
-        self.state.current_code = random.choice(self.all_possible_codes)
+        self.current_code_index = self.rng.randrange(len(ALL_CODES))
 
-        encoder = self.state.players[self.state.current_encoder_id]
-        self._add_message(f"▶️ Раунд {team_round} ({team_name}). Шифрует {encoder.nickname}")
+        self._add_message("▶️ Раунд {round} ({team}). Шифрует {nickname}", round=team_round,
+                          team=TEAM_NAMES[self.current_encoder_team], nickname=encoder.nickname)
 
     def submit_clue(self, player_id: str, clue_words: List[str]) -> bool:
-        if (player_id != self.state.current_encoder_id or
+        if (player_id != self.current_encoder_id or
                 len(clue_words) != 3 or
-                self.state.phase != GamePhase.ENCODING):
+                self.phase != GamePhase.ENCODING):
             return False
 
-        encoder = self.state.players[player_id]
-
-        self.state.current_clue = Clue(
-            encoder_id=player_id,
-            encoder_nickname=encoder.nickname,
-            words=clue_words,
-            target_code=self.state.current_code,
-            round_number=self.state.current_round
-        )
-
-        self.state.phase = GamePhase.GUESSING
+        self.current_clue_words = tuple(clue_words)
+        self.phase = GamePhase.GUESSING
 
-        team_name = "Красные" if self.state.current_encoder_team == Team.RED else "Синие"
-        round_num = self.state.red_round if self.state.current_encoder_team == Team.RED else self.state.blue_round
-        self._add_message(f"💭 {team_name} дали подсказки (Раунд {round_num})")
+        self._add_message("💭 {team} дали подсказки (Раунд {round})",
+                          team=TEAM_NAMES[self.current_encoder_team],
+                          round=self._round_for(self.current_encoder_team))
+        self._touch()
 
         return True
 
@@ -156,135 +423,203 @@ class DecryptoGame:
         - 'own_team_not_guessed' - своя команда не угадала (завершает раунд + штраф)
         - 'enemy_team_guessed' - противники угадали (ТОЛЬКО перехват, раунд не завершается)
         """
-        print(f"handle_round_result: encoder_id={encoder_id}, result={result}")
-
-        if encoder_id != self.state.current_encoder_id:
-            print("Ошибка: не тот шифровальщик")
+        if encoder_id != self.current_encoder_id:
+            logger.debug("Результат раунда не от шифровальщика", extra={"room": self.room_code})
             return False
 
-        if self.state.phase != GamePhase.GUESSING:
-            print(f"Ошибка: не та фаза {self.state.phase}")
+        if self.phase != GamePhase.GUESSING:
+            logger.debug("Результат раунда не в фазе угадывания", extra={"room": self.room_code})
             return False
 
-        team_name = "Красные" if self.state.current_encoder_team == Team.RED else "Синие"
-        enemy_team = "Синие" if self.state.current_encoder_team == Team.RED else "Красные"
+        team_name = TEAM_NAMES[self.current_encoder_team]
 
         # Проверка на первый раунд (нельзя перехватить в первом раунде команды)
         is_first_round = False
-        if self.state.current_encoder_team == Team.RED and self.state.red_round == 1:
+        if self.current_encoder_team == Team.RED and self.red_round == 1:
             is_first_round = True
-        if self.state.current_encoder_team == Team.BLUE and self.state.blue_round == 1:
+        if self.current_encoder_team == Team.BLUE and self.blue_round == 1:
             is_first_round = True
 
         if result == 'enemy_team_guessed':
             # Противники угадали - даем перехват, но раунд НЕ завершаем
             if is_first_round:
-                self._add_message(f"⚠️ В первом раунде {team_name.lower()} перехват невозможен!")
+                self._add_message("⚠️ В первом раунде {team} перехват невозможен!", team=team_name.lower())
+                self._touch()
                 return True
 
             if not self.intercept_given_in_current_round:
                 self.intercept_given_in_current_round = True
 
-                if self.state.current_encoder_team == Team.RED:
-                    self.state.blue_intercepts += 1
-                    self._add_message(f"🎯 СИНИЕ перехватили код у красных!")
+                if self.current_encoder_team == Team.RED:
+                    self.blue_intercepts += 1
+                    self._add_message("🎯 СИНИЕ перехватили код у красных!")
                 else:
-                    self.state.red_intercepts += 1
-                    self._add_message(f"🎯 КРАСНЫЕ перехватили код у синих!")
+                    self.red_intercepts += 1
+                    self._add_message("🎯 КРАСНЫЕ перехватили код у синих!")
 
-                winner = self._check_winner()
-                if winner:
-                    self.state.phase = GamePhase.GAME_OVER
-                    self._add_message(f"🏆 {winner} ПОБЕДИЛИ!")
+                self._check_winner()
             else:
-                self._add_message(f"⚠️ В этом раунде уже был перехват!")
+                self._add_message("⚠️ В этом раунде уже был перехват!")
 
+            self._touch()
             return True
 
         elif result == 'own_team_not_guessed':
-            # НОВОЕ: сохраняем раунд в историю перед завершением
-            if self.state.current_clue:
-                round_data = {
-                    'team': self.state.current_encoder_team.value,
-                    'round_num': self.state.red_round if self.state.current_encoder_team == Team.RED else self.state.blue_round,
-                    'code': self.state.current_code,
-                    'clues': self.state.current_clue.words,
-                    'completed': True,
-                    'intercept_given': self.intercept_given_in_current_round,
-                    'mistake': True
-                }
-                self.rounds_history.append(round_data)
-
-            if self.state.current_encoder_team == Team.RED:
-                self.state.red_mistakes += 1
-                self._add_message(f"❌ Красные не угадали свой код! Штраф. Раунд завершен.")
+            self._record_round()
+
+            if self.current_encoder_team == Team.RED:
+                self.red_mistakes += 1
+                self._add_message("❌ Красные не угадали свой код! Штраф. Раунд завершен.")
             else:
-                self.state.blue_mistakes += 1
-                self._add_message(f"❌ Синие не угадали свой код! Штраф. Раунд завершен.")
+                self.blue_mistakes += 1
+                self._add_message("❌ Синие не угадали свой код! Штраф. Раунд завершен.")
 
             self._end_current_round()
 
         elif result == 'own_team_guessed':
-            # НОВОЕ: сохраняем раунд в историю перед завершением
-            if self.state.current_clue:
-                round_data = {
-                    'team': self.state.current_encoder_team.value,
-                    'round_num': self.state.red_round if self.state.current_encoder_team == Team.RED else self.state.blue_round,
-                    'code': self.state.current_code,
-                    'clues': self.state.current_clue.words,
-                    'completed': True,
-                    'intercept_given': self.intercept_given_in_current_round,
-                    'mistake': False
-                }
-                self.rounds_history.append(round_data)
-
-            self._add_message(f"✅ {team_name} угадали свой код! Раунд завершен.")
+            self._record_round()
+            self._add_message("✅ {team} угадали свой код! Раунд завершен.", team=team_name)
             self._end_current_round()
 
-        winner = self._check_winner()
-        if winner:
-            self.state.phase = GamePhase.GAME_OVER
-            self._add_message(f"🏆 {winner} ПОБЕДИЛИ!")
-
+        self._check_winner()
+        self._touch()
         return True
 
     def _end_current_round(self):
-        print("Завершение раунда и переход к следующему")
-
-        self.state.current_clue = None
-        self.state.phase = GamePhase.ENCODING
-        self.state.current_encoder_id = None
-        self.state.current_code = None
+        self.current_clue_words = None
+        self.phase = GamePhase.ENCODING
+        self.current_encoder_id = None
+        self.current_code_index = None
 
         self._next_round()
 
-    def _check_winner(self) -> Optional[str]:
-        if self.state.red_intercepts >= 2:
-            return "КРАСНЫЕ"
-        if self.state.blue_intercepts >= 2:
-            return "СИНИЕ"
-        if self.state.red_mistakes >= 2:
-            return "СИНИЕ"
-        if self.state.blue_mistakes >= 2:
-            return "КРАСНЫЕ"
-        return None
-
-    def _add_message(self, message: str):
-        self.state.message_log.append(message)
-        if len(self.state.message_log) > 50:
-            self.state.message_log.pop(0)
+    def _check_winner(self) -> Optional[Team]:
+        """Определяет победителя; при победе завершает партию и запоминает причину"""
+        if self.red_intercepts >= self.INTERCEPTS_TO_WIN:
+            winner, reason = Team.RED, 'intercepts'
+        elif self.blue_intercepts >= self.INTERCEPTS_TO_WIN:
+            winner, reason = Team.BLUE, 'intercepts'
+        elif self.red_mistakes >= self.MISTAKES_TO_LOSE:
+            winner, reason = Team.BLUE, 'mistakes'
+        elif self.blue_mistakes >= self.MISTAKES_TO_LOSE:
+            winner, reason = Team.RED, 'mistakes'
+        else:
+            return None
+        self.winner = winner
+        self.win_reason = reason
+        self.phase = GamePhase.GAME_OVER
+        self._add_message("🏆 {team} ПОБЕДИЛИ!", team=TEAM_NAMES[winner].upper())
+        return winner
+
+    def _touch(self):
+        self.version += 1
+        self.updated_at = time.time()
+
+    def _add_message(self, template: str, **values):
+        """Строка сообщения собирается из шаблона, только если лог ведется"""
+        if not self.log_messages:
+            return
+        self.message_seq += 1
+        self.message_log.append(template.format(**values) if values else template)
+
+    def to_archive_record(self) -> dict:
+        """Итог законченной партии для архива: счет, слова, шифровальщики и вся история"""
+        # Сыгранные раунды: завершенные плюс прерванный перехватом. После проигрыша
+        # по ошибкам следующий раунд уже начат - его не считаем
+        played = self.history_seq + (self.current_clue_words is not None)
+        return {
+            'room_code': self.room_code,
+            'word_pack': self.word_pack.name,
+            'started_at': self.started_at,
+            'finished_at': self.updated_at,
+            'winner': self.winner.value if self.winner else None,
+            'win_reason': self.win_reason,
+            'rounds': played,
+            'red_intercepts': self.red_intercepts,
+            'blue_intercepts': self.blue_intercepts,
+            'red_mistakes': self.red_mistakes,
+            'blue_mistakes': self.blue_mistakes,
+            'secret_words': {
+                'red': list(self.secret_words[0]) if self.secret_words else [],
+                'blue': list(self.secret_words[1]) if self.secret_words else [],
+            },
+            'players': {pid: [player.nickname, player.team.value] for pid, player in self.players.items()},
+            'encoders': self.encoders[:played],
+            'history': self.history_rows(),
+        }
+
+    def get_audience(self, player_id: str) -> Team:
+        """Аудитория игрока: его команда, иначе наблюдатели"""
+        player = self.players.get(player_id)
+        if player and player.team != Team.SPECTATOR:
+            return player.team
+        return Team.SPECTATOR
+
+    def get_audience_state(self, audience: Team) -> dict:
+        """
+        Состояние, общее для всей аудитории (красные, синие или наблюдатели).
+        Чужие секретные слова и текущий код в него не попадают.
+        Собирается напрямую из рабочего состояния, без pydantic.
+        """
+        secret_words = None
+        if self.secret_words:
+            secret_words = {
+                'team_red': list(self.secret_words[0]) if audience == Team.RED else [],
+                'team_blue': list(self.secret_words[1]) if audience == Team.BLUE else [],
+            }
+
+        current_clue = None
+        if self.current_clue_words is not None:
+            encoder = self.players.get(self.current_encoder_id)
+            current_clue = {
+                'encoder_id': self.current_encoder_id,
+                'encoder_nickname': encoder.nickname if encoder else "",
+                'words': list(self.current_clue_words),
+                'round_number': self.current_round,
+            }
+
+        history_seq = self.history_seq
+        return {
+            'room_code': self.room_code,
+            'phase': self.phase.value,
+            'players': {pid: player.to_dict() for pid, player in self.players.items()},
+            'red_team_ids': list(self.teams[Team.RED]),
+            'blue_team_ids': list(self.teams[Team.BLUE]),
+            'spectators_ids': list(self.teams[Team.SPECTATOR]),
+            'secret_words': secret_words,
+            'red_intercepts': self.red_intercepts,
+            'blue_intercepts': self.blue_intercepts,
+            'red_mistakes': self.red_mistakes,
+            'blue_mistakes': self.blue_mistakes,
+            'current_round': self.current_round,
+            'current_encoder_id': self.current_encoder_id,
+            'current_encoder_team': self.current_encoder_team.value if self.current_encoder_team else None,
+            'current_clue': current_clue,
+            'current_guesses': [],
+            'message_log': list(self.message_log),
+            'red_round': self.red_round,
+            'blue_round': self.blue_round,
+            'current_turn_team': None,
+            # Последние раунды истории; весь ее объем - командой get_history
+            'history': self.history_rows(history_seq - HISTORY_RECENT),
+            'history_seq': history_seq,
+            'message_seq': self.message_seq,
+        }
+
+    def get_player_fields(self, player_id: str) -> dict:
+        """Небольшие персональные поля, которые дописываются к состоянию аудитории"""
+        player = self.players.get(player_id)
+        if not player:
+            return {}
+        return {
+            'my_team': player.team.value,
+            'my_nickname': player.nickname,
+            'is_encoder': player.is_encoder,
+            'current_code': self.current_code if player.is_encoder else None,
+        }
 
     def get_state_for_player(self, player_id: str) -> dict:
         """Возвращает состояние для конкретного игрока"""
-        state_dict = self.state.model_dump()
-
-        # НОВОЕ: добавляем историю раундов в состояние
-        state_dict['rounds_history'] = self.rounds_history
-
-        if player_id in self.state.players:
-            player = self.state.players[player_id]
-            state_dict['my_team'] = player.team.value if player.team else None
-            state_dict['my_nickname'] = player.nickname
-            state_dict['is_encoder'] = player.is_encoder
-
-        return state_dict
\ No newline at end of file
+        state_dict = self.get_audience_state(self.get_audience(player_id))
+        state_dict.update(self.get_player_fields(player_id))
+        return state_dict
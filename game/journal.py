@@ -0,0 +1,152 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Callable, List, Optional, Tuple
+
+from .game_state import DecryptoGame
+
+logger = logging.getLogger(__name__)
+
+
+class RoomJournal:
+    """
+    Журнал команд комнат для восстановления после падения или деплоя.
+    На каждую комнату два файла: <код>.log - принятые команды по строке,
+    <код>.snap - последний снимок. Запись идет пачками в фоне, обработчики
+    только кладут строки в буфер. Комнаты поднимаются лениво при первом
+    обращении, поэтому время старта не зависит от числа старых комнат.
+    """
+
+    def __init__(self, directory: str, snapshot_every: int = 50, flush_interval: float = 0.2):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.flush_interval = flush_interval
+        os.makedirs(directory, exist_ok=True)
+        # (код комнаты, вид записи, данные) в порядке поступления
+        self._pending: List[Tuple[str, str, object]] = []
+        self._since_snapshot = {}
+        # Удаленные комнаты, чьи файлы еще не стерты фоновой записью
+        self._dropping = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def _path(self, room_code: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{room_code}.{suffix}")
+
+    def exists(self, room_code: str) -> bool:
+        if room_code in self._dropping:
+            return False
+        return (os.path.exists(self._path(room_code, "snap"))
+                or os.path.exists(self._path(room_code, "log")))
+
+    # --- запись ---
+
+    def record_create(self, game: DecryptoGame, seed: int, pack: str, public: bool = False):
+        self._since_snapshot[game.room_code] = 0
+        self._pending.append((game.room_code, "log", [game.version, "create", [seed, pack, public]]))
+
+    def record(self, game: DecryptoGame, command: str, args: list):
+        """Запоминает принятую команду; время от времени добавляет снимок"""
+        self._pending.append((game.room_code, "log", [game.version, command, args]))
+        count = self._since_snapshot.get(game.room_code, 0) + 1
+        if count >= self.snapshot_every:
+            self._pending.append((game.room_code, "snap", game.to_snapshot()))
+            count = 0
+        self._since_snapshot[game.room_code] = count
+
+    def drop(self, room_code: str):
+        self._since_snapshot.pop(room_code, None)
+        self._dropping.add(room_code)
+        self._pending.append((room_code, "drop", None))
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        await asyncio.to_thread(self._write_batch, batch)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Ошибка записи журнала")
+
+    def _write_batch(self, batch: List[Tuple[str, str, object]]):
+        lines = {}
+        for room_code, kind, data in batch:
+            if kind == "log":
+                lines.setdefault(room_code, []).append(json.dumps(data, ensure_ascii=False))
+                continue
+
+            # Снимок или удаление: сначала дописываем накопленное по комнате
+            self._append_lines(room_code, lines.pop(room_code, []))
+            if kind == "snap":
+                tmp_path = self._path(room_code, "snap.tmp")
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp_path, self._path(room_code, "snap"))
+                # Все команды до снимка уже в нем - хвост журнала обнуляем
+                open(self._path(room_code, "log"), "w").close()
+            else:
+                for suffix in ("log", "snap"):
+                    try:
+                        os.remove(self._path(room_code, suffix))
+                    except FileNotFoundError:
+                        pass
+                self._dropping.discard(room_code)
+
+        for room_code, room_lines in lines.items():
+            self._append_lines(room_code, room_lines)
+
+    def _append_lines(self, room_code: str, room_lines: List[str]):
+        if room_lines:
+            with open(self._path(room_code, "log"), "a", encoding="utf-8") as f:
+                f.write("\n".join(room_lines) + "\n")
+
+    # --- восстановление ---
+
+    def restore(self, room_code: str, factory: Callable[..., DecryptoGame]) -> Optional[DecryptoGame]:
+        """
+        Снимок плюс хвост журнала. factory(snapshot) создает игру из снимка,
+        factory(None, seed, pack, public) - пустую с аргументами записи create.
+        """
+        game = None
+        snap_path = self._path(room_code, "snap")
+        if os.path.exists(snap_path):
+            with open(snap_path, encoding="utf-8") as f:
+                game = factory(json.load(f))
+
+        log_path = self._path(room_code, "log")
+        if os.path.exists(log_path):
+            with open(log_path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        version, command, args = json.loads(line)
+                    except ValueError:
+                        # Оборванная последняя строка после падения
+                        break
+                    if command == "create":
+                        if game is None:
+                            game = factory(None, *args)
+                        continue
+                    if game is None or version <= game.version:
+                        continue
+                    game.apply_command(command, args)
+                    if game.version != version:
+                        logger.warning("Расхождение версии при восстановлении",
+                                       extra={"room": room_code, "version": game.version, "expected": version})
+
+        return game
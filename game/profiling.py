@@ -0,0 +1,127 @@
+"""
+Профилирование команд игры по типам, включаемое на ходу. Выключенный
+профайлер стоит одной проверки флага на команду. Режим cpu копит cProfile
+отдельно по каждому типу команды, режим memory через tracemalloc считает
+вызовы, чистый прирост и пик выделенной памяти на команду.
+"""
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterable, Optional
+
+MODES = ("cpu", "memory")
+# Допустимые порядки отчета cpu - значения pstats.SortKey
+SORT_KEYS = frozenset(key.value for key in pstats.SortKey)
+
+
+class CommandStats:
+    __slots__ = ("calls", "seconds", "allocated", "peak", "profile")
+
+    def __init__(self, mode: str):
+        self.calls = 0
+        self.seconds = 0.0
+        # Чистый прирост памяти и наибольший пик за вызов, байт (режим memory)
+        self.allocated = 0
+        self.peak = 0
+        self.profile = cProfile.Profile() if mode == "cpu" else None
+
+
+class CommandProfiler:
+    """Профайлер команд процесса; включается и выключается без перезапуска"""
+
+    def __init__(self):
+        self.active = False
+        self.mode: Optional[str] = None
+        # None - профилируются все команды
+        self.commands: Optional[frozenset] = None
+        self.started_at: Optional[float] = None
+        self.stats: Dict[str, CommandStats] = {}
+        self._own_tracemalloc = False
+
+    def start(self, mode: str = "cpu", commands: Optional[Iterable[str]] = None):
+        """Начинает новый замер; прошлые результаты сбрасываются"""
+        if mode not in MODES:
+            raise ValueError(f"Неизвестный режим профилирования: {mode}")
+        self.stop()
+        self.mode = mode
+        self.commands = frozenset(commands) if commands else None
+        self.stats = {}
+        self.started_at = time.time()
+        if mode == "memory" and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._own_tracemalloc = True
+        self.active = True
+
+    def stop(self):
+        """Останавливает замер; накопленное остается доступным в report"""
+        self.active = False
+        if self._own_tracemalloc:
+            tracemalloc.stop()
+            self._own_tracemalloc = False
+
+    def wants(self, command: str) -> bool:
+        return self.active and (self.commands is None or command in self.commands)
+
+    def call(self, command: str, func: Callable, *args):
+        """Выполняет func(*args) под замером как команду command"""
+        stats = self.stats.get(command)
+        if stats is None:
+            stats = self.stats[command] = CommandStats(self.mode)
+        if stats.profile is not None:
+            started = time.perf_counter()
+            stats.profile.enable()
+            try:
+                return func(*args)
+            finally:
+                stats.profile.disable()
+                stats.seconds += time.perf_counter() - started
+                stats.calls += 1
+
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            stats.seconds += time.perf_counter() - started
+            current, peak = tracemalloc.get_traced_memory()
+            stats.allocated += current - before
+            stats.peak = max(stats.peak, peak - before)
+            stats.calls += 1
+
+    def report(self, limit: int = 15, sort: str = "cumulative") -> dict:
+        """
+        Сводка по командам; в режиме cpu - с текстом pstats по самым дорогим функциям.
+        ValueError - неизвестный порядок sort.
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Неизвестный порядок сортировки: {sort}, возможны: {', '.join(sorted(SORT_KEYS))}")
+        commands = {}
+        for command, stats in sorted(self.stats.items()):
+            entry = {
+                "calls": stats.calls,
+                "total_ms": round(stats.seconds * 1000, 3),
+                "mean_us": round(stats.seconds * 1e6 / stats.calls, 2) if stats.calls else 0,
+            }
+            if stats.profile is not None:
+                out = io.StringIO()
+                pstats.Stats(stats.profile, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+                entry["profile"] = out.getvalue()
+            else:
+                entry["allocated_bytes"] = stats.allocated
+                entry["mean_allocated_bytes"] = stats.allocated // stats.calls if stats.calls else 0
+                entry["peak_bytes"] = stats.peak
+            commands[command] = entry
+        return {
+            "active": self.active,
+            "mode": self.mode,
+            "commands_filter": sorted(self.commands) if self.commands else None,
+            "started_at": self.started_at,
+            "commands": commands,
+        }
+
+
+# Профайлер процесса: его проверяют DecryptoGame.apply_command и сборка представлений
+profiler = CommandProfiler()
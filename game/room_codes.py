@@ -0,0 +1,79 @@
+import hashlib
+import secrets
+import string
+from typing import Optional, Sequence
+
+ALPHABET = string.ascii_uppercase + string.digits
+CODE_LENGTH = 6
+# Раундов сети Фейстеля: после четырех выход неотличим от случайной перестановки
+FEISTEL_ROUNDS = 6
+
+
+def shard_of(room_code: str, shard_count: int) -> int:
+    """Шард комнаты определяется первым символом кода"""
+    return ALPHABET.index(room_code[0]) % shard_count
+
+
+def shard_prefixes(shard: int, shard_count: int) -> str:
+    return "".join(c for i, c in enumerate(ALPHABET) if i % shard_count == shard)
+
+
+def derive_key(seed: int, shard: int) -> bytes:
+    """Ключ кодов шарда из общего зерна воркеров"""
+    return hashlib.blake2b(f"{seed}:{shard}".encode(), digest_size=16, person=b"decrypto-codes").digest()
+
+
+class RoomCodeAllocator:
+    """
+    Коды комнат одного шарда без повторов за O(1): номер n-го выданного кода
+    проходит через перестановку пространства шарда с секретным ключом - сеть
+    Фейстеля на ближайшей сверху четной степени двойки и cycle-walking (значения
+    за пределами пространства шифруются повторно). Это биекция, поэтому за N выдач
+    коды не повторяются, а без ключа по выданным кодам следующий не угадать:
+    код - единственная защита закрытой комнаты и ее трансляции.
+    stride и offset делят поток номеров между процессами с общим ключом без пересечений.
+    """
+
+    def __init__(self, prefixes: Sequence[str], key: Optional[bytes] = None,
+                 offset: int = 0, stride: int = 1):
+        if not prefixes:
+            raise ValueError("У шарда нет префиксов кодов")
+        self.prefixes = prefixes
+        self.tail_space = len(ALPHABET) ** (CODE_LENGTH - 1)
+        self.space = len(prefixes) * self.tail_space
+        # Без общего ключа - свой случайный на процесс
+        self.key = key if key is not None else secrets.token_bytes(16)
+        self.half_bits = (max(self.space - 1, 1).bit_length() + 1) // 2
+        self.half_mask = (1 << self.half_bits) - 1
+        self.counter = offset
+        self.stride = stride
+        self.issued = 0
+
+    def _round(self, index: int, value: int) -> int:
+        digest = hashlib.blake2b(value.to_bytes(8, "big"), digest_size=8, key=self.key,
+                                 salt=index.to_bytes(16, "big")).digest()
+        return int.from_bytes(digest, "big") & self.half_mask
+
+    def _permute(self, value: int) -> int:
+        # Область сети меньше 4 * space: в среднем меньше четырех проходов
+        while True:
+            left, right = value >> self.half_bits, value & self.half_mask
+            for index in range(FEISTEL_ROUNDS):
+                left, right = right, left ^ self._round(index, right)
+            value = (left << self.half_bits) | right
+            if value < self.space:
+                return value
+
+    def next_code(self) -> str:
+        if self.issued * self.stride >= self.space:
+            raise RuntimeError("Пространство кодов шарда исчерпано")
+        value = self._permute(self.counter)
+        self.counter += self.stride
+        self.issued += 1
+
+        prefix, tail = divmod(value, self.tail_space)
+        chars = []
+        for _ in range(CODE_LENGTH - 1):
+            tail, digit = divmod(tail, len(ALPHABET))
+            chars.append(ALPHABET[digit])
+        return self.prefixes[prefix] + "".join(reversed(chars))
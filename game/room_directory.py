@@ -0,0 +1,97 @@
+from bisect import bisect_right, insort
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .game_state import DecryptoGame
+from .models import GamePhase, Team
+
+# Фильтры каталога: у каждого свой отсортированный список кодов
+FILTERS: Dict[str, Callable[[dict], bool]] = {
+    "all": lambda entry: True,
+    # Ждут игроков и есть свободные места
+    "waiting": lambda entry: entry["phase"] == GamePhase.WAITING.value and entry["players"] < entry["capacity"],
+    # Партия идет - можно смотреть трансляцию
+    "spectatable": lambda entry: entry["phase"] in (GamePhase.ENCODING.value, GamePhase.GUESSING.value),
+}
+
+
+class RoomDirectory:
+    """
+    Каталог открытых комнат. Запись комнаты обновляется при каждом ее изменении
+    (вход, выход, смена команды или фазы), а не сборкой по всем комнатам;
+    страница списка - бинарный поиск по коду-курсору в списке нужного фильтра.
+    """
+
+    def __init__(self, capacity: int = 16):
+        self.capacity = capacity
+        self.entries: Dict[str, dict] = {}
+        self._codes: Dict[str, List[str]] = {name: [] for name in FILTERS}
+        # Растет при любом изменении списка - по нему HTTP-ответы получают ETag
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _entry(self, game: DecryptoGame) -> dict:
+        return {
+            "room_code": game.room_code,
+            "phase": game.phase.value,
+            "word_pack": game.word_pack.name,
+            "players": len(game.players),
+            "red": len(game.teams[Team.RED]),
+            "blue": len(game.teams[Team.BLUE]),
+            "spectators": len(game.teams[Team.SPECTATOR]),
+            "capacity": self.capacity,
+        }
+
+    def update(self, game: DecryptoGame):
+        """Запись комнаты по ее текущему состоянию; закрытые комнаты в каталог не попадают"""
+        if not game.public:
+            self.remove(game.room_code)
+            return
+        code = game.room_code
+        entry = self._entry(game)
+        old = self.entries.get(code)
+        if entry == old:
+            return
+        self.entries[code] = entry
+        for name, matches in FILTERS.items():
+            was, now = old is not None and matches(old), matches(entry)
+            if now and not was:
+                insort(self._codes[name], code)
+            elif was and not now:
+                self._discard(name, code)
+        self.version += 1
+
+    def remove(self, room_code: str):
+        entry = self.entries.pop(room_code, None)
+        if entry is None:
+            return
+        for name, matches in FILTERS.items():
+            if matches(entry):
+                self._discard(name, room_code)
+        self.version += 1
+
+    def _discard(self, name: str, code: str):
+        codes = self._codes[name]
+        i = bisect_right(codes, code) - 1
+        if i >= 0 and codes[i] == code:
+            del codes[i]
+
+    def prune(self, exists: Callable[[str], bool]):
+        """Убирает комнаты, удаленные без ведома этого процесса (другим воркером)"""
+        for code in [code for code in self.entries if not exists(code)]:
+            self.remove(code)
+
+    def page(self, filter_name: str = "all", after: str = "", limit: int = 20) -> Tuple[List[dict], Optional[str]]:
+        """
+        Комнаты фильтра с кодом больше after, не больше limit. Возвращает их
+        и курсор следующей страницы (None - страница последняя). KeyError - нет фильтра.
+        """
+        codes = self._codes[filter_name]
+        start = bisect_right(codes, after) if after else 0
+        chunk = codes[start:start + limit]
+        more = start + limit < len(codes)
+        return [self.entries[code] for code in chunk], (chunk[-1] if more and chunk else None)
+
+    def count(self, filter_name: str = "all") -> int:
+        return len(self._codes[filter_name])
@@ -1,87 +1,332 @@
+import heapq
+import itertools
+import json
+import logging
 import random
-import string
-from typing import Dict, Optional
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
 from .models import GameState, Player, Team, SecretWords, GamePhase
 from .game_state import DecryptoGame
+from .storage import RoomStorage, MemoryRoomStorage, create_storage
+from .journal import RoomJournal
+from .archive import GameArchive
+from .room_directory import RoomDirectory
+from .room_codes import ALPHABET, RoomCodeAllocator, derive_key, shard_of, shard_prefixes
+from .word_packs import DEFAULT_PACK, WordPackStore, word_packs
+
+logger = logging.getLogger(__name__)
+
+
+class RoomLimitError(Exception):
+    """Комнат уже предельное число, и вытеснить некого"""
+
+
+class RoomShard:
+    """
+    Часть комнат с общим набором префиксов кода: свое хранилище (в памяти)
+    или своя доля общего, свой генератор кодов и своя статистика.
+    """
+
+    def __init__(self, index: int, storage: RoomStorage, allocator: RoomCodeAllocator, shared: bool):
+        self.index = index
+        self.storage = storage
+        self.allocator = allocator
+        # Общее хранилище видит комнаты всех шардов - свои отбираем по коду
+        self.shared = shared
+        self.rooms_created = 0
+        self.rooms_reaped = 0
+        self.bytes_reclaimed = 0
+        self.commands = 0
+
+    def owns(self, room_code: str) -> bool:
+        return room_code[0] in self.allocator.prefixes
+
+    def codes(self) -> List[str]:
+        codes = self.storage.codes()
+        return [code for code in codes if self.owns(code)] if self.shared else codes
+
+    def stats(self) -> dict:
+        return {
+            "shard": self.index,
+            "rooms": len(self.codes()),
+            "rooms_created": self.rooms_created,
+            "rooms_reaped": self.rooms_reaped,
+            "bytes_reclaimed": self.bytes_reclaimed,
+            "commands": self.commands,
+        }
 
 
 class RoomManager:
-    def __init__(self):
-        self.rooms: Dict[str, DecryptoGame] = {}
-        # Большой словарь слов (можно заменить своим)
-        self.word_bank = [
-            "пират", "кролик", "собака", "кошка", "волк", "лиса", "медведь", "заяц",
-            "тигр", "лев", "слон", "жираф", "зебра", "бегемот", "носорог", "кенгуру",
-            "обезьяна", "белка", "ёж", "мышь", "крыса", "хомяк", "попугай", "орёл",
-            "сокол", "воробей", "голубь", "ворона", "сова", "филин",
-            "космос", "море", "огонь", "солнце", "луна", "дерево", "цветок", "ветер",
-            "дождь", "снег", "гора", "река", "озеро", "лес", "поле", "звезда",
-            "облако", "радуга", "гроза", "молния", "град", "туман", "роса", "лёд",
-            "вулкан", "пустыня", "болото", "скала", "песок", "земля",
-            "кофе", "чай", "пицца", "суши", "хлеб", "сыр", "вино", "пиво",
-            "молоко", "вода", "сок", "лимонад", "коктейль", "водка", "коньяк",
-            "мясо", "рыба", "курица", "яйцо", "салат", "суп", "борщ", "каша",
-            "макароны", "рис", "гречка", "овощи", "фрукты", "яблоко", "банан",
-            "апельсин", "лимон", "клубника", "шоколад", "мороженое",
-            "футбол", "баскетбол", "теннис", "шахматы", "хоккей", "волейбол",
-            "бейсбол", "гольф", "бокс", "борьба", "плавание", "бег", "лыжи",
-            "коньки", "скейт", "велосипед", "йога", "фитнес", "шашки", "нарды",
-            "домино", "покер", "рулетка", "дартс", "боулинг",
-            "музей", "книга", "музыка", "кино", "фото", "театр", "цирк", "балет",
-            "опера", "картина", "скульптура", "поэзия", "роман", "сказка", "миф",
-            "легенда", "песня", "танец", "оркестр", "гитара", "пианино", "скрипка",
-            "барабан", "флейта", "аккордеон",
-            "компьютер", "телефон", "часы", "очки", "зонт", "телевизор", "планшет",
-            "ноутбук", "клавиатура", "мышь", "экран", "камера", "видео", "радио",
-            "микрофон", "наушники", "зарядка", "батарейка", "лампочка", "фонарик",
-            "зеркало", "расческа", "зубная щетка", "мыло", "шампунь", "полотенце",
-            "ножницы", "клей", "бумага", "ручка", "карандаш", "линейка", "циркуль",
-            "транспортир", "калькулятор",
-            "поезд", "самолет", "метро", "такси", "велосипед", "мотоцикл", "лодка",
-            "машина", "автобус", "трамвай", "троллейбус", "корабль", "пароход",
-            "яхта", "катер", "вертолет", "ракета", "космолет", "поезд", "электричка",
-            "грузовик", "трактор", "экскаватор", "пожарная машина", "скорая помощь",
-            "врач", "учитель", "инженер", "строитель", "водитель", "пилот",
-            "капитан", "повар", "официант", "продавец", "полицейский", "пожарный",
-            "ученый", "программист", "дизайнер", "архитектор", "журналист",
-            "фотограф", "актер", "режиссер", "художник", "писатель", "поэт",
-            "музыкант", "певец",
-            "стол", "стул", "кровать", "диван", "шкаф", "полка", "зеркало",
-            "ковер", "лампа", "люстра", "занавески", "подушка", "одеяло",
-            "посуда", "тарелка", "чашка", "стакан", "вилка", "ложка", "нож",
-            "одежда", "рубашка", "брюки", "джинсы", "футболка", "свитер",
-            "куртка", "пальто", "шапка", "шарф", "перчатки", "носки",
-            "обувь", "ботинки", "кроссовки", "туфли", "сапоги", "ремень",
-            "галстук", "шляпа",
-            "время", "пространство", "энергия", "сила", "свет", "тьма",
-            "звук", "тишина", "мысль", "идея", "мечта", "реальность",
-            "иллюзия", "тайна", "секрет", "правда", "ложь", "добро",
-            "зло", "любовь", "ненависть", "страх", "радость", "грусть",
-            "счастье",
+    """
+    Реестр комнат, разбитый на шарды по первому символу кода.
+    owned_shards - шарды, в которых этот процесс (или цикл событий) создает
+    новые комнаты; искать комнату можно в любом шарде.
+    """
+
+    def __init__(self, storage_url: str = "memory", journal: Optional[RoomJournal] = None,
+                 packs: WordPackStore = word_packs, shard_count: int = 4,
+                 owned_shards: Optional[Sequence[int]] = None, code_seed: Optional[int] = None,
+                 worker_index: int = 0, worker_count: int = 1, archive: Optional[GameArchive] = None,
+                 room_capacity: int = 16):
+        # Журнал команд для восстановления комнат после рестарта (необязателен)
+        self.journal = journal
+        # Архив законченных партий для аналитики (необязателен)
+        self.archive = archive
+        # Каталог открытых комнат этого процесса; обновляется вместе с комнатами
+        self.directory = RoomDirectory(room_capacity)
+        # Вызывается с кодом после удаления комнаты сборщиком или вытеснением
+        self.on_delete: Optional[Callable[[str], None]] = None
+        # Вызывается с кодом и игроками комнаты, поднятой из журнала
+        self.on_restore: Optional[Callable[[str, List[str]], None]] = None
+        # Наборы слов грузятся лениво и общие для всех комнат
+        self.packs = packs
+
+        shared_storage = None
+        if storage_url and storage_url != "memory":
+            shared_storage = create_storage(storage_url, self._restore_room)
+        # Общий code_seed у воркеров + свой worker_index - непересекающиеся потоки кодов;
+        # без зерна у каждого шарда свой случайный ключ
+        self.shards = [
+            RoomShard(
+                index,
+                shared_storage or MemoryRoomStorage(),
+                RoomCodeAllocator(shard_prefixes(index, shard_count),
+                                  derive_key(code_seed, index) if code_seed is not None else None,
+                                  offset=worker_index, stride=worker_count),
+                shared=shared_storage is not None,
+            )
+            for index in range(shard_count)
         ]
+        owned = range(shard_count) if owned_shards is None else owned_shards
+        self._next_shard = itertools.cycle([self.shards[i] for i in owned])
+
+    @property
+    def rooms_reaped(self) -> int:
+        return sum(shard.rooms_reaped for shard in self.shards)
+
+    @property
+    def bytes_reclaimed(self) -> int:
+        return sum(shard.bytes_reclaimed for shard in self.shards)
+
+    def room_count(self) -> int:
+        return sum(len(shard.codes()) for shard in self.shards)
+
+    def stats(self) -> List[dict]:
+        return [shard.stats() for shard in self.shards]
+
+    def shard_for(self, room_code: str) -> Optional[RoomShard]:
+        if not room_code or room_code[0] not in ALPHABET:
+            return None
+        return self.shards[shard_of(room_code, len(self.shards))]
 
-    def create_room(self) -> str:
-        """Создает новую комнату с уникальным кодом"""
+    def create_room(self, pack: str = DEFAULT_PACK, public: bool = False, max_rooms: Optional[int] = None,
+                    is_abandoned: Callable[[str], bool] = lambda code: False) -> str:
+        """
+        Создает новую комнату с уникальным кодом; public - показывать ее в каталоге.
+        max_rooms делится между шардами, как в reap: в заполненном шарде вытесняется
+        самая давно менявшаяся брошенная комната. KeyError, если набора слов нет,
+        RoomLimitError, если шард заполнен и вытеснить некого.
+        """
+        word_pack = self.packs.get(pack)
+        shard = next(self._next_shard)
+        if max_rooms is not None:
+            self._make_room(shard, -(-max_rooms // len(self.shards)), is_abandoned)
         while True:
-            # Генерируем 6-значный код
-            code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-            if code not in self.rooms:
-                self.rooms[code] = DecryptoGame(code, self.word_bank.copy())
-                return code
+            # Внутри процесса коды не повторяются; проверка ловит комнаты
+            # прошлых запусков и других воркеров из журнала и общего хранилища
+            code = shard.allocator.next_code()
+            if not self.room_exists(code):
+                break
+        seed = random.getrandbits(64)
+        game = DecryptoGame(code, word_pack, seed)
+        game.public = public
+        shard.storage.put(code, game)
+        shard.rooms_created += 1
+        self.directory.update(game)
+        if self.journal:
+            self.journal.record_create(game, seed, pack, public)
+        return code
+
+    @property
+    def is_shared(self) -> bool:
+        """Хранилище общее для нескольких воркеров"""
+        return self.shards[0].shared
+
+    def _restore_room(self, snapshot: dict) -> DecryptoGame:
+        return DecryptoGame.from_snapshot(snapshot, self.packs.get(snapshot.get('word_pack', DEFAULT_PACK)))
+
+    def _load_from_journal(self, shard: RoomShard, room_code: str) -> bool:
+        """Лениво поднимает комнату из журнала при первом обращении"""
+        if not self.journal or room_code in shard.storage or not self.journal.exists(room_code):
+            return False
+        def factory(snapshot: Optional[dict], seed: int = 0, pack: str = DEFAULT_PACK,
+                    public: bool = False) -> DecryptoGame:
+            if snapshot is None:
+                game = DecryptoGame(room_code, self.packs.get(pack), seed)
+                game.public = public
+                return game
+            return self._restore_room(snapshot)
+
+        game = self.journal.restore(room_code, factory)
+        if game is None:
+            return False
+        shard.storage.put(room_code, game)
+        self.directory.update(game)
+        # Подключения прошлого запуска рестарт не пережили: все игроки вне сети,
+        # отключение пишется в журнал, как и при обычном обрыве
+        player_ids = list(game.players)
+        for player_id in player_ids:
+            if game.players[player_id].is_connected:
+                self.apply(room_code, "disconnect_player", [player_id])
+        if self.on_restore:
+            self.on_restore(room_code, player_ids)
+        logger.info("Комната восстановлена из журнала", extra={"room": room_code, "version": game.version})
+        return True
 
     def get_room(self, room_code: str) -> Optional[DecryptoGame]:
-        """Получает комнату по коду"""
-        return self.rooms.get(room_code.upper())
+        """Получает комнату по коду (в общем хранилище - копию только для чтения)"""
+        room_code = room_code.upper()
+        shard = self.shard_for(room_code)
+        if shard is None:
+            return None
+        self._load_from_journal(shard, room_code)
+        return shard.storage.get(room_code)
+
+    @contextmanager
+    def edit_room(self, room_code: str) -> Iterator[Optional[DecryptoGame]]:
+        """Комната для изменения; в общем хранилище сохраняется при выходе"""
+        room_code = room_code.upper()
+        shard = self.shard_for(room_code)
+        if shard is None:
+            yield None
+            return
+        self._load_from_journal(shard, room_code)
+        with shard.storage.edit(room_code) as game:
+            yield game
+
+    def execute(self, room_code: str, command: str, *args):
+        """
+        Применяет команду к комнате и пишет ее в журнал, если состояние изменилось.
+        Возвращает результат команды или None, если комнаты нет.
+        """
+        return self.apply(room_code, command, list(args))[0]
+
+    def apply(self, room_code: str, command: str, args: list) -> Tuple[object, bool]:
+        """Как execute, но вместе с результатом сообщает, изменилась ли комната"""
+        with self.edit_room(room_code) as game:
+            if game is None:
+                return None, False
+            version = game.version
+            phase = game.phase
+            result = game.apply_command(command, args)
+            if game.version == version:
+                return result, False
+            self.shard_for(game.room_code).commands += 1
+            if self.journal:
+                self.journal.record(game, command, args)
+            self.directory.update(game)
+            # Партия закончилась: итог уходит в архив, пока комната еще жива
+            if self.archive and game.phase == GamePhase.GAME_OVER and phase != GamePhase.GAME_OVER:
+                self.archive.record(game)
+            return result, True
 
     def room_exists(self, room_code: str) -> bool:
-        return room_code.upper() in self.rooms
+        room_code = room_code.upper()
+        shard = self.shard_for(room_code)
+        if shard is None:
+            return False
+        return room_code in shard.storage or bool(self.journal and self.journal.exists(room_code))
+
+    def delete_room(self, room_code: str):
+        shard = self.shard_for(room_code)
+        game = shard.storage.get(room_code) if shard else None
+        if game is None:
+            return
+        shard.bytes_reclaimed += len(json.dumps(game.to_snapshot(), ensure_ascii=False))
+        shard.rooms_reaped += 1
+        shard.storage.delete(room_code)
+        self.directory.remove(room_code)
+        if self.journal:
+            self.journal.drop(room_code)
+        if self.on_delete:
+            self.on_delete(room_code)
+
+    def reap(self, is_abandoned: Callable[[str], bool], idle_ttl: float,
+             finished_ttl: float, max_rooms: int, now: Optional[float] = None) -> List[str]:
+        """
+        Удаляет комнаты: пустые или брошенные (нет живых подключений) дольше idle_ttl,
+        законченные игры дольше finished_ttl. Лимит max_rooms делится поровну между
+        шардами: сверх него вытесняются самые давно менявшиеся брошенные комнаты
+        шарда. Возвращает удаленные коды.
+        """
+        now = now or time.time()
+        shard_limit = -(-max_rooms // len(self.shards))
+        reaped = []
+        for shard in self.shards:
+            reaped.extend(self._reap_shard(shard, is_abandoned, idle_ttl, finished_ttl, shard_limit, now))
+        if self.is_shared:
+            # Комнату мог удалить сборщик другого воркера
+            self.directory.prune(self.room_exists)
+        return reaped
+
+    def _reap_shard(self, shard: RoomShard, is_abandoned: Callable[[str], bool], idle_ttl: float,
+                    finished_ttl: float, max_rooms: int, now: float) -> List[str]:
+        reaped = []
+        abandoned = []
+        codes = shard.codes()
+
+        for code in codes:
+            game = shard.storage.get(code)
+            if game is None:
+                continue
+            idle = now - game.updated_at
+            if game.phase == GamePhase.GAME_OVER and idle > finished_ttl:
+                reaped.append(code)
+            elif not game.players or self._is_abandoned(game, is_abandoned):
+                if idle > idle_ttl:
+                    reaped.append(code)
+                else:
+                    abandoned.append((game.updated_at, code))
+
+        excess = len(codes) - len(reaped) - max_rooms
+        if excess > 0:
+            reaped.extend(code for _, code in heapq.nsmallest(excess, abandoned))
+
+        for code in reaped:
+            self.delete_room(code)
+        return reaped
+
+    def _make_room(self, shard: RoomShard, max_rooms: int, is_abandoned: Callable[[str], bool]):
+        codes = shard.codes()
+        if len(codes) < max_rooms:
+            return
+        oldest = None
+        for code in codes:
+            game = shard.storage.get(code)
+            if game is None or (game.players and not self._is_abandoned(game, is_abandoned)):
+                continue
+            if oldest is None or (game.updated_at, code) < oldest:
+                oldest = (game.updated_at, code)
+        if oldest is None:
+            raise RoomLimitError(f"В шарде {shard.index} уже {len(codes)} комнат")
+        logger.info("Комната вытеснена новой", extra={"room": oldest[1]})
+        self.delete_room(oldest[1])
+
+    def _is_abandoned(self, game: DecryptoGame, is_abandoned: Callable[[str], bool]) -> bool:
+        """
+        is_abandoned видит только подключения этого процесса. В общем хранилище
+        игроки комнаты могут сидеть на других воркерах - тогда верим флагам
+        is_connected, которые их воркеры сохраняют вместе с комнатой.
+        """
+        if not is_abandoned(game.room_code):
+            return False
+        return not self.is_shared or not any(player.is_connected for player in game.players.values())
 
     def cleanup_empty_rooms(self):
         """Удаляет пустые комнаты (можно вызывать периодически)"""
-        empty_rooms = []
-        for code, game in self.rooms.items():
-            if not game.state.players:  # нет игроков
-                empty_rooms.append(code)
-
-        for code in empty_rooms:
-            del self.rooms[code]
\ No newline at end of file
+        for shard in self.shards:
+            for code in shard.codes():
+                with shard.storage.edit(code) as game:
+                    if game is not None and not game.players:  # нет игроков
+                        self.delete_room(code)
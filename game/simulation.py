@@ -0,0 +1,309 @@
+"""
+Безголовая симуляция партий: боты играют друг с другом напрямую через
+DecryptoGame, без сети и без лога сообщений. Партии идут пачками в пуле
+процессов, итог - сводная статистика по длине партий, причинам побед
+и равномерности смены шифровальщиков.
+
+    python -m game.simulation --games 1000000 --workers 8 --red bold --blue cautious
+"""
+import argparse
+import importlib
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .game_state import DecryptoGame
+from .models import GamePhase, Team
+from .word_packs import DEFAULT_PACK, word_packs
+
+
+class Strategy:
+    """
+    Бот команды. decode - угадает ли своя команда код по подсказкам шифровальщика,
+    intercept - перехватит ли эта команда код соперника. Стратегии передаются
+    в процессы пула, поэтому должны сериализоваться pickle.
+    """
+
+    def clue(self, game: DecryptoGame, team: Team) -> List[str]:
+        words = game.secret_words[0 if team == Team.RED else 1]
+        return [words[digit - 1] for digit in game.current_code]
+
+    def decode(self, game: DecryptoGame, team: Team, rng: random.Random) -> bool:
+        raise NotImplementedError
+
+    def intercept(self, game: DecryptoGame, team: Team, encoder: "Strategy",
+                  rng: random.Random) -> bool:
+        raise NotImplementedError
+
+
+class RandomStrategy(Strategy):
+    """Код угадывается наугад: одна из 24 комбинаций"""
+
+    def decode(self, game, team, rng):
+        return rng.randrange(len(game.all_possible_codes)) == 0
+
+    def intercept(self, game, team, encoder, rng):
+        return rng.randrange(len(game.all_possible_codes)) == 0
+
+
+class ScriptedStrategy(Strategy):
+    """
+    clarity - насколько понятны подсказки своей команде (вероятность угадать свой код).
+    insight - насколько команда хороша в перехвате. Чем понятнее подсказки
+    и чем больше раундов соперник уже видел, тем проще их перехватить.
+    """
+
+    def __init__(self, clarity: float, insight: float):
+        self.clarity = clarity
+        self.insight = insight
+
+    def decode(self, game, team, rng):
+        return rng.random() < self.clarity
+
+    def intercept(self, game, team, encoder, rng):
+        seen = game._round_for(game.current_encoder_team) - 1
+        if seen <= 0:
+            return False
+        clarity = getattr(encoder, "clarity", 0.5)
+        return rng.random() < min(1.0, self.insight * clarity * seen / 4)
+
+
+STRATEGIES = {
+    "random": RandomStrategy,
+    "balanced": lambda: ScriptedStrategy(0.85, 0.35),
+    "cautious": lambda: ScriptedStrategy(0.7, 0.35),
+    "bold": lambda: ScriptedStrategy(0.95, 0.35),
+    "sharp": lambda: ScriptedStrategy(0.85, 0.6),
+}
+
+
+def load_strategy(name: str) -> Strategy:
+    """Встроенная стратегия по имени или своя по пути module:Class"""
+    if name in STRATEGIES:
+        return STRATEGIES[name]()
+    module, _, attr = name.partition(":")
+    if not attr:
+        raise KeyError(f"Неизвестная стратегия: {name}")
+    return getattr(importlib.import_module(module), attr)()
+
+
+class SimulationConfig:
+    """Параметры серии партий; передается в процессы пула целиком"""
+
+    def __init__(self, red: str = "balanced", blue: str = "balanced", pack: str = DEFAULT_PACK,
+                 red_players: int = 2, blue_players: int = 2, max_rounds: int = 40,
+                 intercepts_to_win: int = DecryptoGame.INTERCEPTS_TO_WIN,
+                 mistakes_to_lose: int = DecryptoGame.MISTAKES_TO_LOSE):
+        self.red = red
+        self.blue = blue
+        self.pack = pack
+        self.red_players = red_players
+        self.blue_players = blue_players
+        self.max_rounds = max_rounds
+        self.intercepts_to_win = intercepts_to_win
+        self.mistakes_to_lose = mistakes_to_lose
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+
+class SimulationStats:
+    """Счетчики серии; складываются из пачек, посчитанных разными процессами"""
+
+    def __init__(self):
+        self.games = 0
+        self.lengths: Counter = Counter()
+        # (победитель, причина); ничья по лимиту раундов - (None, 'round_limit')
+        self.outcomes: Counter = Counter()
+        # Разброс числа ходов шифровальщиком внутри команды (max - min) за партию
+        self.encoder_spread: Counter = Counter()
+        self.encoder_turns: Dict[str, Counter] = {Team.RED.value: Counter(), Team.BLUE.value: Counter()}
+
+    def add(self, rounds: int, winner: Optional[Team], reason: str, turns: Dict[Team, List[int]]):
+        self.games += 1
+        self.lengths[rounds] += 1
+        self.outcomes[(winner.value if winner else None, reason)] += 1
+        for team, counts in turns.items():
+            self.encoder_spread[max(counts) - min(counts)] += 1
+            seats = self.encoder_turns[team.value]
+            for seat, count in enumerate(counts):
+                seats[seat] += count
+
+    def merge(self, other: "SimulationStats"):
+        self.games += other.games
+        self.lengths.update(other.lengths)
+        self.outcomes.update(other.outcomes)
+        self.encoder_spread.update(other.encoder_spread)
+        for team, seats in other.encoder_turns.items():
+            self.encoder_turns[team].update(seats)
+
+    def _percentile(self, q: float) -> int:
+        rank = math.ceil(q * self.games)
+        seen = 0
+        for rounds in sorted(self.lengths):
+            seen += self.lengths[rounds]
+            if seen >= rank:
+                return rounds
+        return 0
+
+    def summary(self) -> dict:
+        games = self.games or 1
+        team_games = sum(self.encoder_spread.values()) or 1
+        wins: Dict[str, Dict[str, float]] = {}
+        for (winner, reason), count in sorted(self.outcomes.items(), key=lambda item: str(item[0])):
+            wins.setdefault(winner or "draw", {})[reason] = count / games
+        fairness = {}
+        for team, seats in self.encoder_turns.items():
+            total = sum(seats.values()) or 1
+            fairness[team] = {str(seat): seats[seat] / total for seat in sorted(seats)}
+        return {
+            "games": self.games,
+            "length": {
+                "mean": sum(r * c for r, c in self.lengths.items()) / games,
+                "p50": self._percentile(0.5),
+                "p90": self._percentile(0.9),
+                "p99": self._percentile(0.99),
+                "max": max(self.lengths, default=0),
+                "distribution": {str(r): self.lengths[r] for r in sorted(self.lengths)},
+            },
+            "wins": wins,
+            "encoder_share": fairness,
+            "encoder_spread": {str(s): self.encoder_spread[s] / team_games for s in sorted(self.encoder_spread)},
+        }
+
+
+GameResult = Tuple[int, Optional[Team], str, Dict[Team, List[int]]]
+
+
+def simulate_game(config: SimulationConfig, seed: int,
+                  strategies: Optional[Tuple[Strategy, Strategy]] = None) -> GameResult:
+    """
+    Одна партия от раздачи до победы или лимита раундов.
+    Возвращает (раунды, победитель, причина, ходы шифровальщиком по местам в команде).
+    """
+    rng = random.Random(seed)
+    red, blue = strategies or (load_strategy(config.red), load_strategy(config.blue))
+    bots = {Team.RED: red, Team.BLUE: blue}
+
+    game = DecryptoGame("SIMULATE", word_packs.get(config.pack), seed, log_messages=False)
+    game.INTERCEPTS_TO_WIN = config.intercepts_to_win
+    game.MISTAKES_TO_LOSE = config.mistakes_to_lose
+    for team, count in ((Team.RED, config.red_players), (Team.BLUE, config.blue_players)):
+        for seat in range(count):
+            player_id = f"{team.value}{seat}"
+            game.add_player(player_id, player_id)
+            game.join_team(player_id, team)
+    if not game.start_game():
+        raise ValueError("Нужно минимум по 2 игрока в каждой команде")
+
+    encoder_turns = Counter()
+    rounds = 0
+    while game.phase != GamePhase.GAME_OVER and rounds < config.max_rounds:
+        rounds += 1
+        encoder = game.current_encoder_id
+        team = game.current_encoder_team
+        enemy = Team.BLUE if team == Team.RED else Team.RED
+        encoder_turns[encoder] += 1
+        game.submit_clue(encoder, bots[team].clue(game, team))
+        if bots[enemy].intercept(game, enemy, bots[team], rng):
+            game.handle_round_result(encoder, "enemy_team_guessed")
+            if game.phase == GamePhase.GAME_OVER:
+                break
+        result = "own_team_guessed" if bots[team].decode(game, team, rng) else "own_team_not_guessed"
+        game.handle_round_result(encoder, result)
+
+    turns = {team: [encoder_turns[player_id] for player_id in game.teams[team]]
+             for team in (Team.RED, Team.BLUE)}
+    if game.phase == GamePhase.GAME_OVER:
+        return rounds, game.winner, game.win_reason, turns
+    return rounds, None, "round_limit", turns
+
+
+def run_batch(config: SimulationConfig, first_seed: int, count: int) -> SimulationStats:
+    """Пачка партий в одном процессе; наружу уходят только счетчики"""
+    stats = SimulationStats()
+    strategies = (load_strategy(config.red), load_strategy(config.blue))
+    for seed in range(first_seed, first_seed + count):
+        stats.add(*simulate_game(config, seed, strategies))
+    return stats
+
+
+def _batches(games: int, batch_size: int, seed: int) -> Iterator[Tuple[int, int]]:
+    for start in range(0, games, batch_size):
+        yield seed + start, min(batch_size, games - start)
+
+
+def simulate(config: SimulationConfig, games: int, workers: Optional[int] = None,
+             batch_size: int = 2000, seed: int = 0) -> SimulationStats:
+    """
+    Серия партий с зернами seed .. seed + games - 1 - результат воспроизводим
+    при любом числе процессов. workers=1 - в текущем процессе.
+    """
+    workers = workers or os.cpu_count() or 1
+    stats = SimulationStats()
+    batches = list(_batches(games, batch_size, seed))
+    if workers == 1 or len(batches) == 1:
+        for first_seed, count in batches:
+            stats.merge(run_batch(config, first_seed, count))
+        return stats
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_batch, config, first_seed, count) for first_seed, count in batches]
+        for future in futures:
+            stats.merge(future.result())
+    return stats
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Симуляция партий Decrypto ботами")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=None, help="процессов в пуле (по умолчанию - по числу ядер)")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--red", default="balanced", help=f"стратегия: {', '.join(STRATEGIES)} или module:Class")
+    parser.add_argument("--blue", default="balanced")
+    parser.add_argument("--pack", default=DEFAULT_PACK)
+    parser.add_argument("--red-players", type=int, default=2)
+    parser.add_argument("--blue-players", type=int, default=2)
+    parser.add_argument("--max-rounds", type=int, default=40)
+    parser.add_argument("--intercepts-to-win", type=int, default=DecryptoGame.INTERCEPTS_TO_WIN)
+    parser.add_argument("--mistakes-to-lose", type=int, default=DecryptoGame.MISTAKES_TO_LOSE)
+    parser.add_argument("--output", help="файл для JSON с итогами (по умолчанию - stdout)")
+    args = parser.parse_args(argv)
+
+    config = SimulationConfig(
+        red=args.red, blue=args.blue, pack=args.pack,
+        red_players=args.red_players, blue_players=args.blue_players, max_rounds=args.max_rounds,
+        intercepts_to_win=args.intercepts_to_win, mistakes_to_lose=args.mistakes_to_lose,
+    )
+    # Ошибки в имени стратегии или набора - до запуска пула
+    load_strategy(config.red)
+    load_strategy(config.blue)
+    word_packs.get(config.pack)
+
+    started = time.perf_counter()
+    stats = simulate(config, args.games, args.workers, args.batch_size, args.seed)
+    elapsed = time.perf_counter() - started
+
+    report = {
+        "config": config.to_dict(),
+        "seconds": round(elapsed, 3),
+        "games_per_second": round(stats.games / elapsed, 1) if elapsed else None,
+        **stats.summary(),
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
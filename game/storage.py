@@ -0,0 +1,134 @@
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+from .game_state import DecryptoGame
+
+
+class RoomStorage:
+    """
+    Хранилище комнат под RoomManager.
+    Изменять комнату нужно внутри edit(): общее хранилище сохраняет ее при выходе.
+    """
+
+    def get(self, room_code: str) -> Optional[DecryptoGame]:
+        raise NotImplementedError
+
+    def put(self, room_code: str, game: DecryptoGame):
+        raise NotImplementedError
+
+    def delete(self, room_code: str):
+        raise NotImplementedError
+
+    def codes(self) -> List[str]:
+        raise NotImplementedError
+
+    def __contains__(self, room_code: str) -> bool:
+        raise NotImplementedError
+
+    @contextmanager
+    def edit(self, room_code: str) -> Iterator[Optional[DecryptoGame]]:
+        raise NotImplementedError
+
+
+class MemoryRoomStorage(RoomStorage):
+    """Комнаты в памяти процесса - только для одного воркера"""
+
+    def __init__(self):
+        self.rooms: Dict[str, DecryptoGame] = {}
+
+    def get(self, room_code: str) -> Optional[DecryptoGame]:
+        return self.rooms.get(room_code)
+
+    def put(self, room_code: str, game: DecryptoGame):
+        self.rooms[room_code] = game
+
+    def delete(self, room_code: str):
+        self.rooms.pop(room_code, None)
+
+    def codes(self) -> List[str]:
+        return list(self.rooms)
+
+    def __contains__(self, room_code: str) -> bool:
+        return room_code in self.rooms
+
+    @contextmanager
+    def edit(self, room_code: str) -> Iterator[Optional[DecryptoGame]]:
+        yield self.rooms.get(room_code)
+
+
+class SqliteRoomStorage(RoomStorage):
+    """
+    Общее хранилище в SQLite-файле: его видят все воркеры и инстансы на одном диске.
+    edit() держит запись заблокированной (BEGIN IMMEDIATE), пока комната меняется.
+    """
+
+    def __init__(self, path: str, game_factory: Callable[[dict], DecryptoGame]):
+        self.path = path
+        self.game_factory = game_factory
+        self._local = threading.local()
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS rooms ("
+                "code TEXT PRIMARY KEY, version INTEGER NOT NULL, data TEXT NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            self._local.db = db
+        return db
+
+    def _load(self, db: sqlite3.Connection, room_code: str) -> Optional[DecryptoGame]:
+        row = db.execute("SELECT data FROM rooms WHERE code = ?", (room_code,)).fetchone()
+        return self.game_factory(json.loads(row[0])) if row else None
+
+    def _save(self, db: sqlite3.Connection, game: DecryptoGame):
+        db.execute(
+            "INSERT OR REPLACE INTO rooms (code, version, data) VALUES (?, ?, ?)",
+            (game.room_code, game.version, json.dumps(game.to_snapshot(), ensure_ascii=False)),
+        )
+
+    def get(self, room_code: str) -> Optional[DecryptoGame]:
+        return self._load(self._connect(), room_code)
+
+    def put(self, room_code: str, game: DecryptoGame):
+        self._save(self._connect(), game)
+
+    def delete(self, room_code: str):
+        self._connect().execute("DELETE FROM rooms WHERE code = ?", (room_code,))
+
+    def codes(self) -> List[str]:
+        return [row[0] for row in self._connect().execute("SELECT code FROM rooms")]
+
+    def __contains__(self, room_code: str) -> bool:
+        db = self._connect()
+        return db.execute("SELECT 1 FROM rooms WHERE code = ?", (room_code,)).fetchone() is not None
+
+    @contextmanager
+    def edit(self, room_code: str) -> Iterator[Optional[DecryptoGame]]:
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            game = self._load(db, room_code)
+            version = game.version if game else None
+            yield game
+            if game is not None and game.version != version:
+                self._save(db, game)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+
+def create_storage(url: str, game_factory: Callable[[dict], DecryptoGame]) -> RoomStorage:
+    """memory (по умолчанию) или sqlite:///путь/к/файлу.db"""
+    if not url or url == "memory":
+        return MemoryRoomStorage()
+    if url.startswith("sqlite:///"):
+        return SqliteRoomStorage(url[len("sqlite:///"):], game_factory)
+    raise ValueError(f"Неизвестное хранилище комнат: {url}")
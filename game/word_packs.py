@@ -0,0 +1,77 @@
+import os
+import random
+from typing import Collection, Dict, List, Optional, Tuple
+
+WORDS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "words")
+DEFAULT_PACK = "default"
+
+
+class WordPack:
+    """Набор слов: неизменяемый кортеж без повторов, один на все комнаты"""
+
+    __slots__ = ("name", "words")
+
+    def __init__(self, name: str, words: Tuple[str, ...]):
+        self.name = name
+        self.words = words
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def deal(self, rng: random.Random, count: int, exclude: Collection[str] = ()) -> List[str]:
+        """
+        count разных слов выбором индексов, без копии и перемешивания набора.
+        Слова из exclude (например, прошлой партии) не выпадают, пока хватает остальных.
+        """
+        if len(self.words) - len(exclude) < count:
+            exclude = ()
+        picked: Dict[int, None] = {}
+        while len(picked) < count:
+            index = rng.randrange(len(self.words))
+            if index not in picked and self.words[index] not in exclude:
+                picked[index] = None
+        return [self.words[index] for index in picked]
+
+
+class WordPackStore:
+    """
+    Наборы слов из файлов <каталог>/<имя>.txt: одно слово на строку, # - комментарий.
+    Файл читается при первом обращении к набору и дальше общий для всех комнат.
+    """
+
+    def __init__(self, directory: str = WORDS_DIR):
+        self.directory = directory
+        self._packs: Dict[str, WordPack] = {}
+        self._names: Optional[List[str]] = None
+
+    def names(self) -> List[str]:
+        if self._names is None:
+            self._names = sorted(
+                name[:-len(".txt")] for name in os.listdir(self.directory) if name.endswith(".txt")
+            )
+        return self._names
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.names()
+
+    def get(self, name: str = DEFAULT_PACK) -> WordPack:
+        pack = self._packs.get(name)
+        if pack is None:
+            if name not in self:
+                raise KeyError(f"Неизвестный набор слов: {name}")
+            pack = self._packs[name] = self._load(name)
+        return pack
+
+    def _load(self, name: str) -> WordPack:
+        words: Dict[str, None] = {}
+        with open(os.path.join(self.directory, f"{name}.txt"), encoding="utf-8") as f:
+            for line in f:
+                word = line.strip()
+                if word and not word.startswith("#"):
+                    words[word] = None
+        if len(words) < 8:
+            raise ValueError(f"В наборе {name} меньше 8 слов")
+        return WordPack(name, tuple(words))
+
+
+word_packs = WordPackStore()
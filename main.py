@@ -1,155 +1,748 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi import Request
+from contextlib import asynccontextmanager
+import asyncio
 import json
+import logging
+import os
+import secrets
+import time
 import uuid
-from typing import Dict
-
-from game.room_manager import RoomManager
-from game.models import Team
-
-app = FastAPI(title="Decrypto Game")
+from typing import List, Optional
+
+from game.room_manager import RoomLimitError, RoomManager
+from game.profiling import profiler
+from game.journal import RoomJournal
+from game.archive import GameArchive, decode_cursor, encode_cursor
+from game.word_packs import word_packs
+from server.connections import ConnectionRegistry, Connection
+from server.views import ViewCache
+from server.codecs import negotiate, decode_frame
+from server.pubsub import create_pubsub
+from server.commands import (
+    CommandRouter, CreateRoom, JoinRoom, JoinTeam, StartGame, SubmitClue, RoundResult, Resync,
+    GetHistory, Resume, LeaveRoom,
+)
+from server.spectators import SpectatorHub
+from server.room_actor import RoomActors
+from server.logs import setup_logging, stop_logging
+from server.assets import Asset, AssetBundle, REVALIDATE
+from server.response_cache import ResponseCache
+from server import metrics, production
+
+# memory - один воркер; sqlite:///decrypto.db - общее состояние для нескольких воркеров
+STORAGE_URL = os.environ.get("DECRYPTO_STORAGE", "memory")
+# Шарды комнат по первому символу кода. Воркеры с общим DECRYPTO_CODE_SEED
+# и своим DECRYPTO_WORKER_INDEX выдают коды без пересечений
+SHARD_COUNT = int(os.environ.get("DECRYPTO_SHARDS", "4"))
+CODE_SEED = int(os.environ["DECRYPTO_CODE_SEED"]) if os.environ.get("DECRYPTO_CODE_SEED") else None
+WORKER_COUNT = int(os.environ.get("DECRYPTO_WORKER_COUNT", "1"))
+if os.environ.get("DECRYPTO_WORKER_INDEX"):
+    WORKER_INDEX = int(os.environ["DECRYPTO_WORKER_INDEX"])
+elif os.environ.get("DECRYPTO_WORKER_LOCKS") and WORKER_COUNT > 1 and __name__ != "__main__":
+    # Воркеры одного супервизора (--prod --workers N) разбирают номера сами;
+    # процесс-супервизор комнат не обслуживает и номер не занимает
+    WORKER_INDEX = production.claim_worker_slot(os.environ["DECRYPTO_WORKER_LOCKS"], WORKER_COUNT)
+else:
+    WORKER_INDEX = 0
+# Каталог журнала команд для восстановления комнат; пустая строка отключает журнал
+JOURNAL_DIR = os.environ.get("DECRYPTO_JOURNAL_DIR", "journal")
+# Архив законченных партий (пусто - не вести) и размер его сегмента;
+# /export/games отдает его только с DECRYPTO_EXPORT_TOKEN в Authorization: Bearer
+ARCHIVE_DIR = os.environ.get("DECRYPTO_ARCHIVE_DIR", "archive")
+ARCHIVE_SEGMENT_BYTES = int(os.environ.get("DECRYPTO_ARCHIVE_SEGMENT_BYTES", str(64 << 20)))
+EXPORT_TOKEN = os.environ.get("DECRYPTO_EXPORT_TOKEN")
+# Мест в комнате и сколько секунд ответы /rooms (каталога открытых комнат) живут в кэше
+ROOM_CAPACITY = int(os.environ.get("DECRYPTO_ROOM_CAPACITY", "16"))
+DIRECTORY_TTL = float(os.environ.get("DECRYPTO_DIRECTORY_TTL", "1"))
+
+# Сборщик комнат: интервал, время жизни брошенной и законченной комнаты (сек), лимит комнат
+REAP_INTERVAL = float(os.environ.get("DECRYPTO_REAP_INTERVAL", "30"))
+ROOM_IDLE_TTL = float(os.environ.get("DECRYPTO_ROOM_IDLE_TTL", "900"))
+FINISHED_ROOM_TTL = float(os.environ.get("DECRYPTO_FINISHED_ROOM_TTL", "300"))
+MAX_ROOMS = int(os.environ.get("DECRYPTO_MAX_ROOMS", "10000"))
+
+# Сколько секунд место оборвавшегося игрока ждет его переподключения
+SESSION_GRACE = float(os.environ.get("DECRYPTO_SESSION_GRACE", "60"))
+
+# Трансляция для зрителей: не больше RATE кадров в секунду, задержка DELAY секунд
+SPECTATOR_RATE = float(os.environ.get("DECRYPTO_SPECTATOR_RATE", "2"))
+SPECTATOR_DELAY = float(os.environ.get("DECRYPTO_SPECTATOR_DELAY", "0"))
+
+# Окно (сек), в которое изменения комнаты после первого собираются в одну рассылку
+COALESCE_WINDOW = float(os.environ.get("DECRYPTO_COALESCE_WINDOW", "0.005"))
+
+# Ограничение частоты команд: токенов в секунду и запас на соединение и на комнату
+CONN_COMMAND_RATE = float(os.environ.get("DECRYPTO_CONN_COMMAND_RATE", "10"))
+CONN_COMMAND_BURST = float(os.environ.get("DECRYPTO_CONN_COMMAND_BURST", "20"))
+ROOM_COMMAND_RATE = float(os.environ.get("DECRYPTO_ROOM_COMMAND_RATE", "30"))
+ROOM_COMMAND_BURST = float(os.environ.get("DECRYPTO_ROOM_COMMAND_BURST", "60"))
+
+# Живость подключений: ping после INTERVAL секунд тишины клиента, разрыв после TIMEOUT,
+# предел ожидания одной отправки и объема неотправленного (байт)
+HEARTBEAT_INTERVAL = float(os.environ.get("DECRYPTO_HEARTBEAT_INTERVAL", "15"))
+HEARTBEAT_TIMEOUT = float(os.environ.get("DECRYPTO_HEARTBEAT_TIMEOUT", "45"))
+SEND_TIMEOUT = float(os.environ.get("DECRYPTO_SEND_TIMEOUT", "10"))
+SEND_BACKLOG = int(os.environ.get("DECRYPTO_SEND_BACKLOG", str(1 << 20)))
+# Сколько секунд при остановке ждать, пока клиентам допишутся очереди
+DRAIN_TIMEOUT = float(os.environ.get("DECRYPTO_DRAIN_TIMEOUT", "10"))
+# Профилирование команд: /debug/profile доступен только с этим токеном в X-Debug-Token;
+# DECRYPTO_PROFILE=cpu или memory[:команда,команда] включает его сразу при старте
+DEBUG_TOKEN = os.environ.get("DECRYPTO_DEBUG_TOKEN")
+PROFILE = os.environ.get("DECRYPTO_PROFILE")
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+async def reap_rooms():
+    """Периодически удаляет брошенные и законченные комнаты"""
+    while True:
+        await asyncio.sleep(REAP_INTERVAL)
+        try:
+            reaped = room_manager.reap(room_abandoned, ROOM_IDLE_TTL, FINISHED_ROOM_TTL, MAX_ROOMS)
+        except Exception:
+            logger.exception("Ошибка сборщика комнат")
+            continue
+        if reaped:
+            logger.info("Сборщик удалил комнаты", extra={"count": len(reaped)})
+
+
+def room_abandoned(room_code: str) -> bool:
+    """В комнате нет ни одного подключения к этому процессу"""
+    return not connections.rooms.get(room_code)
+
+
+def forget_room(room_code: str):
+    """Комната удалена (сборщиком или вытеснением): освобождаем все, что на нее завязано"""
+    views.drop(room_code)
+    spectators.drop(room_code)
+    actors.drop(room_code)
+    router.drop_room(room_code)
+
+
+def room_restored(room_code: str, player_ids: List[str]):
+    """Комната поднята из журнала после рестарта: ее игроки вне сети, пока не вернутся по токену"""
+    for player_id in player_ids:
+        schedule_expiry(room_code, player_id)
+
+
+async def player_offline(room_code: str, player_id: str):
+    """Игрок остается в комнате и может вернуться по токену до конца льготного периода"""
+    if await actors.submit(room_code, "disconnect_player", player_id):
+        schedule_expiry(room_code, player_id)
+
+
+async def connection_lost(conn: Connection):
+    """Подключение закрылось или вытеснено"""
+    if conn.room_code:
+        await player_offline(conn.room_code, conn.player_id)
+
+
+async def drain(timeout: float):
+    """
+    Остановка сервера: новые входы в комнаты не принимаем, дописываем очереди
+    и закрываем сокеты с 1012 - клиенты вернутся по токену к другому воркеру
+    или к перезапущенному серверу
+    """
+    global draining
+    draining = True
+    await connections.drain(timeout, code=1012)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global ready
+    connections.start()
+    await pubsub.start()
+    if journal:
+        await journal.start()
+    if archive:
+        await archive.start()
+    reaper = asyncio.create_task(reap_rooms())
+    if PROFILE:
+        mode, _, commands = PROFILE.partition(":")
+        profiler.start(mode, [c for c in commands.split(",") if c])
+    production.on_drain(drain)
+    ready = True
+    yield
+    ready = False
+    profiler.stop()
+    reaper.cancel()
+    await connections.stop()
+    await actors.stop()
+    if journal:
+        await journal.stop()
+    if archive:
+        await archive.stop()
+    await pubsub.stop()
+    stop_logging()
+
+
+app = FastAPI(title="Decrypto Game", lifespan=lifespan)
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
-
-room_manager = RoomManager()
-connections: Dict[str, tuple] = {}
+# Статика с хэшем в адресе и главная страница собираются и сжимаются один раз при старте
+assets = AssetBundle("static", ("style.css", "script.js", "msgpack.js"))
+index_page = Asset(
+    templates.get_template("index.html").render(assets=assets, word_packs=word_packs.names()).encode(),
+    "text/html; charset=utf-8", REVALIDATE,
+)
+
+# Приложение запущено и не останавливается: по этим флагам отвечает /readyz
+ready = False
+draining = False
+
+journal = RoomJournal(JOURNAL_DIR) if JOURNAL_DIR else None
+archive = GameArchive(ARCHIVE_DIR, WORKER_INDEX, ARCHIVE_SEGMENT_BYTES) if ARCHIVE_DIR else None
+room_manager = RoomManager(STORAGE_URL, journal, shard_count=SHARD_COUNT, code_seed=CODE_SEED,
+                           worker_index=WORKER_INDEX, worker_count=WORKER_COUNT, archive=archive,
+                           room_capacity=ROOM_CAPACITY)
+directory_cache = ResponseCache(DIRECTORY_TTL)
+connections = ConnectionRegistry(send_timeout=SEND_TIMEOUT, max_backlog=SEND_BACKLOG,
+                                 heartbeat_interval=HEARTBEAT_INTERVAL, heartbeat_timeout=HEARTBEAT_TIMEOUT,
+                                 on_lost=connection_lost)
+views = ViewCache()
+# Отложенное удаление оборвавшихся игроков: (комната, игрок) -> таймер
+pending_expiry = {}
+spectators = SpectatorHub(SPECTATOR_RATE, SPECTATOR_DELAY)
+router = CommandRouter(connections, CONN_COMMAND_RATE, CONN_COMMAND_BURST,
+                       ROOM_COMMAND_RATE, ROOM_COMMAND_BURST)
+# Обновления комнат доходят до сокетов во всех воркерах
+pubsub = create_pubsub(STORAGE_URL)
+# Каждая комната - своя задача с очередью команд; рассылка одна на пачку изменений
+actors = RoomActors(room_manager.apply, pubsub.publish, room_manager.room_exists, COALESCE_WINDOW)
+
+room_manager.on_delete = forget_room
+room_manager.on_restore = room_restored
+
+metrics.ROOMS.source = room_manager.room_count
+metrics.CONNECTIONS.source = lambda: len(connections.connections)
+metrics.ROOMS_REAPED.source = lambda: room_manager.rooms_reaped
+metrics.BYTES_RECLAIMED.source = lambda: room_manager.bytes_reclaimed
+metrics.SPECTATORS.source = spectators.viewer_count
 
 
 @app.get("/", response_class=HTMLResponse)
 async def get_index(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    return index_page.response(request)
+
+
+@app.get("/assets/{name}")
+async def get_asset(name: str, request: Request):
+    return assets.response(name, request)
+
+
+@app.get("/healthz")
+async def healthz():
+    # Живость: цикл событий отвечает
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    # Готовность: балансировщик перестает слать трафик, как только начался дренаж
+    if not ready or draining:
+        return Response(status_code=503)
+    return {"status": "ready"}
+
+
+@app.get("/stats")
+async def get_stats():
+    return {
+        "rooms": room_manager.room_count(),
+        "connections": len(connections.connections),
+        "rooms_reaped": room_manager.rooms_reaped,
+        "bytes_reclaimed": room_manager.bytes_reclaimed,
+        "shards": room_manager.stats(),
+    }
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+
+def debug_allowed(request: Request) -> bool:
+    token = request.headers.get("x-debug-token", "")
+    return bool(DEBUG_TOKEN) and secrets.compare_digest(token, DEBUG_TOKEN)
+
+
+@app.get("/rooms")
+async def list_rooms(request: Request, filter: str = "waiting", cursor: str = "", limit: int = 20):
+    """
+    Каталог открытых комнат: filter - waiting (ждут игроков), spectatable (идет партия)
+    или all; cursor - поле next прошлой страницы. Ответ общий для всех клиентов
+    и кэшируется на DIRECTORY_TTL секунд.
+    """
+    limit = max(1, min(limit, 100))
+    key = (filter, cursor.upper(), limit)
+    cached = directory_cache.get(key)
+    if cached is None:
+        directory = room_manager.directory
+        try:
+            rooms, next_cursor = directory.page(filter, cursor.upper(), limit)
+        except KeyError:
+            return PlainTextResponse(f"Неизвестный фильтр: {filter}", status_code=400)
+        body = json.dumps({"rooms": rooms, "next": next_cursor, "total": directory.count(filter)},
+                          ensure_ascii=False, separators=(",", ":")).encode()
+        cached = (body, f'"{directory.version}"')
+        directory_cache.put(key, *cached)
+    body, etag = cached
+    headers = {"Cache-Control": f"public, max-age={int(DIRECTORY_TTL)}", "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+@app.get("/export/games")
+async def export_games(request: Request, since: Optional[float] = None, until: Optional[float] = None,
+                       pack: Optional[str] = None, cursor: str = "", limit: int = 10000):
+    """
+    Законченные партии из архива, NDJSON по партии на строку. Последняя строка -
+    {"cursor": ..., "done": ...}: с этим курсором запрос продолжает выгрузку,
+    done - архив на момент запроса прочитан целиком. since/until - unix-время
+    окончания партии, pack - набор слов.
+    """
+    if not archive or not EXPORT_TOKEN or not secrets.compare_digest(
+            request.headers.get("authorization", ""), f"Bearer {EXPORT_TOKEN}"):
+        return Response(status_code=404)
+    try:
+        position = decode_cursor(cursor)
+    except ValueError as e:
+        return PlainTextResponse(str(e), status_code=400)
+    limit = max(1, min(limit, 100000))
+
+    async def stream():
+        nonlocal position
+        remaining = limit
+        done = False
+        while remaining > 0 and not done:
+            # Файлы читаются в потоке небольшими страницами: память постоянна, цикл событий свободен
+            lines, position, done = await asyncio.to_thread(
+                archive.read, position, since, until, pack, min(remaining, 1000))
+            remaining -= len(lines)
+            if lines:
+                yield b"".join(lines)
+        yield (json.dumps({"cursor": encode_cursor(position), "done": done}) + "\n").encode()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson", headers={"Cache-Control": "no-store"})
+
+
+@app.get("/debug/profile")
+async def get_profile(request: Request, limit: int = 15, sort: str = "cumulative"):
+    if not debug_allowed(request):
+        return Response(status_code=404)
+    try:
+        return profiler.report(limit, sort)
+    except ValueError as e:
+        return PlainTextResponse(str(e), status_code=400)
+
+
+@app.post("/debug/profile")
+async def start_profile(request: Request, mode: str = "cpu", commands: str = ""):
+    """Включает профилирование; commands - типы команд через запятую (audience_state - сборка состояния)"""
+    if not debug_allowed(request):
+        return Response(status_code=404)
+    try:
+        profiler.start(mode, [c for c in commands.split(",") if c])
+    except ValueError as e:
+        return PlainTextResponse(str(e), status_code=400)
+    return profiler.report()
+
+
+@app.delete("/debug/profile")
+async def stop_profile(request: Request, limit: int = 15, sort: str = "cumulative"):
+    if not debug_allowed(request):
+        return Response(status_code=404)
+    profiler.stop()
+    try:
+        return profiler.report(limit, sort)
+    except ValueError as e:
+        return PlainTextResponse(str(e), status_code=400)
 
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
+    codec, subprotocol = negotiate(websocket)
+    await websocket.accept(subprotocol=subprotocol)
+    if draining:
+        await websocket.close(code=1012)
+        return
     connection_id = str(uuid.uuid4())
-    print(f"Новое подключение: {connection_id}")
+    conn = connections.register(connection_id, websocket, codec)
+    logger.debug("Новое подключение", extra={"conn": connection_id, "codec": codec.name})
 
     try:
         while True:
-            data = await websocket.receive_text()
-            print(f"Получено от {connection_id}: {data}")
-            message = json.loads(data)
-            await handle_message(connection_id, websocket, message)
+            data = await websocket.receive()
+            if data["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(data.get("code", 1000))
+            connections.touch(conn)
+            if not router.admit(conn):
+                continue
+            try:
+                message = decode_frame(data)
+            except ValueError:
+                # Битый JSON или msgpack: отвечаем ошибкой и читаем дальше
+                router.invalid(conn)
+                continue
+            if not isinstance(message, dict):
+                router.invalid(conn)
+                continue
+            msg_type = message.get("type")
+            if msg_type == "pong":
+                continue
+            # type может оказаться списком или словарем - в метки метрик идут только известные
+            label = msg_type if isinstance(msg_type, str) and msg_type in router.handlers else "unknown"
+            metrics.MESSAGES.inc(label)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Получено сообщение", extra={"conn": connection_id, "type": msg_type})
+            with metrics.HANDLER_SECONDS.time(label):
+                await router.dispatch(conn, message)
 
     except WebSocketDisconnect:
-        print(f"Отключение: {connection_id}")
-        if connection_id in connections:
-            _, room_code, player_id = connections[connection_id]
-            room = room_manager.get_room(room_code)
-            if room:
-                room.remove_player(player_id)
-                await broadcast_room_state(room_code)
-            del connections[connection_id]
-
-    except Exception as e:
-        print(f"Ошибка {connection_id}: {e}")
-        if connection_id in connections:
-            del connections[connection_id]
-
-
-async def handle_message(conn_id: str, websocket: WebSocket, message: dict):
-    msg_type = message.get("type")
-    print(f"Обработка типа: {msg_type}")
-
-    if msg_type == "create_room":
-        room_code = room_manager.create_room()
-        await websocket.send_json({
-            "type": "room_created",
-            "room_code": room_code
-        })
+        logger.debug("Отключение", extra={"conn": connection_id})
+        # Вытесненное реестром подключение уже обработано
+        if connections.unregister(connection_id) is not None:
+            await connection_lost(conn)
 
-    elif msg_type == "join_room":
-        room_code = message.get("room_code", "").upper()
-        nickname = message.get("nickname", "Anonymous")
+    except Exception:
+        logger.exception("Ошибка соединения", extra={"conn": connection_id})
+        if connections.unregister(connection_id) is not None:
+            await connection_lost(conn)
 
-        if not room_manager.room_exists(room_code):
-            await websocket.send_json({
-                "type": "error",
-                "message": "Комната не найдена"
-            })
-            return
 
-        room = room_manager.get_room(room_code)
-        player_id = str(uuid.uuid4())
-        player = room.add_player(player_id, nickname)
+@app.websocket("/spectate/{room_code}/ws")
+async def spectate_ws(websocket: WebSocket, room_code: str):
+    room = room_manager.get_room(room_code)
+    if not room:
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+    feed = spectators.feed(room)
+    subscriber = feed.subscribe()
+
+    async def watch_disconnect():
+        # Зритель ничего не шлет; ждем только закрытия сокета
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+        subscriber.push(None)
+
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        version = -1
+        while True:
+            frame = await subscriber.next(version)
+            if frame is None:
+                break
+            await websocket.send_text(frame.json)
+            version = frame.version
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        watcher.cancel()
+        spectators.release(feed, subscriber)
+
+
+@app.get("/spectate/{room_code}/events")
+async def spectate_events(request: Request, room_code: str):
+    room = room_manager.get_room(room_code)
+    if not room:
+        return Response(status_code=404)
+    feed = spectators.feed(room)
+    subscriber = feed.subscribe()
+    last_id = request.headers.get("last-event-id", "")
+    version = int(last_id) if last_id.isdigit() else -1
+
+    async def stream():
+        nonlocal version
+        try:
+            while True:
+                frame = await subscriber.next(version, timeout=15)
+                if frame is None:
+                    if subscriber.closed:
+                        break
+                    yield ": ping\n\n"
+                    continue
+                yield frame.sse
+                version = frame.version
+        finally:
+            spectators.release(feed, subscriber)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/spectate/{room_code}/poll")
+async def spectate_poll(room_code: str, since: int = -1, timeout: float = 25):
+    """Long-poll: ответ сразу, если есть версия новее since, иначе ждем до timeout секунд"""
+    room = room_manager.get_room(room_code)
+    if not room:
+        return Response(status_code=404)
+    feed = spectators.feed(room)
+    subscriber = feed.subscribe()
+    try:
+        frame = await subscriber.next(since, timeout=min(timeout, 25))
+    finally:
+        spectators.release(feed, subscriber)
+    if frame is None:
+        return Response(status_code=204)
+    # Ответ зависит и от времени (новые кадры, задержка трансляции): прокси держит его
+    # не дольше секунды, ETag - версия кадра
+    return Response(frame.json, media_type="application/json",
+                    headers={"Cache-Control": "public, max-age=1", "ETag": f'"{frame.version}"'})
+
+
+def schedule_expiry(room_code: str, player_id: str):
+    """Через SESSION_GRACE убирает игрока, если он так и не переподключился"""
+    async def expire():
+        pending_expiry.pop((room_code, player_id), None)
+        await actors.submit(room_code, "expire_player", player_id)
+
+    loop = asyncio.get_running_loop()
+    cancel_expiry(room_code, player_id)
+    pending_expiry[(room_code, player_id)] = loop.call_later(SESSION_GRACE, lambda: asyncio.create_task(expire()))
+
+
+def cancel_expiry(room_code: str, player_id: str):
+    handle = pending_expiry.pop((room_code, player_id), None)
+    if handle:
+        handle.cancel()
+
+
+def reject_draining(conn: Connection) -> bool:
+    """Во время остановки новых комнат и игроков не принимаем"""
+    if draining:
+        connections.send(conn, {
+            "type": "error",
+            "code": "draining",
+            "message": "Сервер перезапускается, попробуйте через минуту"
+        })
+    return draining
 
-        connections[conn_id] = (websocket, room_code, player_id)
 
-        await websocket.send_json({
-            "type": "joined",
-            "player_id": player_id,
-            "room_code": room_code,
-            "nickname": nickname
+@router.command("create_room")
+async def create_room(conn: Connection, command: CreateRoom):
+    if reject_draining(conn):
+        return
+    try:
+        room_code = room_manager.create_room(command.pack, command.public, MAX_ROOMS, room_abandoned)
+    except KeyError:
+        connections.send(conn, {
+            "type": "error",
+            "message": "Неизвестный набор слов"
         })
+        return
+    except RoomLimitError:
+        connections.send(conn, {
+            "type": "error",
+            "code": "room_limit",
+            "message": "Сервер переполнен, попробуйте позже"
+        })
+        return
+    connections.send(conn, {
+        "type": "room_created",
+        "room_code": room_code
+    })
 
-        await broadcast_room_state(room_code)
 
-    elif msg_type == "join_team":
-        room_code = message.get("room_code")
-        player_id = message.get("player_id")
-        team = Team(message.get("team"))
+@router.command("join_room")
+async def join_room(conn: Connection, command: JoinRoom):
+    if reject_draining(conn):
+        return
+    room_code = command.room_code.upper()
+    player_id = str(uuid.uuid4())
+    secret = secrets.token_urlsafe(16)
+    previous = conn.room_code, conn.player_id
+
+    # Места проверяются в самой команде актора: одновременные входы не переполнят комнату
+    if not await actors.submit(room_code, "add_player", player_id, command.nickname, secret, ROOM_CAPACITY):
+        if room_manager.room_exists(room_code):
+            connections.send(conn, {
+                "type": "error",
+                "code": "room_full",
+                "message": "Комната заполнена"
+            })
+        else:
+            connections.send(conn, {
+                "type": "error",
+                "message": "Комната не найдена"
+            })
+        return
 
-        room = room_manager.get_room(room_code)
-        if room:
-            room.join_team(player_id, team)
-            await broadcast_room_state(room_code)
+    connections.bind(conn.id, room_code, player_id)
 
-    elif msg_type == "start_game":
-        room_code = message.get("room_code")
-        room = room_manager.get_room(room_code)
-        if room and room.start_game():
-            await broadcast_room_state(room_code)
+    connections.send(conn, {
+        "type": "joined",
+        "player_id": player_id,
+        "room_code": room_code,
+        "nickname": command.nickname,
+        # С токеном клиент возвращается на свое место после обрыва
+        "token": f"{room_code}.{player_id}.{secret}"
+    })
 
-    elif msg_type == "submit_clue":
-        room_code = message.get("room_code")
-        player_id = message.get("player_id")
-        clue_words = message.get("clue_words", [])
+    # Рассылка актора могла уйти до привязки - новичку состояние отдаем сами
+    room = room_manager.get_room(room_code)
+    if room:
+        send_state(conn, room)
+    # Подключение было привязано к другому игроку - тот теперь без подключения
+    if previous[0]:
+        await player_offline(*previous)
+
+
+def bound_to(conn: Connection, command) -> bool:
+    """
+    Команда внутри комнаты: только от вошедшего подключения и только для его
+    комнаты и его игрока. Иначе - ошибка invalid.
+    """
+    room_code = getattr(command, "room_code", None)
+    player_id = getattr(command, "player_id", None)
+    if (not conn.room_code
+            or (room_code is not None and room_code.upper() != conn.room_code)
+            or (player_id is not None and player_id != conn.player_id)):
+        router.invalid(conn)
+        return False
+    return True
+
+
+@router.command("join_team")
+async def join_team(conn: Connection, command: JoinTeam):
+    if bound_to(conn, command):
+        await actors.submit(conn.room_code, "join_team", conn.player_id, command.team.value)
+
+
+@router.command("start_game")
+async def start_game(conn: Connection, command: StartGame):
+    if bound_to(conn, command):
+        await actors.submit(conn.room_code, "start_game")
+
+
+@router.command("submit_clue")
+async def submit_clue(conn: Connection, command: SubmitClue):
+    if bound_to(conn, command):
+        await actors.submit(conn.room_code, "submit_clue", conn.player_id, command.clue_words)
+
+
+@router.command("round_result")
+async def round_result(conn: Connection, command: RoundResult):
+    if bound_to(conn, command):
+        await actors.submit(conn.room_code, "handle_round_result", conn.player_id, command.result)
+
+
+@router.command("resync")
+async def resync(conn: Connection, command: Resync):
+    # Клиент потерял версию - отправляем ему полный снимок
+    room = room_manager.get_room(conn.room_code) if conn.room_code else None
+    if room:
+        conn.audience = None
+        send_state(conn, room)
+
+
+@router.command("get_history")
+async def get_history(conn: Connection, command: GetHistory):
+    # Страница истории раундов: в состоянии приходят только последние раунды
+    room = room_manager.get_room(conn.room_code) if conn.room_code else None
+    if room:
+        connections.send(conn, {
+            "type": "history",
+            "offset": command.offset,
+            "history_seq": room.history_seq,
+            "rows": room.history_rows(command.offset, command.offset + command.limit),
+        })
 
-        room = room_manager.get_room(room_code)
-        if room and room.submit_clue(player_id, clue_words):
-            await broadcast_room_state(room_code)
 
-    elif msg_type == "round_result":
-        print(f"!!! ПОЛУЧЕН РЕЗУЛЬТАТ РАУНДА: {message}")
-        room_code = message.get("room_code")
-        player_id = message.get("player_id")
-        result = message.get("result")
+@router.command("resume")
+async def resume(conn: Connection, command: Resume):
+    parts = command.token.split(".")
+    player = room = None
+    if len(parts) == 3:
+        room_code, player_id, secret = parts
+        player = await actors.submit(room_code, "reconnect_player", player_id, secret)
+        # Комнату могли удалить сразу после возврата игрока
+        room = room_manager.get_room(room_code) if player is not None else None
+    if room is None:
+        connections.send(conn, {
+            "type": "error",
+            "code": "resume_failed",
+            "message": "Сессия истекла, войдите в комнату заново"
+        })
+        return
 
-        room = room_manager.get_room(room_code)
-        if room:
-            room.handle_round_result(player_id, result)
-            await broadcast_room_state(room_code)
+    previous = conn.room_code, conn.player_id
+    cancel_expiry(room_code, player_id)
+    connections.bind(conn.id, room_code, player_id)
+    connections.take_over(conn)
+    connections.send(conn, {
+        "type": "resumed",
+        "player_id": player_id,
+        "room_code": room_code,
+        "nickname": player.nickname
+    })
+
+    # Только то, что клиент пропустил; остальным актор разошлет патч с его присутствием
+    for frame in views.for_room(room_code).replay(conn, room, command.version):
+        if frame is not None:
+            connections.send(conn, frame)
+    if previous[0] and previous != (room_code, player_id):
+        await player_offline(*previous)
+
+
+@router.command("leave_room")
+async def leave_room(conn: Connection, command: LeaveRoom):
+    room_code, player_id = conn.room_code, conn.player_id
+    if not room_code:
+        return
+    connections.unbind(conn.id)
+    cancel_expiry(room_code, player_id)
+    await actors.submit(room_code, "remove_player", player_id)
 
 
 async def broadcast_room_state(room_code: str):
     room = room_manager.get_room(room_code)
     if not room:
         return
+    if room_manager.is_shared:
+        # Комнату мог изменить другой воркер - его каталог уже обновлен, наш нет
+        room_manager.directory.update(room)
 
-    print(f"Расслылка состояния для комнаты {room_code}")
+    # Только подключения этой комнаты; сами отправки идут параллельно в задачах-писателях
+    started = time.perf_counter()
+    room_connections = connections.room_connections(room_code)
+    for conn in room_connections:
+        send_state(conn, room)
+    metrics.BROADCAST_SECONDS.observe(time.perf_counter() - started)
+    metrics.BROADCAST_FANOUT.observe(len(room_connections))
+    # Зрителям кадр соберется отдельно и с прореживанием
+    spectators.notify(room)
 
-    for conn_id, (ws, conn_room, player_id) in list(connections.items()):
-        if conn_room == room_code:
-            try:
-                player_state = room.get_state_for_player(player_id)
-                await ws.send_json({
-                    "type": "state_update",
-                    "state": player_state,
-                    "your_player_id": player_id
-                })
-                print(f"Состояние отправлено игроку {player_id}")
-            except Exception as e:
-                print(f"Ошибка отправки {conn_id}: {e}")
-                if conn_id in connections:
-                    del connections[conn_id]
+
+def send_state(conn: Connection, room):
+    """Отправляет игроку патч относительно его последней версии или полный снимок"""
+    data = views.for_room(room.room_code).frame_for(conn, room)
+    if data is not None:
+        connections.send(conn, data)
+
+
+pubsub.subscribe(broadcast_room_state)
 
 
 if __name__ == "__main__":
+    import argparse
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+
+    parser = argparse.ArgumentParser(description="Сервер Decrypto")
+    parser.add_argument("--prod", action="store_true", help="боевой режим: без перезагрузки, несколько воркеров, дренаж")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", "1")))
+    args = parser.parse_args()
+
+    if args.prod:
+        production.run("main:app", args.host, args.port, args.workers, DRAIN_TIMEOUT)
+    else:
+        uvicorn.run("main:app", host=args.host, port=args.port, reload=True)
\ No newline at end of file
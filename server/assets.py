@@ -0,0 +1,92 @@
+"""
+Статика, подготовленная при старте: файлы читаются и сжимаются один раз,
+отдаются по адресам с хэшем содержимого (кэш навсегда, immutable) и с ETag.
+Страница без хэша в адресе (index.html) перепроверяется по ETag.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+from typing import Dict, Iterable
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+# Меньше этого сжатие не окупается
+MIN_COMPRESS = 512
+
+
+def _accepted(header: str) -> set:
+    encodings = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        encodings.add(name.strip().lower())
+    return encodings
+
+
+class Asset:
+    """Готовый ответ: тело без сжатия и сжатые варианты, ETag по содержимому"""
+
+    __slots__ = ("media_type", "cache_control", "digest", "bodies")
+
+    def __init__(self, content: bytes, media_type: str, cache_control: str = IMMUTABLE):
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.digest = hashlib.sha256(content).hexdigest()[:16]
+        self.bodies: Dict[str, bytes] = {"identity": content}
+        if len(content) >= MIN_COMPRESS:
+            if brotli is not None:
+                self.bodies["br"] = brotli.compress(content, quality=11)
+            self.bodies["gzip"] = gzip.compress(content, 9, mtime=0)
+
+    def response(self, request: Request) -> Response:
+        headers = {"Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+        if self.digest in request.headers.get("if-none-match", ""):
+            headers["ETag"] = f'"{self.digest}"'
+            return Response(status_code=304, headers=headers)
+
+        accepted = _accepted(request.headers.get("accept-encoding", ""))
+        encoding = next((e for e in ("br", "gzip") if e in self.bodies and e in accepted), "identity")
+        if encoding == "identity":
+            headers["ETag"] = f'"{self.digest}"'
+        else:
+            # У каждого представления свой сильный ETag
+            headers["ETag"] = f'"{self.digest}-{encoding}"'
+            headers["Content-Encoding"] = encoding
+        return Response(self.bodies[encoding], media_type=self.media_type, headers=headers)
+
+
+class AssetBundle:
+    """Файлы каталога по адресам prefix/<имя>.<хэш>.<расширение>"""
+
+    def __init__(self, directory: str, names: Iterable[str], prefix: str = "/assets"):
+        self.prefix = prefix
+        self.assets: Dict[str, Asset] = {}
+        self.urls: Dict[str, str] = {}
+        for name in names:
+            with open(os.path.join(directory, name), "rb") as f:
+                content = f.read()
+            media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            asset = Asset(content, media_type)
+            stem, ext = os.path.splitext(name)
+            hashed = f"{stem}.{asset.digest[:12]}{ext}"
+            self.assets[hashed] = asset
+            self.urls[name] = f"{prefix}/{hashed}"
+
+    def url(self, name: str) -> str:
+        return self.urls[name]
+
+    def response(self, hashed_name: str, request: Request) -> Response:
+        asset = self.assets.get(hashed_name)
+        if asset is None:
+            return Response(status_code=404)
+        return asset.response(request)
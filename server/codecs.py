@@ -0,0 +1,97 @@
+import json
+import struct
+from typing import Optional
+
+from fastapi import WebSocket
+
+# Оба ускорителя необязательны: без них работает обычный json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class JsonCodec:
+    """JSON в текстовых кадрах; orjson, если установлен"""
+
+    name = "json"
+    subprotocol = "decrypto.json"
+
+    if orjson is not None:
+        @staticmethod
+        def encode(value) -> str:
+            return orjson.dumps(value).decode()
+
+        @staticmethod
+        def decode(data):
+            return orjson.loads(data)
+    else:
+        @staticmethod
+        def encode(value) -> str:
+            return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+        @staticmethod
+        def decode(data):
+            return json.loads(data)
+
+    @classmethod
+    def frame(cls, *parts) -> str:
+        """Собирает объект из уже закодированных значений: frame(("type", '"x"'), ...)"""
+        return "{" + ",".join(cls.encode(key) + ":" + value for key, value in parts) + "}"
+
+
+class MsgpackCodec:
+    """MessagePack в бинарных кадрах: меньше кадр для кодов и счетчиков"""
+
+    name = "msgpack"
+    subprotocol = "decrypto.msgpack"
+
+    @staticmethod
+    def encode(value) -> bytes:
+        return msgpack.packb(value, use_bin_type=True)
+
+    @staticmethod
+    def decode(data):
+        return msgpack.unpackb(data, raw=False)
+
+    @classmethod
+    def frame(cls, *parts) -> bytes:
+        # Заголовок map и подряд идущие пары ключ-значение - это валидный msgpack
+        size = len(parts)
+        header = bytes([0x80 | size]) if size < 16 else b"\xde" + struct.pack(">H", size)
+        return header + b"".join(cls.encode(key) + value for key, value in parts)
+
+
+CODECS = {codec.subprotocol: codec for codec in (JsonCodec, MsgpackCodec)
+          if codec is not MsgpackCodec or msgpack is not None}
+DEFAULT_CODEC = JsonCodec
+
+
+def negotiate(websocket: WebSocket):
+    """
+    Выбирает кодировку: по подпротоколу (в порядке предпочтения клиента)
+    или по ?encoding=msgpack. Возвращает (кодек, подпротокол для accept).
+    """
+    for subprotocol in websocket.scope.get("subprotocols") or []:
+        if subprotocol in CODECS:
+            return CODECS[subprotocol], subprotocol
+
+    requested = websocket.query_params.get("encoding")
+    for codec in CODECS.values():
+        if codec.name == requested:
+            return codec, None
+    return DEFAULT_CODEC, None
+
+
+def decode_frame(message: dict) -> Optional[dict]:
+    """Входящий кадр: текст всегда JSON, бинарный - msgpack"""
+    if message.get("text") is not None:
+        return JsonCodec.decode(message["text"])
+    if message.get("bytes") is not None and msgpack is not None:
+        return MsgpackCodec.decode(message["bytes"])
+    return None
@@ -0,0 +1,176 @@
+"""
+Входящие команды: схемы, проверка и диспетчеризация.
+Валидатор объединения всех команд строится один раз при импорте,
+разбор сообщения выбирает схему по полю type.
+"""
+from typing import Annotated, Awaitable, Callable, Dict, List, Literal, Optional, Union
+
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+
+from game.models import Team
+from game.word_packs import DEFAULT_PACK
+from .metrics import COMMANDS_REJECTED
+from .rate_limit import TokenBucket
+
+RoomCode = Annotated[str, Field(min_length=1, max_length=16)]
+PlayerId = Annotated[str, Field(min_length=1, max_length=64)]
+ClueWord = Annotated[str, Field(max_length=64)]
+
+
+class CreateRoom(BaseModel):
+    type: Literal["create_room"]
+    pack: Annotated[str, Field(max_length=32)] = DEFAULT_PACK
+    # Показывать комнату в общем каталоге
+    public: bool = False
+
+
+class JoinRoom(BaseModel):
+    type: Literal["join_room"]
+    room_code: RoomCode
+    nickname: Annotated[str, Field(max_length=32)] = "Anonymous"
+
+
+# Команды внутри комнаты действуют от имени подключения (комната и игрок из join_room
+# или resume). room_code и player_id в сообщении необязательны, но если пришли -
+# должны с ним совпадать.
+
+class JoinTeam(BaseModel):
+    type: Literal["join_team"]
+    room_code: Optional[RoomCode] = None
+    player_id: Optional[PlayerId] = None
+    team: Team
+
+
+class StartGame(BaseModel):
+    type: Literal["start_game"]
+    room_code: Optional[RoomCode] = None
+
+
+class SubmitClue(BaseModel):
+    type: Literal["submit_clue"]
+    room_code: Optional[RoomCode] = None
+    player_id: Optional[PlayerId] = None
+    clue_words: Annotated[List[ClueWord], Field(min_length=3, max_length=3)]
+
+
+class RoundResult(BaseModel):
+    type: Literal["round_result"]
+    room_code: Optional[RoomCode] = None
+    player_id: Optional[PlayerId] = None
+    result: Literal["own_team_guessed", "own_team_not_guessed", "enemy_team_guessed"]
+
+
+class Resync(BaseModel):
+    type: Literal["resync"]
+
+
+class GetHistory(BaseModel):
+    type: Literal["get_history"]
+    # Номер первого раунда страницы в порядке игры (с нуля)
+    offset: Annotated[int, Field(ge=0)] = 0
+    limit: Annotated[int, Field(ge=1, le=100)] = 50
+
+
+class Resume(BaseModel):
+    type: Literal["resume"]
+    token: Annotated[str, Field(max_length=128)]
+    # Последняя версия состояния, которую клиент успел получить
+    version: Optional[int] = None
+
+
+class LeaveRoom(BaseModel):
+    type: Literal["leave_room"]
+
+
+Command = Annotated[
+    Union[CreateRoom, JoinRoom, JoinTeam, StartGame, SubmitClue, RoundResult, Resync, GetHistory,
+          Resume, LeaveRoom],
+    Field(discriminator="type"),
+]
+COMMAND_ADAPTER = TypeAdapter(Command)
+
+ERRORS = {
+    "invalid": "Некорректная команда",
+    "rate_limited": "Слишком много запросов, подождите",
+}
+
+Handler = Callable[..., Awaitable[None]]
+
+
+class CommandRouter:
+    """
+    Таблица обработчиков по типу команды с ограничением частоты:
+    ведро токенов на соединение (admit, до разбора кадра) и на комнату.
+    Отклоненные команды получают заранее закодированный ответ об ошибке.
+    """
+
+    def __init__(self, connections, conn_rate: float, conn_burst: float,
+                 room_rate: float, room_burst: float):
+        self.connections = connections
+        self.handlers: Dict[str, Handler] = {}
+        self.conn_rate = conn_rate
+        self.conn_burst = conn_burst
+        self.room_rate = room_rate
+        self.room_burst = room_burst
+        self.room_buckets: Dict[str, TokenBucket] = {}
+        self._error_frames: Dict[tuple, object] = {}
+
+    def command(self, msg_type: str):
+        def decorator(handler: Handler) -> Handler:
+            self.handlers[msg_type] = handler
+            return handler
+        return decorator
+
+    def admit(self, conn) -> bool:
+        """
+        Списывает токен соединения за принятый кадр - до разбора, так что битые
+        кадры, не-команды и pong тоже расходуют ведро. False - кадр отбросить.
+        """
+        if conn.bucket is None:
+            conn.bucket = TokenBucket(self.conn_rate, self.conn_burst)
+        if not conn.bucket.allow():
+            self._throttled(conn)
+            return False
+        return True
+
+    async def dispatch(self, conn, message: dict):
+        """Кадр уже прошел admit"""
+        try:
+            command = COMMAND_ADAPTER.validate_python(message)
+        except ValidationError:
+            self.invalid(conn)
+            return
+
+        # Ведро комнаты - только для вошедших: коды из сообщений не должны плодить ведра
+        room_code = conn.room_code
+        if room_code:
+            bucket = self.room_buckets.get(room_code)
+            if bucket is None:
+                bucket = self.room_buckets[room_code] = TokenBucket(self.room_rate, self.room_burst)
+            if not bucket.allow():
+                self._throttled(conn)
+                return
+
+        await self.handlers[command.type](conn, command)
+
+    def invalid(self, conn):
+        """Кадр не разобрался или команда не проходит проверку"""
+        COMMANDS_REJECTED.inc("invalid")
+        self._reply_error(conn, "invalid")
+
+    def drop_room(self, room_code: str):
+        self.room_buckets.pop(room_code, None)
+
+    def _throttled(self, conn):
+        COMMANDS_REJECTED.inc("rate_limited")
+        if not conn.bucket.notified:
+            conn.bucket.notified = True
+            self._reply_error(conn, "rate_limited")
+
+    def _reply_error(self, conn, code: str):
+        key = (code, conn.codec.name)
+        frame = self._error_frames.get(key)
+        if frame is None:
+            frame = self._error_frames[key] = conn.codec.encode(
+                {"type": "error", "code": code, "message": ERRORS[code]})
+        self.connections.send(conn, frame)
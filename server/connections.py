@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Union
+
+from fastapi import WebSocket
+
+from .codecs import DEFAULT_CODEC
+from .metrics import SEND_FAILURES
+
+logger = logging.getLogger(__name__)
+
+
+class Connection:
+    """Одно websocket-подключение со своей очередью исходящих сообщений"""
+
+    __slots__ = ("id", "websocket", "codec", "room_code", "player_id", "queue", "writer", "reader",
+                 "audience", "version", "me", "bucket", "last_seen", "backlog", "lost")
+
+    def __init__(self, conn_id: str, websocket: WebSocket, codec, queue_size: int):
+        self.id = conn_id
+        self.websocket = websocket
+        self.codec = codec
+        self.room_code: Optional[str] = None
+        self.player_id: Optional[str] = None
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.writer: Optional[asyncio.Task] = None
+        # Задача, которая читает сокет (обработчик подключения)
+        self.reader: Optional[asyncio.Task] = None
+        # Когда от клиента приходил последний кадр (time.monotonic)
+        self.last_seen = time.monotonic()
+        # Байт в очереди на отправку
+        self.backlog = 0
+        # Подключение уже выведено из реестра
+        self.lost = False
+        # Что клиент уже получил: аудитория, версия и персональные поля
+        self.audience = None
+        self.version = -1
+        self.me: Optional[dict] = None
+        # Ограничение частоты команд, создается роутером
+        self.bucket = None
+
+
+class ConnectionRegistry:
+    """
+    Реестр подключений, проиндексированный по коду комнаты.
+    Каждое подключение пишет в сокет из собственной задачи, поэтому
+    медленный клиент не задерживает ни рассылку, ни обработчик команды.
+
+    Живость: клиент, от которого ничего не приходило heartbeat_interval секунд,
+    получает ping; молчащий дольше heartbeat_timeout, зависший на отправке
+    дольше send_timeout или накопивший в очереди больше max_backlog байт
+    вытесняется. Вытесненное подключение сразу уходит из реестра, а on_lost
+    отмечает игрока отключившимся, не дожидаясь, пока мертвый сокет закроется.
+    """
+
+    def __init__(self, queue_size: int = 64, send_timeout: float = 10.0, max_backlog: int = 1 << 20,
+                 heartbeat_interval: float = 15.0, heartbeat_timeout: float = 45.0,
+                 on_lost: Optional[Callable[[Connection], Awaitable[None]]] = None):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.max_backlog = max_backlog
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.on_lost = on_lost
+        self.connections: Dict[str, Connection] = {}
+        self.rooms: Dict[str, Dict[str, Connection]] = {}
+        self._heartbeat: Optional[asyncio.Task] = None
+        # Задачи закрытия сокетов и on_lost - их дожидается дренаж
+        self._closing: Set[asyncio.Task] = set()
+
+    def start(self):
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self):
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            await asyncio.gather(self._heartbeat, return_exceptions=True)
+
+    async def drain(self, timeout: float, code: int = 1012):
+        """Остановка сервера: дает очередям дописаться и закрывает все подключения с code"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while any(conn.backlog for conn in self.connections.values()) and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        for conn in list(self.connections.values()):
+            self._drop(conn, code)
+        if self._closing:
+            await asyncio.wait(self._closing, timeout=max(deadline - loop.time(), 0.1))
+
+    def register(self, conn_id: str, websocket: WebSocket, codec=DEFAULT_CODEC) -> Connection:
+        """Регистрирует подключение; вызывается из задачи, которая будет читать сокет"""
+        conn = Connection(conn_id, websocket, codec, self.queue_size)
+        conn.reader = asyncio.current_task()
+        conn.writer = asyncio.create_task(self._writer(conn))
+        self.connections[conn_id] = conn
+        return conn
+
+    @staticmethod
+    def touch(conn: Connection):
+        """От клиента пришел кадр - он жив"""
+        conn.last_seen = time.monotonic()
+
+    def get(self, conn_id: str) -> Optional[Connection]:
+        return self.connections.get(conn_id)
+
+    def bind(self, conn_id: str, room_code: str, player_id: str):
+        """Привязывает подключение к игроку в комнате"""
+        conn = self.connections[conn_id]
+        self._detach(conn)
+        conn.room_code = room_code
+        conn.player_id = player_id
+        conn.audience = None
+        self.rooms.setdefault(room_code, {})[conn_id] = conn
+
+    def unbind(self, conn_id: str):
+        conn = self.connections[conn_id]
+        self._detach(conn)
+        conn.room_code = None
+        conn.player_id = None
+        conn.audience = None
+
+    def take_over(self, conn: Connection):
+        """
+        Закрывает прежние подключения того же игрока: клиент переподключился
+        раньше, чем сервер заметил обрыв старого сокета
+        """
+        for other in self.room_connections(conn.room_code):
+            if other is not conn and other.player_id == conn.player_id:
+                self.unbind(other.id)
+                self._drop(other, code=4000)
+
+    def room_connections(self, room_code: str) -> List[Connection]:
+        return list(self.rooms.get(room_code, {}).values())
+
+    def unregister(self, conn_id: str) -> Optional[Connection]:
+        """Убирает подключение; None - его уже убрали (например, вытеснили)"""
+        conn = self.connections.pop(conn_id, None)
+        if conn is None:
+            return None
+        conn.lost = True
+        self._detach(conn)
+        if conn.writer and conn.writer is not asyncio.current_task():
+            conn.writer.cancel()
+        return conn
+
+    def send(self, conn: Connection, message: Union[dict, str, bytes]) -> bool:
+        """Ставит сообщение в очередь; переполненную очередь считаем зависшим клиентом"""
+        if conn.lost:
+            return False
+        if isinstance(message, dict):
+            message = conn.codec.encode(message)
+        if conn.backlog + len(message) > self.max_backlog:
+            self._evict(conn, "backlog")
+            return False
+        try:
+            conn.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self._evict(conn, "queue_full")
+            return False
+        conn.backlog += len(message)
+        return True
+
+    def _evict(self, conn: Connection, reason: str, code: int = 1013):
+        SEND_FAILURES.inc(reason)
+        logger.warning("Вытесняем подключение",
+                       extra={"conn": conn.id, "reason": reason, "backlog": conn.backlog})
+        self._drop(conn, code)
+
+    def _detach(self, conn: Connection):
+        if conn.room_code is None:
+            return
+        members = self.rooms.get(conn.room_code)
+        if members is not None:
+            members.pop(conn.id, None)
+            if not members:
+                del self.rooms[conn.room_code]
+
+    def _drop(self, conn: Connection, code: int = 1013):
+        if self.unregister(conn.id) is None:
+            return
+        conn.queue = None
+        conn.backlog = 0
+        tasks = [asyncio.create_task(self._close(conn, code))]
+        if self.on_lost is not None:
+            tasks.append(asyncio.create_task(self.on_lost(conn)))
+        for task in tasks:
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    async def _close(self, conn: Connection, code: int = 1013):
+        try:
+            await asyncio.wait_for(conn.websocket.close(code=code), self.send_timeout)
+            return
+        except Exception:
+            pass
+        # Сокет не закрывается - перестаем его читать, чтобы не держать задачу и буферы
+        if conn.reader and not conn.reader.done() and conn.reader is not asyncio.current_task():
+            conn.reader.cancel()
+
+    async def _heartbeat_loop(self):
+        pings: Dict[str, object] = {}
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            now = time.monotonic()
+            for conn in list(self.connections.values()):
+                idle = now - conn.last_seen
+                if idle > self.heartbeat_timeout:
+                    self._evict(conn, "heartbeat", code=1001)
+                elif idle >= self.heartbeat_interval:
+                    ping = pings.get(conn.codec.name)
+                    if ping is None:
+                        ping = pings[conn.codec.name] = conn.codec.encode({"type": "ping"})
+                    self.send(conn, ping)
+
+    async def _writer(self, conn: Connection):
+        try:
+            while True:
+                message = await conn.queue.get()
+                if isinstance(message, bytes):
+                    send = conn.websocket.send_bytes(message)
+                else:
+                    send = conn.websocket.send_text(message)
+                await asyncio.wait_for(send, self.send_timeout)
+                conn.backlog -= len(message)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            self._evict(conn, "timeout")
+        except Exception as e:
+            SEND_FAILURES.inc("error")
+            logger.info("Ошибка отправки", extra={"conn": conn.id, "error": repr(e)})
+            self._drop(conn)
@@ -0,0 +1,79 @@
+"""
+Логирование без блокировки цикла событий: записи уходят в очередь,
+в поток вывода их пишет отдельный QueueListener.
+
+DECRYPTO_LOG_LEVEL - уровень (INFO по умолчанию),
+DECRYPTO_LOG_SAMPLE - доля DEBUG-записей, которые пишутся (1.0 - все).
+"""
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+from typing import Optional
+
+# Стандартные поля LogRecord - все остальное пришло через extra и выводится как key=value
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class StructuredFormatter(logging.Formatter):
+    """время уровень логгер сообщение key=value ..."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = "%s %s %s %s" % (
+            time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)),
+            record.levelname, record.name, record.getMessage(),
+        )
+        fields = [f"{key}={value}" for key, value in vars(record).items() if key not in _RESERVED]
+        if fields:
+            line += " " + " ".join(fields)
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class DebugSampler(logging.Filter):
+    """Пропускает только часть DEBUG-записей, остальные уровни - все"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging():
+    global _listener
+    if _listener is not None:
+        return
+
+    level = os.environ.get("DECRYPTO_LOG_LEVEL", "INFO").upper()
+    sample = float(os.environ.get("DECRYPTO_LOG_SAMPLE", "1.0"))
+
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(StructuredFormatter())
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, stream)
+    _listener.start()
+
+    handler = logging.handlers.QueueHandler(records)
+    if sample < 1.0:
+        handler.addFilter(DebugSampler(sample))
+    for name in ("main", "game", "server"):
+        logger = logging.getLogger(name)
+        logger.setLevel(level)
+        logger.addHandler(handler)
+        logger.propagate = False
+
+
+def stop_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
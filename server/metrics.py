@@ -0,0 +1,133 @@
+"""
+Метрики в текстовом формате Prometheus без внешних зависимостей.
+Счетчики обновляются прямо в обработчиках: это сложение в словаре, без I/O.
+"""
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Границы корзин гистограмм по умолчанию, секунды
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+def _label_str(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{_label_str(self.label_names, labels)} {value}")
+        return lines
+
+
+class Gauge:
+    """Значение снимается в момент запроса /metrics функцией source"""
+
+    def __init__(self, name: str, help: str, source: Optional[Callable[[], float]] = None):
+        self.name = name
+        self.help = help
+        self.source = source
+
+    def collect(self) -> List[str]:
+        value = self.source() if self.source else 0
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.buckets = tuple(buckets)
+        # метки -> [счетчики по корзинам (+Inf последней), сумма, количество]
+        self.series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def time(self, *labels: str) -> "_Timer":
+        return _Timer(self, labels)
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_label_str(self.label_names, labels, le)} {cumulative}")
+            label_str = _label_str(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_str} {total}")
+            lines.append(f"{self.name}_count{label_str} {count}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+ROOMS = registry.register(Gauge("decrypto_rooms", "Живые комнаты"))
+CONNECTIONS = registry.register(Gauge("decrypto_connections", "Открытые websocket-соединения"))
+SPECTATORS = registry.register(Gauge("decrypto_spectators", "Зрители трансляций"))
+ROOMS_REAPED = registry.register(Gauge("decrypto_rooms_reaped", "Комнат удалено сборщиком с запуска"))
+BYTES_RECLAIMED = registry.register(Gauge("decrypto_bytes_reclaimed", "Примерный объем освобожденных комнат, байт"))
+MESSAGES = registry.register(Counter("decrypto_messages_total", "Входящие сообщения по типу", ("type",)))
+COMMANDS_REJECTED = registry.register(Counter(
+    "decrypto_commands_rejected_total", "Отклоненные команды по причине", ("reason",)))
+HANDLER_SECONDS = registry.register(Histogram(
+    "decrypto_handler_seconds", "Время обработки входящего сообщения", ("type",)))
+BROADCAST_SECONDS = registry.register(Histogram(
+    "decrypto_broadcast_seconds", "Время рассылки состояния комнаты всем ее соединениям"))
+BROADCAST_FANOUT = registry.register(Histogram(
+    "decrypto_broadcast_fanout", "Получателей одной рассылки", buckets=(1, 2, 4, 8, 16, 32, 64, 128)))
+ACTOR_BATCH = registry.register(Histogram(
+    "decrypto_actor_batch", "Команд комнаты на одну рассылку", buckets=(1, 2, 3, 5, 8, 13, 21)))
+FRAMES_SENT = registry.register(Counter("decrypto_frames_sent_total", "Отправленные кадры по виду", ("kind",)))
+SEND_FAILURES = registry.register(Counter("decrypto_send_failures_total", "Сбои отправки по причине", ("reason",)))
@@ -0,0 +1,104 @@
+"""
+Боевой запуск: uvloop и httptools, если установлены, несколько воркеров
+на одном сокете и мягкая остановка. По сигналу остановки сервер перестает
+принимать подключения, приложение дренирует живые сокеты (обработчики
+on_drain), и только потом uvicorn закрывает оставшееся.
+"""
+import asyncio
+import fcntl
+import importlib.util
+import logging
+import os
+import secrets
+import tempfile
+from typing import Awaitable, Callable, List
+
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+
+logger = logging.getLogger(__name__)
+
+DrainHook = Callable[[float], Awaitable[None]]
+_drain_hooks: List[DrainHook] = []
+# Открытые файлы блокировок: держим до конца процесса
+_slot_locks = []
+
+
+def on_drain(hook: DrainHook) -> DrainHook:
+    """Регистрирует обработчик остановки; он получает время, отведенное на дренаж"""
+    if hook not in _drain_hooks:
+        _drain_hooks.append(hook)
+    return hook
+
+
+def claim_worker_slot(directory: str, count: int) -> int:
+    """
+    Номер воркера среди count запущенных одним супервизором: первый свободный
+    файл блокировки. Перезапущенный воркер займет номер упавшего.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for index in range(count):
+        lock = open(os.path.join(directory, f"worker-{index}.lock"), "w")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            continue
+        _slot_locks.append(lock)
+        return index
+    raise RuntimeError("Все номера воркеров заняты")
+
+
+class DrainingServer(uvicorn.Server):
+    """uvicorn.Server, который перед штатной остановкой дает приложению закрыть сокеты самому"""
+
+    def __init__(self, config: uvicorn.Config, drain_timeout: float):
+        super().__init__(config)
+        self.drain_timeout = drain_timeout
+
+    async def shutdown(self, sockets=None):
+        for server in self.servers:
+            server.close()
+        if _drain_hooks:
+            logger.info("Дренаж подключений", extra={"timeout": self.drain_timeout})
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*(hook(self.drain_timeout) for hook in _drain_hooks)),
+                    self.drain_timeout + 1,
+                )
+            except Exception:
+                logger.exception("Ошибка дренажа")
+        await super().shutdown(sockets)
+
+
+def _available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def run(app: str, host: str, port: int, workers: int, drain_timeout: float):
+    if workers > 1 and os.environ.get("DECRYPTO_STORAGE", "memory") == "memory":
+        raise SystemExit("Несколько воркеров требуют общего хранилища: DECRYPTO_STORAGE=sqlite:///decrypto.db")
+
+    # Воркеры наследуют окружение: общее зерно кодов и каталог номеров
+    os.environ.setdefault("DECRYPTO_CODE_SEED", str(secrets.randbits(63)))
+    os.environ["DECRYPTO_WORKER_COUNT"] = str(workers)
+    os.environ.setdefault("DECRYPTO_WORKER_LOCKS",
+                          os.path.join(tempfile.gettempdir(), f"decrypto-workers-{port}"))
+
+    config = uvicorn.Config(
+        app,
+        host=host,
+        port=port,
+        workers=workers,
+        loop="uvloop" if _available("uvloop") else "asyncio",
+        http="httptools" if _available("httptools") else "h11",
+        access_log=False,
+        proxy_headers=True,
+        timeout_graceful_shutdown=int(drain_timeout) + 5,
+    )
+    logger.info("Запуск", extra={"workers": workers, "loop": config.loop, "http": config.http})
+    server = DrainingServer(config, drain_timeout)
+    if workers > 1:
+        Multiprocess(config, target=server.run, sockets=[config.bind_socket()]).run()
+    else:
+        server.run()
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import sqlite3
+import time
+import uuid
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[str], Awaitable[None]]
+
+
+class LocalPubSub:
+    """Канал обновлений комнат внутри одного процесса"""
+
+    def __init__(self):
+        self.handler: Optional[Handler] = None
+
+    def subscribe(self, handler: Handler):
+        self.handler = handler
+
+    async def publish(self, room_code: str):
+        if self.handler:
+            await self.handler(room_code)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class SqlitePubSub(LocalPubSub):
+    """
+    Канал обновлений между воркерами через таблицу событий в общем SQLite-файле.
+    Свой воркер рассылает сразу, остальные подхватывают событие опросом.
+    """
+
+    def __init__(self, path: str, poll_interval: float = 0.05, retention: float = 60.0):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.worker_id = uuid.uuid4().hex
+        self.last_id = 0
+        self._task: Optional[asyncio.Task] = None
+        self.db = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS room_events ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, worker TEXT NOT NULL, "
+            "room_code TEXT NOT NULL, created REAL NOT NULL)"
+        )
+
+    async def publish(self, room_code: str):
+        self.db.execute(
+            "INSERT INTO room_events (worker, room_code, created) VALUES (?, ?, ?)",
+            (self.worker_id, room_code, time.time()),
+        )
+        await super().publish(room_code)
+
+    async def start(self):
+        row = self.db.execute("SELECT COALESCE(MAX(id), 0) FROM room_events").fetchone()
+        self.last_id = row[0]
+        self._task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _poll(self):
+        last_cleanup = time.time()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            rows = self.db.execute(
+                "SELECT id, worker, room_code FROM room_events WHERE id > ? ORDER BY id",
+                (self.last_id,),
+            ).fetchall()
+
+            # Несколько событий одной комнаты за тик - одна рассылка
+            pending = {}
+            for event_id, worker, room_code in rows:
+                self.last_id = event_id
+                if worker != self.worker_id:
+                    pending[room_code] = True
+            for room_code in pending:
+                try:
+                    await super().publish(room_code)
+                except Exception:
+                    logger.exception("Ошибка рассылки события", extra={"room": room_code})
+
+            if time.time() - last_cleanup > self.retention:
+                last_cleanup = time.time()
+                self.db.execute("DELETE FROM room_events WHERE created < ?", (last_cleanup - self.retention,))
+
+
+def create_pubsub(storage_url: str) -> LocalPubSub:
+    if storage_url.startswith("sqlite:///"):
+        return SqlitePubSub(storage_url[len("sqlite:///"):])
+    return LocalPubSub()
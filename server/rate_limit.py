@@ -0,0 +1,29 @@
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Ведро токенов: rate токенов в секунду, не больше burst в запасе.
+    notified - соединению уже ответили об ограничении, до следующей
+    пропущенной команды повторно не отвечаем.
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated", "notified")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.notified = False
+
+    def allow(self, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.notified = False
+            return True
+        return False
@@ -0,0 +1,32 @@
+import time
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+
+class ResponseCache:
+    """
+    Готовые тела ответов на ttl секунд: частые одинаковые запросы (список
+    комнат на главной) не собирают и не сериализуют ответ заново.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 1024, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries: Dict[Hashable, Tuple[float, bytes, str]] = {}
+
+    def get(self, key: Hashable) -> Optional[Tuple[bytes, str]]:
+        """(тело, etag) или None, если записи нет или она устарела"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, body, etag = entry
+        if self.clock() >= expires:
+            del self._entries[key]
+            return None
+        return body, etag
+
+    def put(self, key: Hashable, body: bytes, etag: str):
+        if len(self._entries) >= self.max_entries:
+            # Перебор ключей (курсоры, лимиты) - сбрасываем все разом
+            self._entries.clear()
+        self._entries[key] = (self.clock() + self.ttl, body, etag)
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Tuple
+
+from .metrics import ACTOR_BATCH
+
+logger = logging.getLogger(__name__)
+
+Apply = Callable[[str, str, list], Tuple[object, bool]]
+Publish = Callable[[str], Awaitable[None]]
+
+
+class RoomActor:
+    """
+    Задача-владелец комнаты: команды из очереди применяются строго по одной,
+    без блокировок. Изменения, пришедшие в течение window после первого,
+    уходят одной рассылкой.
+    """
+
+    def __init__(self, room_code: str, apply: Apply, publish: Publish,
+                 window: float, idle_timeout: float, on_exit: Callable[["RoomActor"], None]):
+        self.room_code = room_code
+        self.apply = apply
+        self.publish = publish
+        self.window = window
+        self.idle_timeout = idle_timeout
+        self.on_exit = on_exit
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run())
+        # Задача, отмененная до первого шага, не доходит до finally в _run
+        self.task.add_done_callback(self._release_pending)
+
+    def submit(self, command: str, args: list) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.inbox.put_nowait((command, args, future))
+        return future
+
+    def _handle(self, item) -> bool:
+        command, args, future = item
+        try:
+            result, changed = self.apply(self.room_code, command, args)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return False
+        if not future.done():
+            future.set_result(result)
+        return changed
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(self.inbox.get(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    # Между проверкой и выходом нет await - новая команда не потеряется
+                    if self.inbox.empty():
+                        return
+                    continue
+
+                changed = self._handle(item)
+                batch = 1
+                deadline = loop.time() + self.window
+                while True:
+                    if not self.inbox.empty():
+                        item = self.inbox.get_nowait()
+                    else:
+                        remaining = deadline - loop.time()
+                        if remaining <= 0:
+                            break
+                        try:
+                            item = await asyncio.wait_for(self.inbox.get(), remaining)
+                        except asyncio.TimeoutError:
+                            break
+                    changed = self._handle(item) or changed
+                    batch += 1
+
+                if changed:
+                    ACTOR_BATCH.observe(batch)
+                    try:
+                        await self.publish(self.room_code)
+                    except Exception:
+                        logger.exception("Ошибка рассылки комнаты", extra={"room": self.room_code})
+        finally:
+            self._release_pending()
+            self.on_exit(self)
+
+    def _release_pending(self, task=None):
+        """
+        Актор остановлен (комнату удалил сборщик, сервер выключается): ждущие
+        команды получают None, как для несуществующей комнаты, иначе обработчик
+        в цикле чтения сокета повиснет навсегда
+        """
+        while not self.inbox.empty():
+            _, _, future = self.inbox.get_nowait()
+            if not future.done():
+                future.set_result(None)
+
+
+class RoomActors:
+    """Акторы комнат этого процесса; актор создается при первой команде и засыпает без них"""
+
+    def __init__(self, apply: Apply, publish: Publish, exists: Callable[[str], bool],
+                 window: float = 0.005, idle_timeout: float = 60.0):
+        self.apply_command = apply
+        self.publish = publish
+        self.exists = exists
+        self.window = window
+        self.idle_timeout = idle_timeout
+        self.actors: Dict[str, RoomActor] = {}
+
+    async def submit(self, room_code: str, command: str, *args):
+        """Ставит команду в очередь комнаты и ждет ее результата; None - комнаты нет"""
+        room_code = room_code.upper()
+        actor = self.actors.get(room_code)
+        if actor is None:
+            # На несуществующие коды акторов не заводим
+            if not self.exists(room_code):
+                return None
+            actor = self.actors[room_code] = RoomActor(
+                room_code, self.apply_command, self.publish, self.window, self.idle_timeout, self._exited)
+        return await actor.submit(command, list(args))
+
+    def _exited(self, actor: RoomActor):
+        if self.actors.get(actor.room_code) is actor:
+            del self.actors[actor.room_code]
+
+    def drop(self, room_code: str):
+        actor = self.actors.pop(room_code, None)
+        if actor is not None:
+            actor.task.cancel()
+
+    async def stop(self):
+        actors = list(self.actors.values())
+        for actor in actors:
+            actor.task.cancel()
+        await asyncio.gather(*(actor.task for actor in actors), return_exceptions=True)
@@ -0,0 +1,171 @@
+"""
+Трансляция комнаты для большой аудитории зрителей, которые не входят в комнату.
+На версию состояния кодируется один кадр (JSON и он же в виде SSE-события),
+его получают все зрители: по websocket, Server-Sent Events или long-poll.
+Обновления прореживаются (не чаще rate в секунду) и могут идти с задержкой delay.
+"""
+import asyncio
+import json
+from typing import Dict, Optional, Set
+
+from game.models import Team
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _dumps(data: dict) -> str:
+    if orjson is not None:
+        return orjson.dumps(data).decode()
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+class SpectatorFrame:
+    """Кадр одной версии: тело для websocket и long-poll и готовое SSE-событие"""
+
+    __slots__ = ("version", "json", "sse")
+
+    def __init__(self, version: int, state: dict):
+        self.version = version
+        self.json = _dumps({"type": "spectator_state", "version": version, "state": state})
+        self.sse = f"id: {version}\nevent: state\ndata: {self.json}\n\n"
+
+
+class Subscriber:
+    """Зритель хранит только последний кадр: медленный просто пропускает промежуточные"""
+
+    __slots__ = ("frame", "event", "closed")
+
+    def __init__(self, frame: Optional[SpectatorFrame]):
+        self.frame = frame
+        self.closed = False
+        self.event = asyncio.Event()
+        if frame is not None:
+            self.event.set()
+
+    async def next(self, version: int, timeout: Optional[float] = None) -> Optional[SpectatorFrame]:
+        """Кадр новее version; None - трансляция закрыта или вышло время"""
+        while self.frame is None or self.frame.version <= version:
+            if self.closed:
+                return None
+            self.event.clear()
+            try:
+                await asyncio.wait_for(self.event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self.frame
+
+    def push(self, frame: Optional[SpectatorFrame]):
+        """None - трансляция закрыта"""
+        if frame is None:
+            self.closed = True
+        else:
+            self.frame = frame
+        self.event.set()
+
+
+class SpectatorFeed:
+    def __init__(self, room, rate: float, delay: float):
+        self.room_code = room.room_code
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.delay = delay
+        # Последний опубликованный кадр; с задержкой его нет, пока первый кадр не отлежится
+        self.frame: Optional[SpectatorFrame] = None
+        # Версия последнего собранного кадра, в том числе еще ждущего публикации
+        self.built_version = -1
+        self.subscribers: Set[Subscriber] = set()
+        self.closed = False
+        self._pending = None
+        self._dirty = asyncio.Event()
+        self._emit(room)
+        self._task = asyncio.create_task(self._pump())
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(self.frame)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def notify(self, room):
+        """Комната изменилась; кадр соберет насос не чаще раза в interval"""
+        self._pending = room
+        self._dirty.set()
+
+    def close(self):
+        self.closed = True
+        self._task.cancel()
+        for subscriber in self.subscribers:
+            subscriber.push(None)
+
+    async def _pump(self):
+        while True:
+            await self._dirty.wait()
+            self._dirty.clear()
+            room, self._pending = self._pending, None
+            if room is None or room.version <= self.built_version:
+                continue
+            self._emit(room)
+            # Все изменения за интервал уйдут одним кадром
+            await asyncio.sleep(self.interval)
+
+    def _emit(self, room):
+        """Кадр текущего состояния; с задержкой он станет виден только через delay"""
+        frame = SpectatorFrame(room.version, room.get_audience_state(Team.SPECTATOR))
+        self.built_version = frame.version
+        if self.delay > 0:
+            asyncio.get_running_loop().call_later(self.delay, self._publish, frame)
+        else:
+            self._publish(frame)
+
+    def _publish(self, frame: SpectatorFrame):
+        if self.closed or (self.frame is not None and frame.version <= self.frame.version):
+            return
+        self.frame = frame
+        for subscriber in self.subscribers:
+            subscriber.push(frame)
+
+
+class SpectatorHub:
+    """
+    Трансляции по кодам комнат. Без зрителей трансляция живет еще linger секунд:
+    long-poll зрители отписываются после каждого ответа и тут же возвращаются.
+    """
+
+    def __init__(self, rate: float = 2.0, delay: float = 0.0, linger: float = 30.0):
+        self.rate = rate
+        self.delay = delay
+        self.linger = linger
+        self.feeds: Dict[str, SpectatorFeed] = {}
+
+    def feed(self, room) -> SpectatorFeed:
+        feed = self.feeds.get(room.room_code)
+        if feed is None:
+            feed = self.feeds[room.room_code] = SpectatorFeed(room, self.rate, self.delay)
+        return feed
+
+    def release(self, feed: SpectatorFeed, subscriber: Subscriber):
+        feed.unsubscribe(subscriber)
+        if not feed.subscribers:
+            asyncio.get_running_loop().call_later(self.linger, self._close_idle, feed)
+
+    def _close_idle(self, feed: SpectatorFeed):
+        if not feed.subscribers and self.feeds.get(feed.room_code) is feed:
+            del self.feeds[feed.room_code]
+            feed.close()
+
+    def notify(self, room):
+        feed = self.feeds.get(room.room_code)
+        if feed is not None:
+            feed.notify(room)
+
+    def drop(self, room_code: str):
+        feed = self.feeds.pop(room_code, None)
+        if feed is not None:
+            feed.close()
+
+    def viewer_count(self) -> int:
+        return sum(len(feed.subscribers) for feed in self.feeds.values())
@@ -0,0 +1,72 @@
+from typing import Optional
+
+# Списки, которые только дописываются, и счетчики их записей за все время
+SEQUENCED = {'message_log': 'message_seq', 'history': 'history_seq'}
+# Словари записей по id: сравниваются по записям и полям, а не целиком
+KEYED = ('players',)
+
+
+def diff_entries(old: dict, new: dict) -> Optional[dict]:
+    """
+    Патч словаря записей по id: в 'set' - новые записи целиком и изменившиеся
+    поля остальных, в 'unset' - id удаленных. None, если ничего не поменялось.
+    """
+    changed = {}
+    for entry_id, entry in new.items():
+        before = old.get(entry_id)
+        if before is None:
+            changed[entry_id] = entry
+            continue
+        fields = {field: value for field, value in entry.items() if before.get(field) != value}
+        if fields:
+            changed[entry_id] = fields
+    removed = [entry_id for entry_id in old if entry_id not in new]
+    if not changed and not removed:
+        return None
+
+    patch = {'set': changed}
+    if removed:
+        patch['unset'] = removed
+    return patch
+
+
+def diff_state(old: dict, new: dict) -> Optional[dict]:
+    """
+    Считает патч между двумя состояниями игрока.
+    В 'set' попадают изменившиеся поля целиком, в 'append' - новые записи
+    лога и истории раундов (списки хранят лишь хвост, новые записи считаются
+    по счетчику). Словари из KEYED идут отдельным ключом патча с diff_entries:
+    смена статуса одного игрока - одно поле, а не весь список игроков.
+    Возвращает None, если ничего не поменялось.
+    """
+    changed = {}
+    appended = {}
+    keyed = {}
+
+    for key, value in new.items():
+        seq_key = SEQUENCED.get(key)
+        if seq_key is not None:
+            # Счетчик уменьшается только при сбросе (история - при новой партии)
+            added = new.get(seq_key, 0) - old.get(seq_key, 0)
+            if added == 0:
+                continue
+            if 0 < added <= len(value):
+                appended[key] = value[-added:]
+            else:
+                changed[key] = value
+        elif key in KEYED and isinstance(old.get(key), dict):
+            entries = diff_entries(old[key], value)
+            if entries is not None:
+                keyed[key] = entries
+        elif key not in old or old[key] != value:
+            changed[key] = value
+
+    removed = [key for key in old if key not in new]
+    if not changed and not appended and not keyed and not removed:
+        return None
+
+    patch = {'set': changed, 'append': appended}
+    if removed:
+        patch['unset'] = removed
+    patch.update(keyed)
+    return patch
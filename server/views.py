@@ -0,0 +1,164 @@
+from collections import deque
+from typing import Dict, List, Optional
+
+from game.models import Team
+from game.profiling import profiler
+from .metrics import FRAMES_SENT
+from .state_delta import diff_state
+
+EMPTY_PATCH = {'set': {}, 'append': {}}
+# Сколько последних патчей аудитории хранить для переподключившихся клиентов
+PATCH_HISTORY = 64
+
+
+class AudienceView:
+    """Представление комнаты для одной аудитории на одну версию"""
+
+    __slots__ = ("version", "state", "base_version", "patch", "history", "_encoded")
+
+    def __init__(self):
+        self.version = -1
+        self.state: Optional[dict] = None
+        # Патч от предыдущей разосланной версии к текущей
+        self.base_version: Optional[int] = None
+        self.patch: Optional[dict] = None
+        # Кольцевой буфер (base_version, version, patch) разосланных версий
+        self.history = deque(maxlen=PATCH_HISTORY)
+        # Закодированные снимок и патч по кодекам
+        self._encoded: Dict[tuple, object] = {}
+
+    def update(self, room, audience: Team):
+        if profiler.active and profiler.wants("audience_state"):
+            state = profiler.call("audience_state", room.get_audience_state, audience)
+        else:
+            state = room.get_audience_state(audience)
+        if self.state is not None:
+            self.patch = diff_state(self.state, state) or EMPTY_PATCH
+            self.base_version = self.version
+            self.history.append((self.base_version, room.version, self.patch))
+        self.state = state
+        self.version = room.version
+        self._encoded = {}
+
+    def patches_since(self, version: int) -> Optional[List[tuple]]:
+        """Цепочка патчей от version до текущей версии или None, если она уже вытеснена"""
+        if version == self.version:
+            return []
+        for i, (base_version, _, _) in enumerate(self.history):
+            if base_version == version:
+                return list(self.history)[i:]
+        return None
+
+    def encoded(self, kind: str, codec):
+        # Кодируем лениво: снимок нужен только новым и отставшим клиентам
+        key = (kind, codec.name)
+        data = self._encoded.get(key)
+        if data is None:
+            data = self._encoded[key] = codec.encode(self.state if kind == 'snapshot' else self.patch)
+        return data
+
+
+class RoomViews:
+    """
+    Кэш представлений комнаты по аудиториям (красные, синие, наблюдатели).
+    Сериализация делается один раз на аудиторию, версию и кодек,
+    на каждого игрока добавляются только персональные поля.
+    """
+
+    def __init__(self):
+        self.audiences: Dict[Team, AudienceView] = {}
+
+    def get(self, room, audience: Team) -> AudienceView:
+        view = self.audiences.get(audience)
+        if view is None:
+            view = self.audiences[audience] = AudienceView()
+        if view.version != room.version:
+            view.update(room, audience)
+        return view
+
+    def frame_for(self, conn, room):
+        """Кадр для подключения: патч, если клиент на предыдущей версии, иначе снимок"""
+        codec = conn.codec
+        audience = room.get_audience(conn.player_id)
+        view = self.get(room, audience)
+        me = room.get_player_fields(conn.player_id)
+
+        if conn.audience == audience:
+            if conn.version == view.version:
+                if me == conn.me:
+                    return None
+                patch = codec.encode(EMPTY_PATCH)
+                base_version = view.version
+            elif conn.version == view.base_version:
+                patch = view.encoded('patch', codec)
+                base_version = view.base_version
+            else:
+                patch = None
+            if patch is not None:
+                FRAMES_SENT.inc("patch")
+                return self._remember(conn, audience, view, me, codec.frame(
+                    ("type", codec.encode("state_patch")),
+                    ("base_version", codec.encode(base_version)),
+                    ("version", codec.encode(view.version)),
+                    ("patch", patch),
+                    ("me", codec.encode(me)),
+                ))
+
+        FRAMES_SENT.inc("snapshot")
+        return self._remember(conn, audience, view, me, codec.frame(
+            ("type", codec.encode("state_update")),
+            ("version", codec.encode(view.version)),
+            ("state", view.encoded('snapshot', codec)),
+            ("me", codec.encode(me)),
+            ("your_player_id", codec.encode(conn.player_id)),
+        ))
+
+    def replay(self, conn, room, since_version: Optional[int]) -> list:
+        """
+        Кадры для вернувшегося клиента: пропущенные патчи из буфера, если его
+        версия там еще есть, иначе полный снимок.
+        """
+        codec = conn.codec
+        audience = room.get_audience(conn.player_id)
+        view = self.get(room, audience)
+        me = room.get_player_fields(conn.player_id)
+        chain = view.patches_since(since_version) if since_version is not None else None
+        if chain is None:
+            conn.audience = None
+            return [self.frame_for(conn, room)]
+
+        # Пустой патч на текущей версии просто обновит персональные поля
+        chain = chain or [(view.version, view.version, EMPTY_PATCH)]
+        frames = [codec.frame(
+            ("type", codec.encode("state_patch")),
+            ("base_version", codec.encode(base_version)),
+            ("version", codec.encode(version)),
+            ("patch", codec.encode(patch)),
+            ("me", codec.encode(me)),
+        ) for base_version, version, patch in chain]
+        FRAMES_SENT.inc("patch", amount=len(frames))
+        self._remember(conn, audience, view, me, None)
+        return frames
+
+    @staticmethod
+    def _remember(conn, audience, view, me, data):
+        conn.audience = audience
+        conn.version = view.version
+        conn.me = me
+        return data
+
+
+class ViewCache:
+    """Представления всех комнат по коду"""
+
+    def __init__(self):
+        self.rooms: Dict[str, RoomViews] = {}
+
+    def for_room(self, room_code: str) -> RoomViews:
+        views = self.rooms.get(room_code)
+        if views is None:
+            views = self.rooms[room_code] = RoomViews()
+        return views
+
+    def drop(self, room_code: str):
+        self.rooms.pop(room_code, None)
@@ -4,8 +4,34 @@ let playerId = null;
 let roomCode = null;
 let myNickname = null;
 let gameState = null;
+let stateVersion = null;
 let myTeam = null;
 
+// История раундов в порядке игры: [команда, раунд команды, 4 слова по цифрам кода]
+const HISTORY_PAGE = 50;
+let historyRows = [];
+let renderedHistory = -1;
+let renderedHistoryTeam = null;
+// Каталог открытых комнат на вкладке входа обновляется раз в несколько секунд
+const DIRECTORY_REFRESH = 5000;
+let directoryTimer = null;
+
+// Токен переподключения живет до закрытия вкладки
+const SESSION_KEY = 'decrypto_session';
+const RECONNECT_MIN_DELAY = 500;
+const RECONNECT_MAX_DELAY = 10000;
+let sessionToken = sessionStorage.getItem(SESSION_KEY);
+let reconnectDelay = RECONNECT_MIN_DELAY;
+let leaving = false;
+
+// Лог на сервере ограничен последними 50 сообщениями
+const MESSAGE_LOG_LIMIT = 50;
+
+// Кодировки по предпочтению: сервер выберет первую, которую поддерживает
+const WS_SUBPROTOCOLS = typeof MsgPack !== 'undefined'
+    ? ['decrypto.msgpack', 'decrypto.json']
+    : ['decrypto.json'];
+
 // DOM элементы
 let elements = {};
 
@@ -14,6 +40,9 @@ document.addEventListener('DOMContentLoaded', () => {
     console.log('DOM загружен');
     initElements();
     initEventListeners();
+    if (sessionToken) {
+        resumeSession();
+    }
 });
 
 function initElements() {
@@ -34,6 +63,10 @@ function initElements() {
     elements.joinRoomCode = document.getElementById('join-room-code');
     elements.joinNickname = document.getElementById('join-nickname');
     elements.loginError = document.getElementById('login-error');
+    elements.createPack = document.getElementById('create-pack');
+    elements.createPublic = document.getElementById('create-public');
+    elements.publicRoomsList = document.getElementById('public-rooms-list');
+    elements.publicRoomsEmpty = document.getElementById('public-rooms-empty');
 
     // Кнопки
     elements.createRoomBtn = document.getElementById('create-room-btn');
@@ -120,13 +153,24 @@ function initEventListeners() {
             if (btn.dataset.tab === 'create') {
                 elements.createTab.classList.add('active');
                 elements.joinTab.classList.remove('active');
+                stopRoomDirectory();
             } else {
                 elements.createTab.classList.remove('active');
                 elements.joinTab.classList.add('active');
+                startRoomDirectory();
             }
         });
     });
 
+    // Выбор комнаты из каталога подставляет ее код
+    elements.publicRoomsList.addEventListener('click', (e) => {
+        const item = e.target.closest('.public-room-item');
+        if (item) {
+            elements.joinRoomCode.value = item.dataset.code;
+            elements.joinNickname.focus();
+        }
+    });
+
     // Создание комнаты
     elements.createRoomBtn.addEventListener('click', () => {
         const nickname = elements.createNickname.value.trim();
@@ -165,6 +209,9 @@ function initEventListeners() {
 
     // Выход из комнаты
     elements.leaveRoomBtn.addEventListener('click', () => {
+        leaving = true;
+        sendMessage({ type: 'leave_room' });
+        clearSession();
         if (socket) {
             socket.close();
         }
@@ -268,66 +315,90 @@ function sendRoundResult(result) {
 }
 
 // WebSocket соединение
-function connectAndCreate() {
+function openSocket(onOpen) {
     const wsProtocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
     const wsUrl = `${wsProtocol}//${window.location.host}/ws`;
 
     console.log('Подключение к:', wsUrl);
 
-    socket = new WebSocket(wsUrl);
+    const ws = new WebSocket(wsUrl, WS_SUBPROTOCOLS);
+    ws.binaryType = 'arraybuffer';
+    socket = ws;
 
-    socket.onopen = () => {
-        console.log('WebSocket открыт, отправка create_room');
-        sendMessage({
-            type: 'create_room'
-        });
-    };
+    ws.onopen = onOpen;
 
-    socket.onmessage = (event) => {
-        console.log('Получено сообщение:', event.data);
-        const data = JSON.parse(event.data);
-        handleMessage(data);
+    ws.onmessage = (event) => {
+        handleMessage(decodeMessage(event));
     };
 
-    socket.onclose = () => {
+    ws.onclose = () => {
         console.log('Соединение закрыто');
+        // Обрыв текущего сокета - возвращаемся на свое место по токену
+        if (ws === socket && sessionToken && !leaving) {
+            scheduleReconnect();
+        }
     };
 
-    socket.onerror = (error) => {
+    ws.onerror = (error) => {
         console.error('WebSocket ошибка:', error);
     };
 }
 
-function connectAndJoin() {
-    const wsProtocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-    const wsUrl = `${wsProtocol}//${window.location.host}/ws`;
-
-    console.log('Подключение к:', wsUrl);
-
-    socket = new WebSocket(wsUrl);
+function connectAndCreate() {
+    openSocket(() => {
+        console.log('WebSocket открыт, отправка create_room');
+        const message = { type: 'create_room' };
+        // Выбор набора слов показывается, только если наборов несколько
+        if (elements.createPack) {
+            message.pack = elements.createPack.value;
+        }
+        if (elements.createPublic.checked) {
+            message.public = true;
+        }
+        sendMessage(message);
+    });
+}
 
-    socket.onopen = () => {
+function connectAndJoin() {
+    openSocket(() => {
         console.log('WebSocket открыт, отправка join_room');
         sendMessage({
             type: 'join_room',
             room_code: roomCode,
             nickname: myNickname
         });
-    };
+    });
+}
 
-    socket.onmessage = (event) => {
-        console.log('Получено сообщение:', event.data);
-        const data = JSON.parse(event.data);
-        handleMessage(data);
-    };
+function resumeSession() {
+    openSocket(() => {
+        console.log('WebSocket открыт, возвращаемся в комнату');
+        // Сервер пришлет только то, что мы пропустили после stateVersion
+        sendMessage({
+            type: 'resume',
+            token: sessionToken,
+            version: stateVersion
+        });
+    });
+}
 
-    socket.onclose = () => {
-        console.log('Соединение закрыто');
-    };
+function scheduleReconnect() {
+    console.log(`Переподключение через ${reconnectDelay} мс`);
+    setTimeout(resumeSession, reconnectDelay);
+    reconnectDelay = Math.min(reconnectDelay * 2, RECONNECT_MAX_DELAY);
+}
 
-    socket.onerror = (error) => {
-        console.error('WebSocket ошибка:', error);
-    };
+function clearSession() {
+    sessionToken = null;
+    sessionStorage.removeItem(SESSION_KEY);
+}
+
+// Текстовые кадры - JSON, бинарные - MessagePack
+function decodeMessage(event) {
+    if (typeof event.data === 'string') {
+        return JSON.parse(event.data);
+    }
+    return MsgPack.decode(event.data);
 }
 
 function sendMessage(message) {
@@ -355,170 +426,375 @@ function handleMessage(data) {
             console.log('Присоединился к комнате, playerId:', data.player_id);
             playerId = data.player_id;
             roomCode = data.room_code;
+            sessionToken = data.token;
+            sessionStorage.setItem(SESSION_KEY, sessionToken);
+            leaving = false;
             showLobbyScreen();
             break;
 
+        case 'resumed':
+            console.log('Вернулись в комнату, playerId:', data.player_id);
+            playerId = data.player_id;
+            roomCode = data.room_code;
+            myNickname = data.nickname;
+            reconnectDelay = RECONNECT_MIN_DELAY;
+            if (!gameState) {
+                showLobbyScreen();
+            }
+            break;
+
+        case 'ping':
+            // Сервер проверяет, что клиент жив
+            sendMessage({ type: 'pong' });
+            break;
+
         case 'state_update':
             console.log('Обновление состояния');
-            gameState = data.state;
+            gameState = Object.assign(data.state, data.me);
+            stateVersion = data.version;
+            resetHistory(gameState.history, gameState.history_seq);
             if (data.your_player_id === playerId) {
-                if (gameState.red_team_ids && gameState.red_team_ids.includes(playerId)) {
-                    myTeam = 'red';
-                } else if (gameState.blue_team_ids && gameState.blue_team_ids.includes(playerId)) {
-                    myTeam = 'blue';
-                } else {
-                    myTeam = 'spectator';
-                }
-                console.log('Моя команда:', myTeam);
+                updateMyTeam();
+            }
+            resetRender();
+            break;
+
+        case 'state_patch':
+            if (!gameState || stateVersion !== data.base_version) {
+                // Пропустили версию - просим полный снимок
+                console.log('Версия не совпала, запрашиваем снимок');
+                sendMessage({ type: 'resync' });
+                break;
+            }
+            const changed = patchKeys(data.patch, data.me);
+            applyStatePatch(data.patch);
+            Object.assign(gameState, data.me);
+            stateVersion = data.version;
+            updateMyTeam();
+            scheduleRender(changed);
+            break;
+
+        case 'history':
+            // Страница старой истории; после сброса партии ответ уже не нужен
+            if (!gameState || data.history_seq < historyRows.length) break;
+            let filled = false;
+            data.rows.forEach((row, i) => {
+                if (historyRows[data.offset + i] === undefined) filled = true;
+                historyRows[data.offset + i] = row;
+            });
+            requestMissingHistory();
+            if (filled) {
+                // Догруженные раунды встают перед уже нарисованными - колонки перестраиваем
+                renderedHistory = -1;
+                scheduleRender([]);
             }
-            updateUI();
             break;
 
         case 'error':
             console.error('Ошибка от сервера:', data.message);
+            if (data.code === 'resume_failed') {
+                clearSession();
+                gameState = null;
+                stateVersion = null;
+                showLoginScreen();
+            }
             showError(data.message);
             break;
     }
 }
 
-// Обновление интерфейса
-function updateUI() {
-    if (!gameState) return;
+function applyStatePatch(patch) {
+    Object.assign(gameState, patch.set || {});
+
+    (patch.unset || []).forEach(key => delete gameState[key]);
+
+    // Игроки приходят по id: новые целиком, у остальных - только изменившиеся поля
+    if (patch.players) {
+        const players = gameState.players = gameState.players || {};
+        Object.entries(patch.players.set || {}).forEach(([id, fields]) => {
+            players[id] = Object.assign(players[id] || {}, fields);
+        });
+        (patch.players.unset || []).forEach(id => delete players[id]);
+    }
+
+    const appended = patch.append || {};
+    if (appended.message_log) {
+        gameState.message_log = (gameState.message_log || [])
+            .concat(appended.message_log)
+            .slice(-MESSAGE_LOG_LIMIT);
+    }
+    if (patch.set && patch.set.history) {
+        // История сброшена новой партией
+        resetHistory(patch.set.history, gameState.history_seq);
+    } else if (appended.history) {
+        historyRows = historyRows.concat(appended.history);
+    }
+}
 
-    if (gameState.phase === 'waiting' || gameState.phase === 'setup') {
-        updateLobbyUI();
+function updateMyTeam() {
+    if (gameState.red_team_ids && gameState.red_team_ids.includes(playerId)) {
+        myTeam = 'red';
+    } else if (gameState.blue_team_ids && gameState.blue_team_ids.includes(playerId)) {
+        myTeam = 'blue';
     } else {
-        updateGameUI();
+        myTeam = 'spectator';
     }
-    
-    updateHintsHistory();
+    console.log('Моя команда:', myTeam);
 }
 
-function updateLobbyUI() {
-    elements.redTeamList.innerHTML = '';
-    elements.blueTeamList.innerHTML = '';
-    elements.spectatorsList.innerHTML = '';
+// Обновление интерфейса
+// Отрисовка. Изменения состояния помечают затронутые поля, а DOM обновляется
+// не чаще раза в кадр и только в тех узлах, чьи данные поменялись
+let renderScheduled = false;
+let dirtyAll = true;
+const dirtyKeys = new Set();
+let renderedScreen = null;
+let renderedMyTeam = null;
+let renderedMessageSeq = null;
+// Узлы игроков по id: переиспользуются при перестановках и сменах команды
+const playerNodes = new Map();
+
+function scheduleRender(keys) {
+    if (keys) {
+        keys.forEach(key => dirtyKeys.add(key));
+    } else {
+        dirtyAll = true;
+    }
+    if (!renderScheduled) {
+        renderScheduled = true;
+        requestAnimationFrame(flushRender);
+    }
+}
 
-    elements.roomCodeDisplay.textContent = roomCode;
+function resetRender() {
+    // Новый снимок: перерисовываем все, лог - целиком
+    renderedMessageSeq = null;
+    scheduleRender();
+}
 
-    if (gameState.players) {
-        Object.values(gameState.players).forEach(player => {
-            const playerEl = document.createElement('div');
-            playerEl.className = 'player-item';
+function isDirty(...keys) {
+    return dirtyAll || keys.some(key => dirtyKeys.has(key));
+}
 
-            let teamList;
-            if (player.team === 'red') {
-                teamList = elements.redTeamList;
-            } else if (player.team === 'blue') {
-                teamList = elements.blueTeamList;
-            } else {
-                teamList = elements.spectatorsList;
-            }
+function patchKeys(patch, me) {
+    const keys = Object.keys(patch.set || {})
+        .concat(patch.unset || [], Object.keys(patch.append || {}));
+    if (patch.players) keys.push('players');
+    Object.keys(me || {}).forEach(key => {
+        if (JSON.stringify(gameState[key]) !== JSON.stringify(me[key])) keys.push(key);
+    });
+    return keys;
+}
 
-            playerEl.innerHTML = `
-                <span>${player.nickname}</span>
-                ${player.is_encoder ? '<span class="encoder-badge">🎤</span>' : ''}
-            `;
+function setText(element, text) {
+    text = String(text);
+    if (element.textContent !== text) element.textContent = text;
+}
 
-            teamList.appendChild(playerEl);
-        });
+function setDisplay(element, display) {
+    if (element.style.display !== display) element.style.display = display;
+}
+
+function renderTextList(container, items, tag, className) {
+    // Узлы списка переиспользуются, меняется только текст
+    while (container.children.length > items.length) {
+        container.lastElementChild.remove();
+    }
+    items.forEach((item, index) => {
+        let node = container.children[index];
+        if (!node) {
+            node = document.createElement(tag);
+            container.appendChild(node);
+        }
+        if (node.className !== className) node.className = className;
+        setText(node, item);
+    });
+}
+
+function flushRender() {
+    renderScheduled = false;
+    if (!gameState) return;
+
+    const screen = (gameState.phase === 'waiting' || gameState.phase === 'setup') ? 'lobby' : 'game';
+    if (screen !== renderedScreen) {
+        // Секции другого экрана не обновлялись - рисуем его целиком
+        renderedScreen = screen;
+        dirtyAll = true;
+    }
+    if (myTeam !== renderedMyTeam) {
+        renderedMyTeam = myTeam;
+        dirtyKeys.add('my_team');
+    }
+
+    if (screen === 'lobby') {
+        renderLobby();
+    } else {
+        renderGame();
     }
+    renderHistory();
 
-    const redCount = gameState.red_team_ids ? gameState.red_team_ids.length : 0;
-    const blueCount = gameState.blue_team_ids ? gameState.blue_team_ids.length : 0;
-    elements.startGameBtn.disabled = !(redCount >= 2 && blueCount >= 2);
+    dirtyAll = false;
+    dirtyKeys.clear();
 }
 
-function updateGameUI() {
-    showGameScreen();
+function renderLobby() {
+    setText(elements.roomCodeDisplay, roomCode);
 
-    elements.gameRoomCode.textContent = roomCode;
+    if (isDirty('players', 'red_team_ids', 'blue_team_ids', 'spectators_ids')) {
+        renderPlayers();
+        const redCount = gameState.red_team_ids ? gameState.red_team_ids.length : 0;
+        const blueCount = gameState.blue_team_ids ? gameState.blue_team_ids.length : 0;
+        elements.startGameBtn.disabled = !(redCount >= 2 && blueCount >= 2);
+    }
+}
+
+function renderPlayers() {
+    const players = gameState.players || {};
+    const lists = [
+        [elements.redTeamList, gameState.red_team_ids || []],
+        [elements.blueTeamList, gameState.blue_team_ids || []],
+        [elements.spectatorsList, gameState.spectators_ids || []],
+    ];
+    const seen = new Set();
+
+    lists.forEach(([list, ids]) => {
+        let position = 0;
+        ids.forEach(id => {
+            const player = players[id];
+            if (!player) return;
+            seen.add(id);
+            const node = playerNode(id, player);
+            // Узел переносится, только если он не на своем месте
+            if (list.children[position] !== node) {
+                list.insertBefore(node, list.children[position] || null);
+            }
+            position++;
+        });
+    });
+
+    playerNodes.forEach((entry, id) => {
+        if (!seen.has(id)) {
+            entry.node.remove();
+            playerNodes.delete(id);
+        }
+    });
+}
 
-    elements.redIntercepts.textContent = gameState.red_intercepts || 0;
-    elements.blueIntercepts.textContent = gameState.blue_intercepts || 0;
-    elements.redMistakes.textContent = gameState.red_mistakes || 0;
-    elements.blueMistakes.textContent = gameState.blue_mistakes || 0;
+function playerNode(id, player) {
+    let entry = playerNodes.get(id);
+    if (!entry) {
+        const node = document.createElement('div');
+        node.className = 'player-item';
+        const name = document.createElement('span');
+        const badge = document.createElement('span');
+        badge.className = 'encoder-badge';
+        badge.textContent = '🎤';
+        node.append(name, badge);
+        entry = { node, name, badge };
+        playerNodes.set(id, entry);
+    }
+    setText(entry.name, player.nickname);
+    setDisplay(entry.badge, player.is_encoder ? '' : 'none');
+    entry.node.classList.toggle('disconnected', player.is_connected === false);
+    return entry.node;
+}
+
+function renderGame() {
+    if (dirtyAll) {
+        showGameScreen();
+        setText(elements.gameRoomCode, roomCode);
+    }
+
+    setText(elements.redIntercepts, gameState.red_intercepts || 0);
+    setText(elements.blueIntercepts, gameState.blue_intercepts || 0);
+    setText(elements.redMistakes, gameState.red_mistakes || 0);
+    setText(elements.blueMistakes, gameState.blue_mistakes || 0);
 
     if (gameState.current_encoder_team === 'red') {
-        elements.currentRound.textContent = `${gameState.red_round || 0} (🔴 Красные)`;
+        setText(elements.currentRound, `${gameState.red_round || 0} (🔴 Красные)`);
     } else if (gameState.current_encoder_team === 'blue') {
-        elements.currentRound.textContent = `${gameState.blue_round || 0} (🔵 Синие)`;
+        setText(elements.currentRound, `${gameState.blue_round || 0} (🔵 Синие)`);
     } else {
-        elements.currentRound.textContent = `${gameState.current_round || 0}`;
+        setText(elements.currentRound, `${gameState.current_round || 0}`);
     }
 
-    updateSecretWords();
-    updateGamePhase();
-    updateMessageLog();
+    if (isDirty('secret_words', 'my_team')) {
+        renderSecretWords();
+    }
+    if (isDirty('phase', 'current_clue', 'current_encoder_id', 'current_code')) {
+        renderGamePhase();
+    }
+    if (isDirty('message_log', 'message_seq')) {
+        renderMessageLog();
+    }
 }
 
-function updateSecretWords() {
-    elements.redWords.style.display = 'none';
-    elements.blueWords.style.display = 'none';
-    elements.spectatorNote.style.display = 'none';
+function renderSecretWords() {
+    const words = gameState.secret_words;
+    const showRed = myTeam === 'red' && words;
+    const showBlue = myTeam === 'blue' && words;
 
-    if (myTeam === 'red' && gameState.secret_words) {
-        elements.redWords.style.display = 'grid';
-        elements.redWords.innerHTML = gameState.secret_words.team_red
-            .map(word => `<div class="word-item">${word}</div>`)
-            .join('');
-    } else if (myTeam === 'blue' && gameState.secret_words) {
-        elements.blueWords.style.display = 'grid';
-        elements.blueWords.innerHTML = gameState.secret_words.team_blue
-            .map(word => `<div class="word-item">${word}</div>`)
-            .join('');
-    } else {
-        elements.spectatorNote.style.display = 'block';
+    setDisplay(elements.redWords, showRed ? 'grid' : 'none');
+    setDisplay(elements.blueWords, showBlue ? 'grid' : 'none');
+    setDisplay(elements.spectatorNote, showRed || showBlue ? 'none' : 'block');
+
+    if (showRed) {
+        renderTextList(elements.redWords, words.team_red, 'div', 'word-item');
+    } else if (showBlue) {
+        renderTextList(elements.blueWords, words.team_blue, 'div', 'word-item');
     }
 }
 
-function updateGamePhase() {
+function renderGamePhase() {
     const phaseText = {
         'encoding': '🔐 Шифрование',
         'guessing': '🤔 Ожидание результатов',
         'game_over': '🏆 Игра окончена'
     };
 
-    elements.phaseIndicator.textContent = phaseText[gameState.phase] || gameState.phase;
+    setText(elements.phaseIndicator, phaseText[gameState.phase] || gameState.phase);
 
     if (gameState.current_clue) {
-        elements.cluesDisplay.innerHTML = gameState.current_clue.words
-            .map(word => `<span class="clue-word">${word}</span>`)
-            .join('');
-        elements.cluesBox.style.display = 'block';
+        renderTextList(elements.cluesDisplay, gameState.current_clue.words, 'span', 'clue-word');
+        setDisplay(elements.cluesBox, 'block');
     } else {
-        elements.cluesDisplay.innerHTML = `
-            <span class="clue-word">---</span>
-            <span class="clue-word">---</span>
-            <span class="clue-word">---</span>
-        `;
+        renderTextList(elements.cluesDisplay, ['---', '---', '---'], 'span', 'clue-word');
     }
 
-    elements.encoderPanel.style.display = 'none';
-    elements.resolvePanel.style.display = 'none';
+    const isEncoder = gameState.current_encoder_id === playerId;
+    // Панель результатов видна ТОЛЬКО шифровальщику
+    setDisplay(elements.encoderPanel, isEncoder && gameState.phase === 'encoding' ? 'block' : 'none');
+    setDisplay(elements.resolvePanel, isEncoder && gameState.phase === 'guessing' ? 'block' : 'none');
+    if (isEncoder && gameState.phase === 'encoding') {
+        setText(elements.encoderCode, gameState.current_code ? gameState.current_code.join('-') : '???');
+    }
+}
 
-    if (gameState.phase === 'encoding') {
-        if (gameState.current_encoder_id === playerId) {
-            elements.encoderPanel.style.display = 'block';
-            elements.encoderCode.textContent = gameState.current_code ? gameState.current_code.join('-') : '???';
-        }
-    } else if (gameState.phase === 'guessing') {
-        // Показываем панель результатов ТОЛЬКО шифровальщику
-        if (gameState.current_encoder_id === playerId) {
-            console.log('Показываем панель результатов для шифровальщика');
-            elements.resolvePanel.style.display = 'block';
+function renderMessageLog() {
+    const log = gameState.message_log || [];
+    const seq = gameState.message_seq || 0;
+    const container = elements.messageLog;
+    const added = renderedMessageSeq === null ? -1 : seq - renderedMessageSeq;
+    if (added === 0) return;
+
+    if (added > 0 && added <= log.length) {
+        // Дописываем только новые сообщения
+        log.slice(-added).forEach(message => container.appendChild(logNode(message)));
+        while (container.children.length > MESSAGE_LOG_LIMIT) {
+            container.firstElementChild.remove();
         }
+    } else {
+        container.replaceChildren(...log.map(logNode));
     }
+    renderedMessageSeq = seq;
+    container.scrollTop = container.scrollHeight;
 }
 
-function updateMessageLog() {
-    if (!gameState.message_log) return;
-
-    elements.messageLog.innerHTML = gameState.message_log
-        .map(msg => `<div class="log-message">${msg}</div>`)
-        .join('');
-
-    elements.messageLog.scrollTop = elements.messageLog.scrollHeight;
+function logNode(message) {
+    const node = document.createElement('div');
+    node.className = 'log-message';
+    node.textContent = message;
+    return node;
 }
 
 function joinTeam(team) {
@@ -548,6 +824,44 @@ function showGameScreen() {
     elements.gameScreen.classList.add('active');
 }
 
+function startRoomDirectory() {
+    stopRoomDirectory();
+    loadRoomDirectory();
+    directoryTimer = setInterval(loadRoomDirectory, DIRECTORY_REFRESH);
+}
+
+function stopRoomDirectory() {
+    if (directoryTimer) {
+        clearInterval(directoryTimer);
+        directoryTimer = null;
+    }
+}
+
+async function loadRoomDirectory() {
+    // Каталог нужен только на экране входа
+    if (!elements.loginScreen.classList.contains('active')) {
+        stopRoomDirectory();
+        return;
+    }
+    try {
+        const response = await fetch('/rooms?filter=waiting&limit=20');
+        if (!response.ok) return;
+        renderRoomDirectory((await response.json()).rooms);
+    } catch (error) {
+        console.error('Ошибка загрузки каталога комнат:', error);
+    }
+}
+
+function renderRoomDirectory(rooms) {
+    renderTextList(elements.publicRoomsList, rooms.map(room =>
+        `${room.room_code} · ${room.players}/${room.capacity} · 🔴 ${room.red} 🔵 ${room.blue}`
+    ), 'button', 'public-room-item');
+    rooms.forEach((room, index) => {
+        elements.publicRoomsList.children[index].dataset.code = room.room_code;
+    });
+    setDisplay(elements.publicRoomsEmpty, rooms.length ? 'none' : '');
+}
+
 function showError(message) {
     elements.loginError.textContent = message;
     setTimeout(() => {
@@ -555,46 +869,53 @@ function showError(message) {
     }, 3000);
 }
 
-function updateHintsHistory() {
-    if (!gameState || !gameState.rounds_history) return;
+function resetHistory(rows, seq) {
+    // В состоянии только последние раунды - более ранние догружаем страницами
+    rows = rows || [];
+    historyRows = new Array(Math.max((seq || 0) - rows.length, 0)).concat(rows);
+    renderedHistory = -1;
+    requestMissingHistory();
+}
 
-    // Очищаем все колонки
+function requestMissingHistory() {
+    const first = historyRows.findIndex(row => row === undefined);
+    if (first >= 0) {
+        sendMessage({ type: 'get_history', offset: first, limit: HISTORY_PAGE });
+    }
+}
+
+function renderHistory() {
     const ownColumns = [elements.ownHintsCol1, elements.ownHintsCol2, elements.ownHintsCol3, elements.ownHintsCol4];
     const enemyColumns = [elements.enemyHintsCol1, elements.enemyHintsCol2, elements.enemyHintsCol3, elements.enemyHintsCol4];
 
-    ownColumns.forEach(col => col.innerHTML = '');
-    enemyColumns.forEach(col => col.innerHTML = '');
-
-    // Проходим по истории раундов
-    gameState.rounds_history.forEach(round => {
-        if (!round.completed || !round.clues || !round.code) return;
-
-        const isMyTeamRound = (myTeam === round.team);
-        const teamClass = isMyTeamRound ? 'own-team' : 'enemy-team';
+    // Колонки перестраиваются только после сброса истории или смены команды
+    if (renderedHistory < 0 || renderedHistoryTeam !== myTeam) {
+        ownColumns.forEach(col => col.innerHTML = '');
+        enemyColumns.forEach(col => col.innerHTML = '');
+        renderedHistory = 0;
+        renderedHistoryTeam = myTeam;
+    }
 
-        // Для каждого числа в коде (позиция 1,2,3)
-        round.code.forEach((digit, index) => {
-            const clueWord = round.clues[index];
-            const roundInfo = `Р${round.round_num}`;
+    // Дописываем новые раунды; на пропуске ждем догрузки страницы
+    while (renderedHistory < historyRows.length && historyRows[renderedHistory]) {
+        const [team, roundNum, ...words] = historyRows[renderedHistory];
+        const isMyTeamRound = (myTeam === team);
+        const columns = isMyTeamRound ? ownColumns : enemyColumns;
 
+        // Слово стоит в колонке своей цифры кода
+        words.forEach((word, index) => {
+            if (word == null) return;
             const hintElement = document.createElement('div');
-            hintElement.className = `history-hint-item ${teamClass}`;
-            hintElement.innerHTML = `<span class="round-number">${roundInfo}</span> <span class="hint-word">${clueWord}</span>`;
-
-            // Определяем, в какую колонку добавлять (digit от 1 до 4)
-            const columnIndex = digit - 1;
-
-            if (isMyTeamRound) {
-                // Подсказки своей команды (видны всем, но в своей вкладке)
-                if (columnIndex >= 0 && columnIndex < 4) {
-                    ownColumns[columnIndex].appendChild(hintElement.cloneNode(true));
-                }
-            } else {
-                // Подсказки чужой команды (вкладка "Чужая команда")
-                if (columnIndex >= 0 && columnIndex < 4) {
-                    enemyColumns[columnIndex].appendChild(hintElement.cloneNode(true));
-                }
-            }
+            hintElement.className = `history-hint-item ${isMyTeamRound ? 'own-team' : 'enemy-team'}`;
+            const roundElement = document.createElement('span');
+            roundElement.className = 'round-number';
+            roundElement.textContent = `Р${roundNum}`;
+            const wordElement = document.createElement('span');
+            wordElement.className = 'hint-word';
+            wordElement.textContent = word;
+            hintElement.append(roundElement, ' ', wordElement);
+            columns[index].appendChild(hintElement);
         });
-    });
-}
\ No newline at end of file
+        renderedHistory++;
+    }
+}